@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+
+"""Benchmark the throughput of the ``filename_parser`` and
+``filename_parser_batch`` functions.
+
+A list of filenames is generated with a realistic mix of stage 1/2,
+stage 3, time series, and guider filenames, with many repeated names
+(as when several monitors look at the same files), and each parser is
+timed on it.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This script is intended to be executed from the command line:
+
+    ::
+
+        python benchmark_filename_parser.py [-n 1000000]
+"""
+
+import argparse
+import random
+import time
+
+from jwql.utils.utils import filename_parser, filename_parser_batch
+
+TEMPLATES = ['jw{:05d}{:03d}001_02101_{:05d}_nrca1_uncal.fits',
+             'jw{:05d}{:03d}001_02101_{:05d}_nrcblong_rate.fits',
+             'jw{:05d}{:03d}001_02101_{:05d}_mirimage_cal.fits',
+             'jw{:05d}{:03d}001_02101_{:05d}_nrs1_rateints.fits',
+             'jw{:05d}{:03d}001_02101_{:05d}-seg001_nis_rate.fits',
+             'jw{:05d}-o{:03d}_t{:03d}_miri_f1130w_i2d.fits',
+             'jw{:05d}{:03d}001_gs-id_{}_image_cal.fits']
+
+
+def make_filenames(number_of_files, unique_fraction):
+    """Generate a list of JWST filenames
+
+    Parameters
+    ----------
+    number_of_files : int
+        The number of filenames to generate
+    unique_fraction : float
+        The fraction of the filenames that are distinct
+
+    Returns
+    -------
+    filenames : list
+        The generated filenames
+    """
+
+    random.seed(0)
+    number_unique = max(1, int(number_of_files * unique_fraction))
+    unique_filenames = []
+    for i in range(number_unique):
+        template = TEMPLATES[i % len(TEMPLATES)]
+        unique_filenames.append(template.format(i % 100000, (i // 100000) % 1000, i % 10))
+
+    filenames = [random.choice(unique_filenames) for _ in range(number_of_files)]
+
+    return filenames
+
+
+def parse_args():
+    """Parse command line arguments
+
+    Returns
+    -------
+    args : obj
+        The parsed command line arguments
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark the filename parser')
+    parser.add_argument('-n', '--number', type=int, default=1000000,
+                        help='Number of filenames to parse')
+    parser.add_argument('-u', '--unique-fraction', type=float, default=0.5,
+                        help='Fraction of the filenames that are distinct')
+    args = parser.parse_args()
+
+    return args
+
+
+def time_parser(name, parser, filenames):
+    """Time a parser on the given filenames and print its throughput
+
+    Parameters
+    ----------
+    name : str
+        Name of the parser, for display
+    parser : func
+        Function that parses all of ``filenames``
+    filenames : list
+        The filenames to parse
+    """
+
+    start = time.perf_counter()
+    parser(filenames)
+    elapsed = time.perf_counter() - start
+    print('{:<40}{:>10.2f} s{:>14,.0f} files/s'.format(name, elapsed, len(filenames) / elapsed))
+
+
+def per_file(filenames):
+    """Parse filenames one at a time with ``filename_parser``"""
+
+    for filename in filenames:
+        try:
+            filename_parser(filename)
+        except ValueError:
+            pass
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    filenames = make_filenames(args.number, args.unique_fraction)
+    print('Parsing {:,} filenames ({:.0%} distinct)'.format(len(filenames), args.unique_fraction))
+
+    time_parser('filename_parser (one at a time)', per_file, filenames)
+    time_parser('filename_parser_batch', filename_parser_batch, filenames)
@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+
+"""Benchmark the display limits calculation used by ``PreviewImage``.
+
+The previous sort-based calculation is compared with the
+selection-based ``clip_limits`` function, called one image at a time
+and on a whole cube of integrations at once, for a full-frame image
+and for a cube of many small time series integrations.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This script is intended to be executed from the command line:
+
+    ::
+
+        python benchmark_find_limits.py
+"""
+
+import time
+
+import numpy as np
+
+from jwql.utils.preview_image import clip_limits
+
+CLIP_PERCENT = 0.01
+
+
+def sort_limits(data, pixmap, clipperc):
+    """The previous, sort-based limits calculation"""
+
+    nelem = np.sum(pixmap)
+    numclip = int(clipperc * nelem)
+    sorted = np.sort(data[pixmap], axis=None)
+    minval = sorted[numclip]
+    maxval = sorted[-numclip - 1]
+    return (minval, maxval)
+
+
+def time_case(name, cube):
+    """Time the limits calculations on a cube of images and check that
+    they agree
+
+    Parameters
+    ----------
+    name : str
+        Description of the case, for display
+    cube : obj
+        3D ``numpy`` ``ndarray`` of images
+    """
+
+    pixmap = np.ones(cube.shape[1:], dtype=bool)
+    pixmap[:4, :] = False
+    pixmap[:, :4] = False
+
+    print('{} ({} x {} x {})'.format(name, *cube.shape))
+
+    start = time.perf_counter()
+    sorted_limits = [sort_limits(frame, pixmap, CLIP_PERCENT) for frame in cube]
+    sort_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single_limits = [clip_limits(frame, pixmap, CLIP_PERCENT) for frame in cube]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    minvals, maxvals = clip_limits(cube, pixmap, CLIP_PERCENT)
+    batch_time = time.perf_counter() - start
+
+    assert sorted_limits == single_limits
+    assert sorted_limits == list(zip(minvals, maxvals))
+
+    print('    {:<32}{:>8.3f} s'.format('sort, per image', sort_time))
+    print('    {:<32}{:>8.3f} s  ({:.1f}x)'.format('partition, per image', single_time,
+                                                   sort_time / single_time))
+    print('    {:<32}{:>8.3f} s  ({:.1f}x)'.format('partition, whole cube', batch_time,
+                                                   sort_time / batch_time))
+
+
+if __name__ == '__main__':
+
+    np.random.seed(0)
+    time_case('Full frame', np.random.normal(100, 10, (4, 2048, 2048)))
+    time_case('Time series', np.random.normal(100, 10, (2000, 64, 256)))
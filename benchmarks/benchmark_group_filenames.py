@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+
+"""Benchmark the grouping of files into exposures used by
+``generate_preview_images``.
+
+The previous grouping, which builds a regular expression for each
+file and matches it against every other file, is compared with
+``group_exposures``, which places the parsed filenames in buckets
+keyed by exposure in a single pass.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This script is intended to be executed from the command line:
+
+    ::
+
+        python benchmark_group_filenames.py
+"""
+
+import os
+import re
+import time
+
+from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
+from jwql.utils.utils import filename_parser, group_exposures
+
+DETECTORS = ['nrca1', 'nrca2', 'nrca3', 'nrca4', 'nrca5', 'nrcb1', 'nrcb2', 'nrcb3', 'nrcb4',
+             'nrcb5', 'nis', 'nrs1', 'nrs2', 'mirimage', 'guider1', 'guider2']
+
+
+def make_filenames(number_of_exposures):
+    """Make the names of the files of a program with the given number
+    of exposures, each taken with every detector"""
+
+    filenames = []
+    for exposure in range(number_of_exposures):
+        for detector in DETECTORS:
+            filenames.append('/filesystem/jw00327/jw00327{:03d}001_02101_{:05d}_{}_rate.fits'
+                             .format(exposure // 1000 + 1, exposure % 1000 + 1, detector))
+        filenames.append('/filesystem/jw00327/jw00327-o{:03d}_t001_nircam_f150w_i2d.fits'
+                         .format(exposure))
+
+    return filenames
+
+
+def regex_group_filenames(filenames):
+    """The previous, quadratic grouping"""
+
+    grouped, matched_names = [], []
+    filenames.sort()
+    for filename in filenames:
+        subgroup = []
+        filename_dict = filename_parser(os.path.basename(filename))
+        if filename not in matched_names:
+            if 'stage_3' in filename_dict['filename_type']:
+                matched_names.append(filename)
+                subgroup.append(filename)
+            elif filename_dict['filename_type'] == 'stage_1_and_2':
+                if filename_dict['detector'].upper() in NIRCAM_SHORTWAVE_DETECTORS:
+                    detector_str = 'NRC[AB][1234]'
+                elif filename_dict['detector'].upper() in NIRCAM_LONGWAVE_DETECTORS:
+                    detector_str = 'NRC[AB]5'
+                else:
+                    detector_str = filename_dict['detector'].upper()
+                base_output_name = 'jw{}{}{}_{}{}{}_{}_'.format(
+                    filename_dict['program_id'], filename_dict['observation'],
+                    filename_dict['visit'], filename_dict['visit_group'],
+                    filename_dict['parallel_seq_id'],
+                    filename_dict['activity'], filename_dict['exposure_id'])
+                match_str = '{}{}_{}.fits'.format(base_output_name, detector_str,
+                                                  filename_dict['suffix'])
+                match_str = os.path.join(os.path.dirname(filename), match_str)
+                pattern = re.compile(match_str, re.IGNORECASE)
+                for file_to_match in filenames:
+                    if pattern.match(file_to_match) is not None:
+                        matched_names.append(file_to_match)
+                        subgroup.append(file_to_match)
+        if len(subgroup) > 0:
+            grouped.append(subgroup)
+
+    return grouped
+
+
+if __name__ == '__main__':
+
+    for number_of_exposures in [25, 100, 400]:
+        filenames = make_filenames(number_of_exposures)
+        print('{} files'.format(len(filenames)))
+
+        start = time.perf_counter()
+        regex_groups = regex_group_filenames(list(filenames))
+        regex_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bucket_groups = group_exposures(filenames)
+        bucket_time = time.perf_counter() - start
+
+        assert regex_groups == bucket_groups
+
+        print('    {:<24}{:>9.3f} s'.format('regex matching', regex_time))
+        print('    {:<24}{:>9.3f} s  ({:.0f}x)'.format('exposure buckets', bucket_time,
+                                                       regex_time / bucket_time))
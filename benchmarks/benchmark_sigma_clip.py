@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+
+"""Benchmark the sigma-clipped statistics used by the dark monitor.
+
+The previous calculations, ``astropy.stats.sigma_clip`` followed by
+``numpy.nanmean`` and ``numpy.nanstd`` for ``mean_image`` and
+``scipy.stats.sigmaclip`` for ``mean_stdev``, are compared with the
+``sigma_clipped_mean_stdev`` kernel behind those functions, for stacks
+of full frame and subarray slope images and for single amplifiers.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This script is intended to be executed from the command line:
+
+    ::
+
+        python benchmark_sigma_clip.py
+"""
+
+import time
+import warnings
+
+from astropy.stats import sigma_clip
+import numpy as np
+from scipy.stats import sigmaclip
+
+from jwql.utils.calculations import mean_image, mean_stdev
+
+SIGMA_THRESHOLD = 3
+
+
+def slope_images(shape, dtype=np.float32):
+    """Simulate a stack of dark slope images, with cosmic rays and a
+    few unusable pixels
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the stack
+
+    dtype : type
+        Data type of the images
+
+    Returns
+    -------
+    data : numpy.ndarray
+        The stack of images
+    """
+
+    data = np.random.normal(0.01, 0.005, shape).astype(dtype)
+    data[np.random.rand(*shape) < 1e-3] = 5.
+    data[np.random.rand(*shape) < 1e-4] = np.nan
+    return data
+
+
+def time_mean_image(name, cube):
+    """Time the sigma-clipped mean and standard deviation images of a
+    cube and check that they agree
+
+    Parameters
+    ----------
+    name : str
+        Description of the case, for display
+
+    cube : numpy.ndarray
+        3D stack of images
+    """
+
+    print('{} ({} x {} x {}, {})'.format(name, *cube.shape, cube.dtype))
+
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        clipped_cube = sigma_clip(cube, sigma=SIGMA_THRESHOLD, axis=0, masked=False)
+        astropy_mean = np.nanmean(clipped_cube, axis=0)
+        astropy_stdev = np.nanstd(clipped_cube, axis=0)
+    astropy_time = time.perf_counter() - start
+    del clipped_cube
+
+    start = time.perf_counter()
+    kernel_mean, kernel_stdev = mean_image(cube, sigma_threshold=SIGMA_THRESHOLD)
+    kernel_time = time.perf_counter() - start
+
+    assert np.allclose(astropy_mean, kernel_mean, rtol=1e-12, atol=0, equal_nan=True)
+    assert np.allclose(astropy_stdev, kernel_stdev, rtol=1e-9, atol=0, equal_nan=True)
+
+    print('    {:<32}{:>8.3f} s'.format('astropy sigma_clip', astropy_time))
+    print('    {:<32}{:>8.3f} s  ({:.1f}x)'.format('mean_image', kernel_time,
+                                                   astropy_time / kernel_time))
+
+
+def time_mean_stdev(name, image):
+    """Time the sigma-clipped mean and standard deviation of an image
+    and check that they agree
+
+    Parameters
+    ----------
+    name : str
+        Description of the case, for display
+
+    image : numpy.ndarray
+        2D image
+    """
+
+    print('{} ({} x {}, {})'.format(name, *image.shape, image.dtype))
+    image = image[np.isfinite(image)]
+
+    start = time.perf_counter()
+    clipped, lower, upper = sigmaclip(image, low=SIGMA_THRESHOLD, high=SIGMA_THRESHOLD)
+    scipy_mean = np.mean(clipped)
+    scipy_stdev = np.std(clipped)
+    scipy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kernel_mean, kernel_stdev = mean_stdev(image, sigma_threshold=SIGMA_THRESHOLD)
+    kernel_time = time.perf_counter() - start
+
+    # scipy sums float32 data in float32, the kernel in float64
+    tolerance = 1e-12 if image.dtype == np.float64 else 1e-5
+    assert np.isclose(scipy_mean, kernel_mean, rtol=tolerance, atol=0)
+    assert np.isclose(scipy_stdev, kernel_stdev, rtol=tolerance, atol=0)
+
+    print('    {:<32}{:>8.3f} s'.format('scipy sigmaclip', scipy_time))
+    print('    {:<32}{:>8.3f} s  ({:.1f}x)'.format('mean_stdev', kernel_time,
+                                                   scipy_time / kernel_time))
+
+
+if __name__ == '__main__':
+
+    np.random.seed(0)
+    time_mean_image('Full frame, 10 slope images', slope_images((10, 2048, 2048)))
+    time_mean_image('Full frame, 10 slope images', slope_images((10, 2048, 2048), np.float64))
+    time_mean_image('Full frame quadrant, 50 slope images', slope_images((50, 1024, 1024)))
+    time_mean_image('Subarray, 200 slope images', slope_images((200, 160, 160)))
+    time_mean_stdev('Full frame amplifier', slope_images((2048, 512)))
+    time_mean_stdev('Full frame amplifier', slope_images((2048, 512), np.float64))
@@ -16,7 +16,8 @@ produces ``Table`` objects and constructs ORMs.
 
 The ``session`` object manages operations on ORM-mapped objects, as
 construced by the base.  These operations include querying, for
-example.
+example.  Each thread is given its own session, which can be discarded
+with ``session.remove()`` once the thread's work is done.
 
 Authors
 -------
@@ -62,6 +63,7 @@ import os
 import socket
 
 import pandas as pd
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import create_engine
@@ -69,13 +71,15 @@ from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import Enum
 from sqlalchemy import Float
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import MetaData
 from sqlalchemy import String
 from sqlalchemy import Time
 from sqlalchemy import UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.query import Query
 from sqlalchemy.types import ARRAY
 
@@ -98,7 +102,8 @@ def load_connection(connection_string):
 
     Create an ``engine`` using an given ``connection_string``. Create
     a ``base`` class and ``session`` class from the ``engine``. Create
-    an instance of the ``session`` class. Return the ``session``,
+    a thread-local registry of instances of the ``session`` class, so
+    that each thread uses its own session. Return the ``session``,
     ``base``, and ``engine`` instances. This was stolen from the
     `ascql` repository.
 
@@ -129,7 +134,7 @@ def load_connection(connection_string):
     engine = create_engine(connection_string, echo=False)
     base = declarative_base(engine)
     Session = sessionmaker(bind=engine)
-    session = Session()
+    session = scoped_session(Session)
     meta = MetaData()
 
     return session, base, engine, meta
@@ -200,6 +205,51 @@ class Anomaly(base):
         return a_list
 
 
+class FilesystemCatalog(base):
+    """ORM for the catalog of FITS files that exist in the filesystem.
+    Each record holds the filename properties parsed by
+    ``filename_parser`` so that files can be looked up without
+    searching the filesystem"""
+
+    # Name the table
+    __tablename__ = 'filesystem_catalog'
+    __table_args__ = (Index('filesystem_catalog_exposure_idx', 'program_id', 'observation',
+                            'visit'),)
+
+    # Define the columns
+    id = Column(Integer, primary_key=True, nullable=False)
+    filename = Column(String, unique=True, nullable=False)
+    directory = Column(String, index=True, nullable=False)
+    program_id = Column(String, index=True, nullable=True)
+    observation = Column(String, nullable=True)
+    visit = Column(String, nullable=True)
+    visit_group = Column(String, nullable=True)
+    parallel_seq_id = Column(String, nullable=True)
+    activity = Column(String, nullable=True)
+    exposure_id = Column(String, nullable=True)
+    detector = Column(String, index=True, nullable=True)
+    suffix = Column(String, index=True, nullable=True)
+    instrument = Column(String, index=True, nullable=True)
+    filename_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(Float, nullable=False)
+
+
+class FilesystemCatalogDirectory(base):
+    """ORM for the directories covered by the ``filesystem_catalog``
+    table, used to determine which directories have changed since the
+    catalog was last updated"""
+
+    # Name the table
+    __tablename__ = 'filesystem_catalog_directory'
+
+    # Define the columns
+    id = Column(Integer, primary_key=True, nullable=False)
+    directory = Column(String, unique=True, nullable=False)
+    mtime = Column(Float, nullable=False)
+    file_count = Column(Integer, nullable=False)
+
+
 class FilesystemGeneral(base):
     """ORM for the general (non instrument specific) filesystem monitor
     table"""
@@ -218,6 +268,37 @@ class FilesystemGeneral(base):
     available = Column(Float, nullable=False)
 
 
+class FilesystemHeader(base):
+    """ORM for the store of FITS primary headers.  Each record holds
+    selected header keywords along with the full, compressed header
+    text, keyed by filename and file modification time"""
+
+    # Name the table
+    __tablename__ = 'filesystem_header'
+
+    # Define the columns
+    id = Column(Integer, primary_key=True, nullable=False)
+    filename = Column(String, unique=True, nullable=False)
+    mtime = Column(Float, nullable=False)
+    instrume = Column(String, index=True, nullable=True)
+    detector = Column(String, index=True, nullable=True)
+    subarray = Column(String, nullable=True)
+    readpatt = Column(String, nullable=True)
+    exp_type = Column(String, index=True, nullable=True)
+    date_obs = Column(String, nullable=True)
+    expstart = Column(Float, nullable=True)
+    substrt1 = Column(Integer, nullable=True)
+    substrt2 = Column(Integer, nullable=True)
+    subsize1 = Column(Integer, nullable=True)
+    subsize2 = Column(Integer, nullable=True)
+    ngroups = Column(Integer, nullable=True)
+    nints = Column(Integer, nullable=True)
+    nframes = Column(Integer, nullable=True)
+    tsample = Column(Float, nullable=True)
+    tframe = Column(Float, nullable=True)
+    header = Column(LargeBinary, nullable=False)
+
+
 class FilesystemInstrument(base):
     """ORM for the instrument specific filesystem monitor table"""
 
@@ -258,6 +339,35 @@ class Monitor(base):
     log_file = Column(String(), nullable=False)
 
 
+class PreviewManifest(base):
+    """ORM for the manifest of FITS files whose preview images have
+    been generated, used to find the files that are new or have been
+    modified since the previews were last generated"""
+
+    # Name the table
+    __tablename__ = 'preview_manifest'
+
+    # Define the columns
+    id = Column(Integer, primary_key=True, nullable=False)
+    filename = Column(String, unique=True, nullable=False)
+    directory = Column(String, index=True, nullable=False)
+    mtime = Column(Float, nullable=False)
+    outputs = Column(String, nullable=True)
+
+
+class PreviewManifestDirectory(base):
+    """ORM for the directories whose files are all covered by the
+    ``preview_manifest`` table"""
+
+    # Name the table
+    __tablename__ = 'preview_manifest_directory'
+
+    # Define the columns
+    id = Column(Integer, primary_key=True, nullable=False)
+    directory = Column(String, unique=True, nullable=False)
+    mtime = Column(Float, nullable=False)
+
+
 def get_monitor_columns(data_dict, table_name):
     """Read in the corresponding table definition text file to
     generate ``SQLAlchemy`` columns for the table.
@@ -285,7 +395,8 @@ def get_monitor_columns(data_dict, table_name):
                       'date': Date(),
                       'time': Time(),
                       'datetime': DateTime,
-                      'bool': Boolean
+                      'bool': Boolean,
+                      'binary': LargeBinary
                       }
 
     # Get the data from the table definition file
@@ -381,18 +492,23 @@ def monitor_orm_factory(class_name):
 # Create tables from ORM factory
 NIRCamDarkQueryHistory = monitor_orm_factory('nircam_dark_query_history')
 NIRCamDarkPixelStats = monitor_orm_factory('nircam_dark_pixel_stats')
+NIRCamDarkPixelRegistry = monitor_orm_factory('nircam_dark_pixel_registry')
 NIRCamDarkDarkCurrent = monitor_orm_factory('nircam_dark_dark_current')
 NIRISSDarkQueryHistory = monitor_orm_factory('niriss_dark_query_history')
 NIRISSDarkPixelStats = monitor_orm_factory('niriss_dark_pixel_stats')
+NIRISSDarkPixelRegistry = monitor_orm_factory('niriss_dark_pixel_registry')
 NIRISSDarkDarkCurrent = monitor_orm_factory('niriss_dark_dark_current')
 NIRSpecDarkQueryHistory = monitor_orm_factory('nirspec_dark_query_history')
 NIRSpecDarkPixelStats = monitor_orm_factory('nirspec_dark_pixel_stats')
+NIRSpecDarkPixelRegistry = monitor_orm_factory('nirspec_dark_pixel_registry')
 NIRSpecDarkDarkCurrent = monitor_orm_factory('nirspec_dark_dark_current')
 MIRIDarkQueryHistory = monitor_orm_factory('miri_dark_query_history')
 MIRIDarkPixelStats = monitor_orm_factory('miri_dark_pixel_stats')
+MIRIDarkPixelRegistry = monitor_orm_factory('miri_dark_pixel_registry')
 MIRIDarkDarkCurrent = monitor_orm_factory('miri_dark_dark_current')
 FGSDarkQueryHistory = monitor_orm_factory('fgs_dark_query_history')
 FGSDarkPixelStats = monitor_orm_factory('fgs_dark_pixel_stats')
+FGSDarkPixelRegistry = monitor_orm_factory('fgs_dark_pixel_registry')
 FGSDarkDarkCurrent = monitor_orm_factory('fgs_dark_dark_current')
 
 
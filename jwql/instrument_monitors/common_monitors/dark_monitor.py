@@ -9,10 +9,15 @@ If enough new files for a given instrument/aperture combination
 (currently the files must be identified as dark current files in the
 ``exp_type`` header keyword) are present in the filesystem at the time
 the ``dark_monitor`` is called, the files are first run through the the
-appropriate pipeline steps to produce slope images.
+appropriate pipeline steps to produce slope images.  The files are
+processed in parallel by a pool of worker processes, and a file that
+fails in the pipeline is left out of the analysis.
 
 A mean slope image as well as a standard deviation slope image is
-created by sigma-clipping on a pixel by pixel basis. The mean and
+created by sigma-clipping on a pixel by pixel basis. The slope images
+are memory-mapped and combined a block of detector rows at a time
+(spread over the same number of processes), so that the memory needed
+does not grow with the number of files. The mean and
 standard deviation images are saved to a fits file, the name of which
 is entered into the ``<Instrument>DarkCurrent`` database table.
 
@@ -27,7 +32,14 @@ The standard deviation slope image is normalized by a baseline
 above a noise threshold are flagged as newly noisy pixels.
 
 New hot, dead, and noisy pixels are saved to the ``DarkPixelStats``
-database table.
+database table. Pixels found in previous runs are excluded using a
+bitmap registry of the known bad pixels on each detector, snapshots of
+which are saved to the ``DarkPixelRegistry`` database table.
+
+The slope images of full frame apertures are also folded into running
+per-pixel statistics of each detector (see ``jwql.utils.running_stats``),
+saved alongside the mean slope images, from which the mean and
+standard deviation of all dark data taken so far can be read.
 
 Next, the dark current in the mean slope image is examined. A histogram
 of the slope values is created for the pixels in each amplifier, as
@@ -52,12 +64,35 @@ Use
     ::
 
         python dark_monitor.py
+
+    The number of worker processes that run the pipeline and combine
+    the slope images (by default ``cores`` from the configuration file) and the memory (in GB) that
+    each may use can be set:
+
+    ::
+
+        python dark_monitor.py --processes 4 --max-memory 16
+
+    Apertures are monitored one after another by default. Several
+    apertures, of one or more instruments, can be monitored
+    concurrently, sharing the worker processes between them:
+
+    ::
+
+        python dark_monitor.py --instruments nircam niriss --jobs 4
 """
 
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from copy import copy, deepcopy
 import datetime
 import logging
+import multiprocessing
 import os
+import threading
+import time
+import traceback
 
 from astropy.io import ascii, fits
 from astropy.modeling import models
@@ -68,21 +103,125 @@ from sqlalchemy import func
 from sqlalchemy.sql.expression import and_
 
 from jwql.database.database_interface import session
-from jwql.database.database_interface import NIRCamDarkQueryHistory, NIRCamDarkPixelStats, NIRCamDarkDarkCurrent
-from jwql.database.database_interface import NIRISSDarkQueryHistory, NIRISSDarkPixelStats, NIRISSDarkDarkCurrent
-from jwql.database.database_interface import MIRIDarkQueryHistory, MIRIDarkPixelStats, MIRIDarkDarkCurrent
-from jwql.database.database_interface import NIRSpecDarkQueryHistory, NIRSpecDarkPixelStats, NIRSpecDarkDarkCurrent
-from jwql.database.database_interface import FGSDarkQueryHistory, FGSDarkPixelStats, FGSDarkDarkCurrent
+from jwql.database.database_interface import NIRCamDarkQueryHistory, NIRCamDarkPixelStats, \
+    NIRCamDarkDarkCurrent, NIRCamDarkPixelRegistry
+from jwql.database.database_interface import NIRISSDarkQueryHistory, NIRISSDarkPixelStats, \
+    NIRISSDarkDarkCurrent, NIRISSDarkPixelRegistry
+from jwql.database.database_interface import MIRIDarkQueryHistory, MIRIDarkPixelStats, \
+    MIRIDarkDarkCurrent, MIRIDarkPixelRegistry
+from jwql.database.database_interface import NIRSpecDarkQueryHistory, NIRSpecDarkPixelStats, \
+    NIRSpecDarkDarkCurrent, NIRSpecDarkPixelRegistry
+from jwql.database.database_interface import FGSDarkQueryHistory, FGSDarkPixelStats, \
+    FGSDarkDarkCurrent, FGSDarkPixelRegistry
 from jwql.instrument_monitors import pipeline_tools
 from jwql.jwql_monitors import monitor_mast
 from jwql.utils import calculations, instrument_properties
+from jwql.utils.bad_pixel_registry import load_registry, save_registry
+from jwql.utils.compressed_images import read_image_region, write_compressed_images
 from jwql.utils.constants import JWST_INSTRUMENT_NAMES_MIXEDCASE, JWST_DATAPRODUCTS
+from jwql.utils.header_store import get_keywords
 from jwql.utils.logging_functions import log_info, log_fail
-from jwql.utils.permissions import set_permissions
-from jwql.utils.utils import copy_files, ensure_dir_exists, get_config, filesystem_path, initialize_instrument_monitor, update_monitor_table
+from jwql.utils.running_stats import RunningStats
+from jwql.utils.utils import copy_files, ensure_dir_exists, get_config, filesystem_path, \
+    initialize_instrument_monitor, limit_process_memory, update_monitor_table
 
 THRESHOLDS_FILE = os.path.join(os.path.split(__file__)[0], 'dark_monitor_file_thresholds.txt')
 
+# Apertures monitored concurrently may share a detector, so the bad
+# pixels of a detector are checked and recorded by one aperture at a
+# time. Each aperture holds the lock of its detector until its results
+# are committed, so that the next aperture sees the pixels it recorded.
+BAD_PIXEL_LOCKS = {}
+
+# Likewise, the running statistics of a detector are updated by one
+# aperture at a time
+RUNNING_STATS_LOCK = threading.Lock()
+
+# Start method of the worker processes. Apertures may be monitored in
+# several threads, and forking a multithreaded process can leave the
+# children holding locks (e.g. of logging or of the database connection
+# pool) that are never released, so workers are forked from a separate
+# single-threaded server process instead.
+WORKER_START_METHOD = 'forkserver'
+
+
+def initialize_worker(max_memory, log_file):
+    """Prepare a worker process of ``Dark.run``: limit its memory, and
+    send its log messages to the log file of the monitor, which a
+    process started by the ``forkserver`` method does not inherit.
+
+    Parameters
+    ----------
+    max_memory : float
+        Maximum memory in GB.  If ``None``, the memory is not limited.
+
+    log_file : str
+        The path to the log file of the monitor.  If ``None``, logging
+        is left unconfigured.
+    """
+
+    limit_process_memory(max_memory)
+
+    if log_file is not None:
+        logging.basicConfig(filename=log_file,
+                            format='%(asctime)s %(levelname)s: %(message)s',
+                            datefmt='%m/%d/%Y %H:%M:%S %p',
+                            level=logging.INFO)
+
+
+def latest_baseline_files(pixel_table):
+    """Return the filename of the most recent baseline (comparison)
+    mean dark slope image of every detector, using a single query.
+
+    Parameters
+    ----------
+    pixel_table : sqlalchemy table
+        The ``<Instrument>DarkPixelStats`` table
+
+    Returns
+    -------
+    baseline_files : dict
+        Filename of the baseline image, keyed by detector
+    """
+
+    sub_query = session.query(pixel_table.detector,
+                              func.max(pixel_table.entry_date).label('maxdate')
+                              ).group_by(pixel_table.detector).subquery('t2')
+
+    query = session.query(pixel_table.detector, pixel_table.baseline_file).join(
+        sub_query,
+        and_(
+            pixel_table.detector == sub_query.c.detector,
+            pixel_table.entry_date == sub_query.c.maxdate
+        )
+    )
+
+    return dict(query.all())
+
+
+def latest_successful_searches(query_table):
+    """Return the end date of the most recent MAST search after which
+    the dark monitor was run, for every aperture, using a single query.
+
+    Parameters
+    ----------
+    query_table : sqlalchemy table
+        The ``<Instrument>DarkQueryHistory`` table
+
+    Returns
+    -------
+    end_dates : dict
+        Date (in MJD) of the end of the search, keyed by aperture
+    """
+
+    # Note that "query_table.run_monitor == True" below is
+    # intentional. Switching = to "is" results in an error in the query.
+    query = session.query(query_table.aperture, func.max(query_table.end_time_mjd)) \
+        .filter(query_table.run_monitor == True) \
+        .group_by(query_table.aperture)
+
+    return dict(query.all())
+
 
 def mast_query_darks(instrument, aperture, start_date, end_date):
     """Use ``astroquery`` to search MAST for dark current data
@@ -145,16 +284,120 @@ def mast_query_darks(instrument, aperture, start_date, end_date):
     return query_results
 
 
+def parse_args():
+    """Parse command line arguments
+
+    Returns
+    -------
+    args : obj
+        The parsed command line arguments
+    """
+
+    parser = argparse.ArgumentParser(description='Run the dark current monitor')
+    parser.add_argument('--processes', type=int, default=None,
+                        help=('Total number of worker processes that run the pipeline and combine '
+                              'the slope images, shared between the concurrent jobs'))
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='Maximum memory (GB) used by each worker process')
+    parser.add_argument('--instruments', nargs='+', default=['nircam'],
+                        choices=['nircam', 'niriss', 'nirspec', 'miri', 'fgs'],
+                        help='Instruments to monitor')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of apertures to monitor concurrently')
+    args = parser.parse_args()
+
+    return args
+
+
+def prepare_slope_file(filename, steps_to_run):
+    """Run the pipeline steps that remain to be done on a dark current
+    file to produce a slope image.  Intended to be run by the worker
+    processes of ``Dark.run``, so errors are logged and reported back
+    rather than raised.  The steps that remain are determined by the
+    caller, so that the workers do not use the database.
+
+    Slope files already produced from the same file, with the same
+    pipeline steps and versions, are copied from the cache of pipeline
+    outputs shared by the monitors. When the pipeline is run, the slope
+    file is saved (and added to the cache) and the slope image is also
+    returned directly, so that the caller does not have to read it
+    back. The dark ramp file is only deleted once the slope file has
+    been saved.
+
+    Parameters
+    ----------
+    filename : str
+        Dark current file (including full path)
+
+    steps_to_run : collections.OrderedDict or None
+        The pipeline steps that remain to be run on the file (see
+        ``pipeline_tools.steps_to_run``), or ``None`` if they could not
+        be determined, in which case the file is reported as failed
+
+    Returns
+    -------
+    slope_file : str or None
+        The slope file made from (or already made from) ``filename``,
+        or ``None`` if the pipeline failed
+
+    slope_image : numpy.ndarray or None
+        The slope image, if the pipeline was run, or ``None`` if the
+        slope image is to be read from ``slope_file``
+    """
+
+    if steps_to_run is None:
+        return None, None
+
+    try:
+        logging.info('\tWorking on file: {}'.format(filename))
+        logging.info('\tPipeline steps that remain to be run:')
+        for item in steps_to_run:
+            logging.info('\t\t{}: {}'.format(item, steps_to_run[item]))
+
+        # Run any remaining required pipeline steps
+        if any(steps_to_run.values()) is False:
+            return filename, None
+
+        processed_file = filename.replace('.fits', '_{}.fits'.format('rate'))
+
+        # If the slope file already exists, skip the pipeline call
+        slope_image = None
+        if not os.path.isfile(processed_file):
+            logging.info('\tRunning pipeline on {}, unless its output is cached'.format(filename))
+            processed_file, model = pipeline_tools.calwebb_detector1_cached(
+                os.path.abspath(filename), steps_to_run)
+            if model is not None:
+                slope_image = model.data
+                logging.info('\tPipeline complete. Output: {}'.format(processed_file))
+            else:
+                logging.info('\tSlope file copied from the pipeline cache. Output: {}'
+                             .format(processed_file))
+
+        else:
+            logging.info('\tSlope file {} already exists. Skipping call to pipeline.'
+                         .format(processed_file))
+
+        # Delete the original dark ramp file to save disk space
+        os.remove(filename)
+
+    except Exception:
+        logging.error('\tPipeline failed on {}:\n{}'.format(filename, traceback.format_exc()))
+        return None, None
+
+    return processed_file, slope_image
+
+
 @log_fail
 @log_info
 class Dark():
     """Class for executing the dark current monitor.
 
     This class will search for new (since the previous instance of the
-    class) dark current files in the file system. It will loop over
-    instrument/aperture combinations and find the number of new dark
-    current files available. If there are enough, it will copy the files
-    over to a working directory and run the monitor. This will create a
+    class) dark current files in the file system. It will run a job for
+    each instrument/aperture combination, several at a time if
+    requested, and find the number of new dark current files
+    available. If there are enough, it will copy the files over to a
+    working directory and run the monitor. This will create a
     mean dark current rate image, create a histogram of the dark current
     values, and fit several functions to the histogram. It will also
     compare the dark current image to a historical image in order to
@@ -167,11 +410,43 @@ class Dark():
         For pytest. If ``True``, an instance of ``Dark`` is created, but
         no other code is executed.
 
+    processes : int
+        Total number of worker processes that run the pipeline on the
+        dark current files and combine the slope images, shared equally
+        between the ``jobs``. If ``None``, ``cores`` from the
+        configuration file is used.
+
+    max_memory : float
+        Maximum memory (GB) that each worker process may use. If
+        ``None``, the memory is not limited.
+
+    jobs : int
+        Number of instrument/aperture combinations to monitor
+        concurrently
+
+    instruments : list
+        Instruments to monitor. If ``None``, only NIRCam is monitored.
+
     Attributes
     ----------
     output_dir : str
         Path into which outputs will be placed
 
+    processes : int
+        Total number of worker processes that run the pipeline and
+        combine the slope images (``None`` for ``cores`` from the
+        configuration file)
+
+    max_memory : float
+        Maximum memory (GB) that each worker process may use
+
+    jobs : int
+        Number of instrument/aperture combinations to monitor
+        concurrently
+
+    instruments : list
+        Instruments to monitor
+
     data_dir : str
         Path into which new dark files will be copied to be worked on
 
@@ -196,23 +471,52 @@ class Dark():
         Table containing lists of hot/dead/noisy pixels found for each
         instrument/detector
 
+    registry_table : sqlalchemy table
+        Table containing snapshots of the bitmaps of the hot/dead/noisy
+        pixels found for each instrument/detector
+
     stats_table : sqlalchemy table
         Table containing dark current analysis results. Mean/stdev
         values, histogram information, Gaussian fitting results, etc.
 
+    query_history : dict
+        Date (in MJD) of the end of the most recent MAST search after
+        which the monitor was run, keyed by aperture. Looked up once
+        per run.
+
+    baseline_files : dict
+        Filename of the most recent baseline image, keyed by detector.
+        Looked up once per run and updated as bad pixels are recorded.
+
+    held_locks : contextlib.ExitStack
+        Locks held by the job until the results of its aperture are
+        committed
+
+    pending_running_stats : tuple
+        Slope images and mean slope image of the aperture, to be folded
+        into the running statistics of the detector once the results
+        are committed
+
     Raises
     ------
     ValueError
         If encountering an unrecognized bad pixel type
 
-    ValueError
-        If the most recent query search returns more than one entry
+    RuntimeError
+        If the monitor fails for any instrument/aperture combination
     """
 
-    def __init__(self, testing=False):
+    def __init__(self, testing=False, processes=None, max_memory=None, jobs=1, instruments=None):
 
         logging.info('Begin logging for dark_monitor')
 
+        self.processes = processes
+        self.max_memory = max_memory
+        self.jobs = jobs
+        self.instruments = instruments or ['nircam']
+        self.query_history = {}
+        self.baseline_files = {}
+
         apertures_to_skip = ['NRCALL_FULL', 'NRCAS_FULL', 'NRCBS_FULL']
 
         if not testing:
@@ -227,80 +531,62 @@ class Dark():
             # Use the current time as the end time for MAST query
             self.query_end = Time.now().mjd
 
-            # Loop over all instruments
-            for instrument in ['nircam']:
-                self.instrument = instrument
-
-                # Identify which database tables to use
-                self.identify_tables()
+            # Find the instrument/aperture combinations to monitor, along
+            # with the number of new files each needs
+            aperture_jobs = []
+            for instrument in self.instruments:
 
                 # Get a list of all possible apertures from pysiaf
                 possible_apertures = list(Siaf(instrument).apernames)
                 possible_apertures = [ap for ap in possible_apertures if ap not in apertures_to_skip]
 
                 for aperture in possible_apertures:
-
-                    logging.info('')
-                    logging.info('Working on aperture {} in {}'.format(aperture, instrument))
-
-                    # Find the appropriate threshold for the number of new files needed
                     match = aperture == limits['Aperture']
-                    file_count_threshold = limits['Threshold'][match]
-
-                    # Locate the record of the most recent MAST search
-                    self.aperture = aperture
-                    self.query_start = self.most_recent_search()
-                    logging.info('\tQuery times: {} {}'.format(self.query_start, self.query_end))
-
-                    # Query MAST using the aperture and the time of the
-                    # most recent previous search as the starting time
-                    new_entries = mast_query_darks(instrument, aperture, self.query_start, self.query_end)
-                    logging.info('\tAperture: {}, new entries: {}'.format(self.aperture, len(new_entries)))
-
-                    # Check to see if there are enough new files to meet the monitor's signal-to-noise requirements
-                    if len(new_entries) >= file_count_threshold:
-
-                        logging.info('\tSufficient new dark files found for {}, {} to run the dark monitor.'
-                                     .format(self.instrument, self.aperture))
-
-                        # Get full paths to the files
-                        new_filenames = [filesystem_path(file_entry['filename']) for file_entry in new_entries]
-
-                        # Set up directories for the copied data
-                        ensure_dir_exists(os.path.join(self.output_dir, 'data'))
-                        self.data_dir = os.path.join(self.output_dir,
-                                                     'data/{}_{}'.format(self.instrument.lower(),
-                                                                         self.aperture.lower()))
-                        ensure_dir_exists(self.data_dir)
-
-                        # Copy files from filesystem
-                        dark_files, not_copied = copy_files(new_filenames, self.data_dir)
-
-                        # Run the dark monitor
-                        self.run(dark_files)
-                        monitor_run = True
-
-                    else:
-                        logging.info(('\tDark monitor skipped. {} new dark files for {}, {}. {} new files are '
-                                      'required to run dark current monitor.').format(
-                            len(new_entries), instrument, aperture, file_count_threshold[0]))
-                        monitor_run = False
-
-                    # Update the query history
-                    new_entry = {'instrument': instrument,
-                                 'aperture': aperture,
-                                 'start_time_mjd': self.query_start,
-                                 'end_time_mjd': self.query_end,
-                                 'files_found': len(new_entries),
-                                 'run_monitor': monitor_run,
-                                 'entry_date': datetime.datetime.now()}
-                    self.query_table.__table__.insert().execute(new_entry)
-                    logging.info('\tUpdated the query history table')
+                    if not np.any(match):
+                        logging.info('No file count threshold for {} in {}. Skipping.'
+                                     .format(aperture, instrument))
+                        continue
+                    aperture_jobs.append((instrument, aperture, limits['Threshold'][match][0]))
+
+            # Look up the most recent search of every aperture and the
+            # baseline image of every detector once for the whole run
+            for instrument in self.instruments:
+                self.instrument = instrument
+                self.identify_tables()
+                self.query_history.update(latest_successful_searches(self.query_table))
+                self.baseline_files.update(latest_baseline_files(self.pixel_table))
+
+            # Set up the directory for the copied data
+            ensure_dir_exists(os.path.join(self.output_dir, 'data'))
+
+            # Monitor the apertures, several at a time if requested. Each
+            # job works on its own copy of this object, so the attributes
+            # describing an aperture are not shared between jobs.
+            logging.info('Monitoring {} apertures, {} at a time'
+                         .format(len(aperture_jobs), self.jobs))
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(copy(self).monitor_aperture, *job)
+                           for job in aperture_jobs]
+                summary = [future.result() for future in futures]
+
+            # Summarize the time spent on each aperture, slowest first
+            logging.info('')
+            logging.info('Time spent on each aperture:')
+            for job in sorted(summary, key=lambda job: job['time'], reverse=True):
+                logging.info('\t{instrument:<8} {aperture:<24} {files_found:>5} new files  '
+                             '{status:<8} {time:>9.1f} s'.format(**job))
+
+            failed = ['{}/{}'.format(job['instrument'], job['aperture'])
+                      for job in summary if job['status'] == 'failed']
+            if len(failed) > 0:
+                raise RuntimeError('Dark monitor failed for {}'.format(', '.join(failed)))
 
             logging.info('Dark Monitor completed successfully.')
 
     def add_bad_pix(self, coordinates, pixel_type, files, mean_filename, baseline_filename):
-        """Add a set of bad pixels to the bad pixel database table
+        """Add a set of bad pixels to the bad pixel database table. The
+        pixels are committed with the rest of the results of the
+        aperture (see ``monitor_aperture``).
 
         Parameters
         ----------
@@ -327,6 +613,7 @@ class Dark():
 
         logging.info('Adding {} {} pixels to database.'.format(len(coordinates[0]), pixel_type))
 
+        entry_date = datetime.datetime.now()
         source_files = [os.path.basename(item) for item in files]
         entry = {'detector': self.detector,
                  'x_coord': coordinates[0],
@@ -335,8 +622,15 @@ class Dark():
                  'source_files': source_files,
                  'mean_dark_image_file': os.path.basename(mean_filename),
                  'baseline_file': os.path.basename(baseline_filename),
-                 'entry_date': datetime.datetime.now()}
-        self.pixel_table.__table__.insert().execute(entry)
+                 'entry_date': entry_date}
+        session.execute(self.pixel_table.__table__.insert(), [entry])
+        self.baseline_files[self.detector] = entry['baseline_file']
+
+        # Save a snapshot of the registry including the new pixels
+        if len(coordinates[0]) > 0:
+            registry = load_registry(self.registry_table, self.pixel_table, self.detector,
+                                     pixel_type)
+            save_registry(self.registry_table, self.detector, pixel_type, registry, entry_date)
 
     def get_metadata(self, filename):
         """Collect basic metadata from a fits file
@@ -347,7 +641,8 @@ class Dark():
             Name of fits file to examine
         """
 
-        header = fits.getheader(filename)
+        header = get_keywords(filename, ['DETECTOR', 'SUBSTRT1', 'SUBSTRT2', 'SUBSIZE1', 'SUBSIZE2',
+                                         'TSAMPLE', 'TFRAME', 'READPATT'])
 
         try:
             self.detector = header['DETECTOR']
@@ -389,30 +684,9 @@ class Dark():
         if pixel_type not in ['hot', 'dead', 'noisy']:
             raise ValueError('Unrecognized bad pixel type: {}'.format(pixel_type))
 
-        db_entries = session.query(self.pixel_table) \
-            .filter(self.pixel_table.type == pixel_type) \
-            .filter(self.pixel_table.detector == self.detector) \
-            .all()
-
-        already_found = []
-        if len(db_entries) != 0:
-            for _row in db_entries:
-                x_coords = _row.x_coord
-                y_coords = _row.y_coord
-                for x, y in zip(x_coords, y_coords):
-                    already_found.append((x, y))
-
-        # Check to see if each pixel already appears in the database for
-        # the given bad pixel type
-        new_pixels_x = []
-        new_pixels_y = []
-        for x, y in zip(badpix[0], badpix[1]):
-            pixel = (x, y)
-            if pixel not in already_found:
-                new_pixels_x.append(x)
-                new_pixels_y.append(y)
-
-        return (new_pixels_x, new_pixels_y)
+        registry = load_registry(self.registry_table, self.pixel_table, self.detector, pixel_type)
+
+        return registry.difference(badpix)
 
     def find_hot_dead_pixels(self, mean_image, comparison_image, hot_threshold=2., dead_threshold=0.1):
         """Create the ratio of the slope image to a baseline slope
@@ -460,10 +734,12 @@ class Dark():
         return hotpix, deadpix
 
     def get_baseline_filename(self):
-        """Query the database and return the filename of the baseline
-        (comparison) mean dark slope image to use when searching for
+        """Return the filename of the baseline (comparison) mean dark
+        slope image to use when searching for
         new hot/dead/noisy pixels. For this we assume that the most
         recent baseline file for the given detector is the one to use.
+        The baseline files of all detectors are looked up once, at the
+        start of the monitor run.
 
         Returns
         -------
@@ -471,23 +747,8 @@ class Dark():
             Name of fits file containing the baseline image
         """
 
-        subq = session.query(self.pixel_table.detector,
-                             func.max(self.pixel_table.entry_date).label('maxdate')
-                             ).group_by(self.pixel_table.detector).subquery('t2')
-
-        query = session.query(self.pixel_table).join(
-            subq,
-            and_(
-                self.pixel_table.detector == self.detector,
-                self.pixel_table.entry_date == subq.c.maxdate
-            )
-        )
-
-        count = query.count()
-        if not count:
-            filename = None
-        else:
-            filename = query.all()[0].baseline_file
+        filename = self.baseline_files.get(self.detector)
+        if filename is not None:
             logging.info('Baseline filename: {}'.format(filename))
 
         return filename
@@ -500,12 +761,139 @@ class Dark():
         mixed_case_name = JWST_INSTRUMENT_NAMES_MIXEDCASE[self.instrument]
         self.query_table = eval('{}DarkQueryHistory'.format(mixed_case_name))
         self.pixel_table = eval('{}DarkPixelStats'.format(mixed_case_name))
+        self.registry_table = eval('{}DarkPixelRegistry'.format(mixed_case_name))
         self.stats_table = eval('{}DarkDarkCurrent'.format(mixed_case_name))
 
+    def monitor_aperture(self, instrument, aperture, file_count_threshold):
+        """Search MAST for new dark current files taken with an
+        aperture, run the monitor on them if there are enough, and
+        record the search in the query history table.
+
+        All the database entries for the aperture (bad pixels, bad
+        pixel registry snapshots, dark current statistics, and the
+        query history) are made in one transaction of the job's own
+        database session, committed once the aperture has been
+        monitored successfully. An aperture that fails leaves no
+        entries, and is searched again on the next run.
+
+        Parameters
+        ----------
+        instrument : str
+            Name of the instrument, e.g. ``nircam``
+
+        aperture : str
+            Name of the aperture, e.g. ``NRCA1_FULL``
+
+        file_count_threshold : int
+            Number of new files needed to run the monitor
+
+        Returns
+        -------
+        summary : dict
+            The instrument, aperture, number of new files found,
+            status (``run``, ``skipped``, or ``failed``), and time
+            (seconds) spent on the aperture
+        """
+
+        start_time = time.time()
+        summary = {'instrument': instrument, 'aperture': aperture, 'files_found': 0,
+                   'status': 'failed'}
+
+        self.instrument = instrument
+        self.aperture = aperture
+        self.held_locks = ExitStack()
+        self.pending_running_stats = None
+
+        try:
+            logging.info('')
+            logging.info('Working on aperture {} in {}'.format(aperture, instrument))
+
+            # Identify which database tables to use
+            self.identify_tables()
+
+            # Locate the record of the most recent MAST search
+            self.query_start = self.most_recent_search()
+            logging.info('\tQuery times: {} {}'.format(self.query_start, self.query_end))
+
+            # Query MAST using the aperture and the time of the
+            # most recent previous search as the starting time
+            new_entries = mast_query_darks(instrument, aperture, self.query_start, self.query_end)
+            logging.info('\tAperture: {}, new entries: {}'.format(self.aperture, len(new_entries)))
+            summary['files_found'] = len(new_entries)
+
+            # Check to see if there are enough new files to meet the
+            # monitor's signal-to-noise requirements
+            if len(new_entries) >= file_count_threshold:
+
+                logging.info('\tSufficient new dark files found for {}, {} to run the dark monitor.'
+                             .format(self.instrument, self.aperture))
+
+                # Get full paths to the files
+                new_filenames = [filesystem_path(file_entry['filename'])
+                                 for file_entry in new_entries]
+
+                # Set up directories for the copied data
+                self.data_dir = os.path.join(self.output_dir,
+                                             'data/{}_{}'.format(self.instrument.lower(),
+                                                                 self.aperture.lower()))
+                ensure_dir_exists(self.data_dir)
+
+                # Copy files from filesystem
+                dark_files, not_copied = copy_files(new_filenames, self.data_dir)
+
+                # Run the dark monitor
+                self.run(dark_files)
+                monitor_run = True
+
+            else:
+                logging.info(('\tDark monitor skipped. {} new dark files for {}, {}. {} new '
+                              'files are required to run dark current monitor.').format(
+                    len(new_entries), instrument, aperture, file_count_threshold))
+                monitor_run = False
+
+            # Update the query history
+            new_entry = {'instrument': instrument,
+                         'aperture': aperture,
+                         'start_time_mjd': self.query_start,
+                         'end_time_mjd': self.query_end,
+                         'files_found': len(new_entries),
+                         'run_monitor': monitor_run,
+                         'entry_date': datetime.datetime.now()}
+            session.execute(self.query_table.__table__.insert(), [new_entry])
+            session.commit()
+            logging.info('\tUpdated the query history table')
+
+            # Fold the new slope images into the running statistics of
+            # the detector only now, so that the files of an aperture
+            # that fails, which are searched again on the next run, are
+            # not folded in twice
+            if self.pending_running_stats is not None:
+                try:
+                    self.update_running_stats(*self.pending_running_stats)
+                except Exception:
+                    logging.error('\tRunning statistics of {} not updated:\n{}'
+                                  .format(self.detector, traceback.format_exc()))
+
+            summary['status'] = 'run' if monitor_run else 'skipped'
+
+        except Exception:
+            session.rollback()
+            logging.error('Dark monitor failed for {}, {}:\n{}'
+                          .format(instrument, aperture, traceback.format_exc()))
+
+        finally:
+            self.held_locks.close()
+            session.remove()
+
+        summary['time'] = time.time() - start_time
+
+        return summary
+
     def most_recent_search(self):
-        """Query the query history database and return the information
-        on the most recent query for the given ``aperture_name`` where
-        the dark monitor was executed.
+        """Return the information from the query history database on
+        the most recent query for the given ``aperture_name`` where
+        the dark monitor was executed. The query history of all
+        apertures is looked up once, at the start of the monitor run.
 
         Returns
         -------
@@ -514,30 +902,11 @@ class Dark():
             where the dark monitor was run.
         """
 
-        sub_query = session.query(self.query_table.aperture,
-                                  func.max(self.query_table.end_time_mjd).label('maxdate')
-                                  ).group_by(self.query_table.aperture).subquery('t2')
-
-        # Note that "self.query_table.run_monitor == True" below is
-        # intentional. Switching = to "is" results in an error in the query.
-        query = session.query(self.query_table).join(
-            sub_query,
-            and_(
-                self.query_table.aperture == self.aperture,
-                self.query_table.end_time_mjd == sub_query.c.maxdate,
-                self.query_table.run_monitor == True
-            )
-        ).all()
-
-        query_count = len(query)
-        if query_count == 0:
+        query_result = self.query_history.get(self.aperture)
+        if query_result is None:
             query_result = 57357.0  # a.k.a. Dec 1, 2015 == CV3
             logging.info(('\tNo query history for {}. Beginning search date will be set to {}.'
                          .format(self.aperture, query_result)))
-        elif query_count > 1:
-            raise ValueError('More than one "most recent" query?')
-        else:
-            query_result = query[0].end_time_mjd
 
         return query_result
 
@@ -577,7 +946,8 @@ class Dark():
 
     def read_baseline_slope_image(self, filename):
         """Read in a baseline mean slope image and associated standard
-        deviation image from the given fits file
+        deviation image from the given fits file. Both tile-compressed
+        and (older) uncompressed files can be read.
 
         Parameters
         ----------
@@ -594,9 +964,8 @@ class Dark():
         """
 
         try:
-            with fits.open(filename) as hdu:
-                mean_image = hdu['MEAN'].data
-                stdev_image = hdu['STDEV'].data
+            mean_image = read_image_region(filename, 'MEAN')
+            stdev_image = read_image_region(filename, 'STDEV')
             return mean_image, stdev_image
         except (FileNotFoundError, KeyError) as e:
             logging.warning('Trying to read {}: {}'.format(filename, e))
@@ -609,6 +978,11 @@ class Dark():
         file_list : list
             List of filenames (including full paths) to the dark current
             files
+
+        Raises
+        ------
+        RuntimeError
+            If the pipeline failed on all of the files
         """
 
         # Basic metadata that will be needed later
@@ -631,49 +1005,66 @@ class Dark():
         if self.read_pattern not in pipeline_tools.GROUPSCALE_READOUT_PATTERNS:
             required_steps['group_scale'] = False
 
-        # Run pipeline steps on files, generating slope files
-        slope_files = []
+        # Determine the steps that remain to be run on each file. The
+        # headers are read here, rather than in the worker processes, so
+        # that the workers do not share the database connection of this
+        # process.
+        file_steps = []
         for filename in file_list:
-
-            completed_steps = pipeline_tools.completed_pipeline_steps(filename)
-            steps_to_run = pipeline_tools.steps_to_run(required_steps, completed_steps)
-
-            logging.info('\tWorking on file: {}'.format(filename))
-            logging.info('\tPipeline steps that remain to be run:')
-            for item in steps_to_run:
-                logging.info('\t\t{}: {}'.format(item, steps_to_run[item]))
-
-            # Run any remaining required pipeline steps
-            if any(steps_to_run.values()) is False:
-                slope_files.append(filename)
-            else:
-                processed_file = filename.replace('.fits', '_{}.fits'.format('rate'))
-
-                # If the slope file already exists, skip the pipeline call
-                if not os.path.isfile(processed_file):
-                    logging.info('\tRunning pipeline on {}'.format(filename))
-                    processed_file = pipeline_tools.run_calwebb_detector1_steps(os.path.abspath(filename), steps_to_run)
-                    logging.info('\tPipeline complete. Output: {}'.format(processed_file))
-
-                else:
-                    logging.info('\tSlope file {} already exists. Skipping call to pipeline.'
-                                 .format(processed_file))
-                    pass
-
-                slope_files.append(processed_file)
-
-                # Delete the original dark ramp file to save disk space
-                os.remove(filename)
+            try:
+                completed_steps = pipeline_tools.completed_pipeline_steps(filename)
+                file_steps.append(pipeline_tools.steps_to_run(required_steps, completed_steps))
+            except Exception:
+                logging.error('\tCould not read the completed pipeline steps of {}:\n{}'
+                              .format(filename, traceback.format_exc()))
+                file_steps.append(None)
+
+        # Run pipeline steps on files, generating slope files. Each file
+        # is handled by a separate worker process, which is replaced
+        # after each file to return the pipeline's memory to the system.
+        # The workers return new slope images directly, as well as
+        # saving them to slope files. The worker processes are shared
+        # between the apertures monitored at the same time.
+        processes = max(1, (self.processes or int(get_config()['cores'])) // self.jobs)
+        log_files = [handler.baseFilename for handler in logging.root.handlers
+                     if isinstance(handler, logging.FileHandler)]
+        context = multiprocessing.get_context(WORKER_START_METHOD)
+        pool = context.Pool(processes=min(processes, len(file_list)),
+                            initializer=initialize_worker,
+                            initargs=(self.max_memory, (log_files or [None])[0]),
+                            maxtasksperchild=1)
+        results = pool.starmap(prepare_slope_file, zip(file_list, file_steps))
+        pool.close()
+        pool.join()
+
+        # Files that failed in the pipeline are left out. Slope images
+        # that were not returned are read from their files.
+        slope_files = [slope_file for slope_file, slope_image in results if slope_file is not None]
+        slope_images = [slope_file if slope_image is None else slope_image
+                        for slope_file, slope_image in results if slope_file is not None]
+        failed_files = [filename for filename, (slope_file, slope_image) in zip(file_list, results)
+                        if slope_file is None]
+        if failed_files:
+            logging.warning('\tPipeline failed on {} of {} files for {}, {}:'.format(
+                len(failed_files), len(file_list), self.instrument, self.aperture))
+            for item in failed_files:
+                logging.warning('\t\t{}'.format(item))
+        # With no slope images the aperture fails, so that its query
+        # history is not recorded and its files are searched again
+        if not slope_files:
+            raise RuntimeError('No slope images available for {}, {}'.format(self.instrument,
+                                                                             self.aperture))
 
         logging.info('\tSlope images to use in the dark monitor for {}, {}:'.format(self.instrument, self.aperture))
         for item in slope_files:
             logging.info('\t\t{}'.format(item))
 
-        # Read in all slope images and place into a list
-        slope_image_stack, slope_exptimes = pipeline_tools.image_stack(slope_files)
-
-        # Calculate a mean slope image from the inputs
-        slope_image, stdev_image = calculations.mean_image(slope_image_stack, sigma_threshold=3)
+        # Calculate a mean slope image from the inputs, combined a block
+        # of rows at a time. Slope images read from existing files are
+        # memory-mapped, so that they never all need to be in memory
+        slope_image, stdev_image = calculations.mean_image_stack(slope_images, sigma_threshold=3,
+                                                                 processes=processes,
+                                                                 start_method=WORKER_START_METHOD)
         mean_slope_file = self.save_mean_slope_image(slope_image, stdev_image, slope_files)
         logging.info('\tSigma-clipped mean of the slope images saved to: {}'.format(mean_slope_file))
 
@@ -706,13 +1097,18 @@ class Dark():
             new_hot_pix = self.shift_to_full_frame(new_hot_pix)
             new_dead_pix = self.shift_to_full_frame(new_dead_pix)
 
+            # Hold the bad pixel lock of the detector until the results
+            # of the aperture are committed (see ``monitor_aperture``)
+            lock = BAD_PIXEL_LOCKS.setdefault(self.detector, threading.Lock())
+            self.held_locks.enter_context(lock)
+
             # Exclude hot and dead pixels found previously
             new_hot_pix = self.exclude_existing_badpix(new_hot_pix, 'hot')
             new_dead_pix = self.exclude_existing_badpix(new_dead_pix, 'dead')
 
             # Add new hot and dead pixels to the database
-            logging.info('\tFound {} new hot pixels'.format(len(new_hot_pix)))
-            logging.info('\tFound {} new dead pixels'.format(len(new_dead_pix)))
+            logging.info('\tFound {} new hot pixels'.format(len(new_hot_pix[0])))
+            logging.info('\tFound {} new dead pixels'.format(len(new_dead_pix[0])))
             self.add_bad_pix(new_hot_pix, 'hot', file_list, mean_slope_file, baseline_file)
             self.add_bad_pix(new_dead_pix, 'dead', file_list, mean_slope_file, baseline_file)
 
@@ -727,9 +1123,13 @@ class Dark():
             new_noisy_pixels = self.exclude_existing_badpix(new_noisy_pixels, 'noisy')
 
             # Add new noisy pixels to the database
-            logging.info('\tFound {} new noisy pixels'.format(len(new_noisy_pixels)))
+            logging.info('\tFound {} new noisy pixels'.format(len(new_noisy_pixels[0])))
             self.add_bad_pix(new_noisy_pixels, 'noisy', file_list, mean_slope_file, baseline_file)
 
+            # The new slope images are folded into the running statistics
+            # of the detector once the results are committed
+            self.pending_running_stats = (slope_images, slope_image)
+
         # ----- Calculate image statistics -----
 
         # Find amplifier boundaries so per-amp statistics can be calculated
@@ -763,11 +1163,12 @@ class Dark():
                              'hist_amplitudes': histogram,
                              'entry_date': datetime.datetime.now()
                              }
-            self.stats_table.__table__.insert().execute(dark_db_entry)
+            session.execute(self.stats_table.__table__.insert(), [dark_db_entry])
 
     def save_mean_slope_image(self, slope_img, stdev_img, files):
         """Save the mean slope image and associated stdev image to a
-        file
+        file, as tile-compressed float32 images (see
+        ``jwql.utils.compressed_images``)
 
         Parameters
         ----------
@@ -794,22 +1195,19 @@ class Dark():
         ensure_dir_exists(mean_slope_dir)
         output_filename = os.path.join(mean_slope_dir, output_filename)
 
-        primary_hdu = fits.PrimaryHDU()
-        primary_hdu.header['INSTRUME'] = (self.instrument, 'JWST instrument')
-        primary_hdu.header['APERTURE'] = (self.aperture, 'Aperture name')
-        primary_hdu.header['QRY_STRT'] = (self.query_start, 'MAST Query start time (MJD)')
-        primary_hdu.header['QRY_END'] = (self.query_end, 'MAST Query end time (MJD)')
+        header = fits.Header()
+        header['INSTRUME'] = (self.instrument, 'JWST instrument')
+        header['APERTURE'] = (self.aperture, 'Aperture name')
+        header['QRY_STRT'] = (self.query_start, 'MAST Query start time (MJD)')
+        header['QRY_END'] = (self.query_end, 'MAST Query end time (MJD)')
 
         files_string = 'FILES USED: '
         for filename in files:
             files_string += '{}, '.format(filename)
 
-        primary_hdu.header.add_history(files_string)
-        mean_img_hdu = fits.ImageHDU(slope_img, name='MEAN')
-        stdev_img_hdu = fits.ImageHDU(stdev_img, name='STDEV')
-        hdu_list = fits.HDUList([primary_hdu, mean_img_hdu, stdev_img_hdu])
-        hdu_list.writeto(output_filename, overwrite=True)
-        set_permissions(output_filename)
+        header.add_history(files_string)
+        write_compressed_images(output_filename, {'MEAN': slope_img, 'STDEV': stdev_img},
+                                header=header)
 
         return output_filename
 
@@ -883,7 +1281,8 @@ class Dark():
             amp numbers as strings
 
         hist : numpy.ndarray
-            1D array of histogram values
+            1D array of histogram values of the last amp (the full
+            frame, if present)
 
         bin_centers : numpy.ndarray
             1D array of bin centers that match the ``hist`` values.
@@ -912,23 +1311,33 @@ class Dark():
             logging.info(('\tFull frame exposure detected. Adding the full frame to the list '
                           'of amplifiers upon which to calculate statistics.'))
 
+        # Basic statistics, sigma clipped areal mean and stdev
         for key in amps:
             x_start, y_start = amps[key][0]
             x_end, y_end = amps[key][1]
-
-            # Basic statistics, sigma clipped areal mean and stdev
-            amp_mean, amp_stdev = calculations.mean_stdev(image[y_start: y_end, x_start: x_end])
-            amp_means[key] = amp_mean
-            amp_stdevs[key] = amp_stdev
-
-            # Create a histogram
-            lower_bound = (amp_mean - 7 * amp_stdev)
-            upper_bound = (amp_mean + 7 * amp_stdev)
-
-            hist, bin_edges = np.histogram(image[y_start: y_end, x_start: x_end], bins='auto',
-                                           range=(lower_bound, upper_bound))
-            bin_centers = (bin_edges[1:] + bin_edges[0: -1]) / 2.
-            initial_params = [np.max(hist), amp_mean, amp_stdev]
+            amp_means[key], amp_stdevs[key] = calculations.mean_stdev(
+                image[y_start: y_end, x_start: x_end])
+
+        # Create histograms of all amps on a shared grid of bins, that
+        # of the last amp (the full frame, if present) extended to
+        # cover the others. Each amp is fit over its own range.
+        ranges = {key: (amp_means[key] - 7 * amp_stdevs[key], amp_means[key] + 7 * amp_stdevs[key])
+                  for key in amps}
+        last_key = list(amps)[-1]
+        all_hists, all_bin_centers, windows = calculations.region_histograms(image, amps, ranges,
+                                                                             last_key)
+
+        # Initial guesses for the fits, from the moments of each histogram
+        in_window = np.zeros(all_hists.shape, dtype=bool)
+        for i, key in enumerate(amps):
+            in_window[i, windows[key]] = True
+        peaks, moment_means, moment_stdevs = calculations.histogram_moments(
+            np.where(in_window, all_hists, 0), all_bin_centers)
+
+        for i, key in enumerate(amps):
+            hist = all_hists[i, windows[key]]
+            bin_centers = all_bin_centers[windows[key]]
+            initial_params = [peaks[i], moment_means[i], moment_stdevs[i]]
 
             # Fit a Gaussian to the histogram. Save best-fit params and
             # uncertainties, as well as reduced chi squared
@@ -949,8 +1358,8 @@ class Dark():
             # NIRISS, NIRCam at the moment.)
             if key == '5':
                 if self.instrument.upper() in ['NIRISS', 'NIRCAM']:
-                    initial_params = (np.max(hist), amp_mean, amp_stdev * 0.8,
-                                      np.max(hist) / 7., amp_mean / 2., amp_stdev * 0.9)
+                    initial_params = (peaks[i], moment_means[i], moment_stdevs[i] * 0.8,
+                                      peaks[i] / 7., moment_means[i] / 2., moment_stdevs[i] * 0.9)
                     double_gauss_params, double_gauss_sigma = calculations.double_gaussian_fit(bin_centers, hist, initial_params)
                     double_gaussian_params[key] = [[param, sig] for param, sig in zip(double_gauss_params, double_gauss_sigma)]
                     double_gauss_fit = calculations.double_gaussian(bin_centers, *double_gauss_params)
@@ -966,23 +1375,70 @@ class Dark():
                 double_gaussian_chi_squared[key] = 0.
 
         logging.info('\tMean dark rate by amplifier: {}'.format(amp_means))
-        logging.info('\tStandard deviation of dark rate by amplifier: {}'.format(amp_means))
-        logging.info('\tBest-fit Gaussian parameters [amplitude, peak, width]'.format(gaussian_params))
+        logging.info('\tStandard deviation of dark rate by amplifier: {}'.format(amp_stdevs))
+        logging.info('\tBest-fit Gaussian parameters [amplitude, peak, width]: {}'
+                     .format(gaussian_params))
         logging.info('\tReduced chi-squared associated with Gaussian fit: {}'.format(gaussian_chi_squared))
         logging.info('\tBest-fit double Gaussian parameters [amplitude1, peak1, width1, amplitude2, peak2, '
-                     'width2]'.format(double_gaussian_params))
+                     'width2]: {}'.format(double_gaussian_params))
         logging.info('\tReduced chi-squared associated with double Gaussian fit: {}'
                      .format(double_gaussian_chi_squared))
 
         return (amp_means, amp_stdevs, gaussian_params, gaussian_chi_squared, double_gaussian_params,
                 double_gaussian_chi_squared, hist.astype(np.float), bin_centers)
 
+    def update_running_stats(self, slope_images, slope_image):
+        """Fold new slope images into the running per-pixel statistics
+        of the detector, which are kept with the mean slope images.
+
+        Parameters
+        ----------
+        slope_images : list
+            List of slope images to fold in, as arrays or the names of
+            slope files
+
+        slope_image : numpy.ndarray
+            2D mean slope image of the files, whose median is recorded
+            with the update
+
+        Returns
+        -------
+        filename : str
+            Name of fits file containing the running statistics
+        """
+
+        mean_slope_dir = os.path.join(get_config()['outputs'], 'dark_monitor', 'mean_slope_images')
+        ensure_dir_exists(mean_slope_dir)
+        filename = os.path.join(mean_slope_dir, '{}_{}_running_stats.fits'
+                                .format(self.instrument.lower(), self.detector.lower()))
+
+        with RUNNING_STATS_LOCK:
+            if os.path.isfile(filename):
+                running_stats = RunningStats.load(filename)
+            else:
+                running_stats = RunningStats(slope_image.shape)
+
+            for image in slope_images:
+                if isinstance(image, str):
+                    with fits.open(image, memmap=True) as hdu:
+                        image = hdu[1].data
+                running_stats.add(image)
+            running_stats.record_update(self.query_start, self.query_end, len(slope_images),
+                                        np.nanmedian(slope_image))
+            running_stats.save(filename)
+
+        logging.info('\tRunning statistics of {} updated in {}'.format(self.detector, filename))
+
+        return filename
+
 
 if __name__ == '__main__':
 
     module = os.path.basename(__file__).strip('.py')
     start_time, log_file = initialize_instrument_monitor(module)
 
-    monitor = Dark()
+    args = parse_args()
+    monitor = Dark(processes=args.processes, max_memory=args.max_memory, jobs=args.jobs,
+                   instruments=args.instruments)
 
     update_monitor_table(module, start_time, log_file)
@@ -13,13 +13,32 @@ Use
 
         from jwql.instrument_monitors import pipeline_tools
         pipeline_steps = pipeline_tools.completed_pipeline_steps(filename)
+
+    The output of the pipeline can be kept in memory, rather than
+    read back from the file it is saved to:
+    ::
+
+        model, output_filename = pipeline_tools.calwebb_detector1_model(filename, steps)
+        slope_image = model.data
+
+    Outputs are shared between monitors through a cache, from which
+    they are copied if the same steps have already been run on the
+    same file:
+    ::
+
+        output_filename, model = pipeline_tools.calwebb_detector1_cached(filename, steps)
  """
 
 from collections import OrderedDict
 import copy
+import functools
+import os
+import shutil
 import numpy as np
 
 from astropy.io import fits
+import crds
+import jwst
 from jwst.dq_init import DQInitStep
 from jwst.dark_current import DarkCurrentStep
 from jwst.firstframe import FirstFrameStep
@@ -36,6 +55,9 @@ from jwst.saturation import SaturationStep
 from jwst.superbias import SuperBiasStep
 
 from jwql.utils.constants import JWST_INSTRUMENT_NAMES_UPPERCASE
+from jwql.utils.header_store import get_keywords
+from jwql.utils.pipeline_cache import PipelineCache, cache_key
+from jwql.utils.utils import get_config
 
 # Define the fits header keyword that accompanies each step
 PIPE_KEYWORDS = {'S_GRPSCL': 'group_scale', 'S_DQINIT': 'dq_init', 'S_SATURA': 'saturation',
@@ -55,6 +77,131 @@ PIPELINE_STEP_MAPPING = {'dq_init': DQInitStep, 'dark_current': DarkCurrentStep,
 # require the group_scale pipeline step to be run.
 GROUPSCALE_READOUT_PATTERNS = ['NRSIRS2']
 
+# Maximum total size (GB) of the cache of pipeline outputs, unless set
+# by ``pipeline_cache_size`` in the config file
+DEFAULT_PIPELINE_CACHE_SIZE = 100
+
+
+def calwebb_detector1_cached(input_file, steps, cache=None):
+    """Look up the output of running the steps of ``calwebb_detector1``
+    on the input file in the cache of pipeline outputs, or run the steps
+    to produce it. Either way, the output is saved to the same file as
+    by ``run_calwebb_detector1_steps``, and newly produced outputs are
+    added to the cache.
+
+    Parameters
+    ----------
+    input_file : str
+        File on which to run the pipeline steps
+
+    steps : collections.OrderedDict
+        Keys are the individual pipeline steps (as seen in the
+        ``PIPE_KEYWORDS`` values above). Boolean values indicate whether
+        a step should be run or not.
+
+    cache : jwql.utils.pipeline_cache.PipelineCache
+        Cache of pipeline outputs. If ``None``, the cache returned by
+        ``get_pipeline_cache`` is used.
+
+    Returns
+    -------
+    output_filename : str
+        Name of the file the output is saved to
+
+    model : jwst.datamodels.DataModel or None
+        The output, if the pipeline steps were run, or ``None`` if it
+        was copied from the cache
+    """
+
+    if cache is None:
+        cache = get_pipeline_cache()
+
+    key = cache_key(input_file, steps, pipeline_versions())
+    cached_filename = cache.get(key)
+    if cached_filename is not None:
+        output_filename = calwebb_detector1_output_filename(input_file, steps)
+        try:
+            shutil.copyfile(cached_filename, output_filename)
+            return output_filename, None
+        except FileNotFoundError:
+            # The output was evicted by another process in the meantime
+            pass
+
+    model, output_filename = calwebb_detector1_model(input_file, steps)
+    model.save(output_filename)
+    cache.put(key, output_filename)
+
+    return output_filename, model
+
+
+def calwebb_detector1_model(input_file, steps):
+    """Run the steps of ``calwebb_detector1`` specified in the steps
+    dictionary on the input file, and return the resulting data model
+    without saving it
+
+    Parameters
+    ----------
+    input_file : str
+        File on which to run the pipeline steps
+
+    steps : collections.OrderedDict
+        Keys are the individual pipeline steps (as seen in the
+        ``PIPE_KEYWORDS`` values above). Boolean values indicate whether
+        a step should be run or not. Steps are run in the official
+        ``calwebb_detector1`` order.
+
+    Returns
+    -------
+    model : jwst.datamodels.DataModel
+        Output of the last step run. For ``rate``, this is the slope
+        model (rather than the per-integration slope model), whose
+        ``data`` and ``err`` attributes hold the SCI and ERR arrays.
+
+    output_filename : str
+        Name of the file that ``run_calwebb_detector1_steps`` saves the
+        model to
+    """
+
+    first_step_to_be_run = True
+    for step_name in steps:
+        if steps[step_name]:
+            if first_step_to_be_run:
+                model = PIPELINE_STEP_MAPPING[step_name].call(input_file)
+                first_step_to_be_run = False
+            else:
+                model = PIPELINE_STEP_MAPPING[step_name].call(model)
+    output_filename = calwebb_detector1_output_filename(input_file, steps)
+    if output_filename.endswith('_rate.fits'):
+        model = model[0]
+
+    return model, output_filename
+
+
+def calwebb_detector1_output_filename(input_file, steps):
+    """Return the name of the file that the output of running the steps
+    of ``calwebb_detector1`` on the input file is saved to, which is
+    suffixed with the name of the last step run
+
+    Parameters
+    ----------
+    input_file : str
+        File on which to run the pipeline steps
+
+    steps : collections.OrderedDict
+        Keys are the individual pipeline steps (as seen in the
+        ``PIPE_KEYWORDS`` values above). Boolean values indicate whether
+        a step should be run or not.
+
+    Returns
+    -------
+    output_filename : str
+        Name of the output file
+    """
+
+    suffix = [step_name for step_name in steps if steps[step_name]][-1]
+
+    return input_file.replace('.fits', '_{}.fits'.format(suffix))
+
 
 def completed_pipeline_steps(filename):
     """Return a list of the completed pipeline steps for a given file.
@@ -77,7 +224,7 @@ def completed_pipeline_steps(filename):
     for key in PIPE_KEYWORDS.values():
         completed[key] = False
 
-    header = fits.getheader(filename)
+    header = get_keywords(filename, list(PIPE_KEYWORDS.keys()))
     for key in PIPE_KEYWORDS.keys():
         try:
             value = header.get(key)
@@ -89,6 +236,25 @@ def completed_pipeline_steps(filename):
     return completed
 
 
+def get_pipeline_cache():
+    """Return the cache of pipeline outputs shared by the monitors. It
+    is kept in the directory given by ``pipeline_cache`` in the config
+    file (by default, the ``pipeline_cache`` directory of ``outputs``),
+    and limited to the size in GB given by ``pipeline_cache_size``.
+
+    Returns
+    -------
+    cache : jwql.utils.pipeline_cache.PipelineCache
+        The cache of pipeline outputs
+    """
+
+    config = get_config()
+    directory = config.get('pipeline_cache', os.path.join(config['outputs'], 'pipeline_cache'))
+    max_size = float(config.get('pipeline_cache_size', DEFAULT_PIPELINE_CACHE_SIZE))
+
+    return PipelineCache(directory, int(max_size * 2**30))
+
+
 def get_pipeline_steps(instrument):
     """Get the names and order of the ``calwebb_detector1`` pipeline
     steps for a given instrument. Use values that match up with the
@@ -159,6 +325,7 @@ def image_stack(file_list):
         3D stack of the 2D images
     """
 
+    images = []
     exptimes = []
     for i, input_file in enumerate(file_list):
         with fits.open(input_file) as hdu:
@@ -166,28 +333,41 @@ def image_stack(file_list):
             exptime = hdu[0].header['EFFINTTM']
             num_ints = hdu[0].header['NINTS']
 
-        # Stack all inputs together into a single 3D image cube
+        # Check that all inputs can be stacked into a single 3D image cube
         if i == 0:
             ndim_base = image.shape
-            if len(ndim_base) == 3:
-                cube = copy.deepcopy(image)
-            elif len(ndim_base) == 2:
-                cube = np.expand_dims(image, 0)
         else:
             ndim = image.shape
-            if ndim_base[-2:] == ndim[-2:]:
-                if len(ndim) == 2:
-                    image = np.expand_dims(image, 0)
-                elif len(ndim) > 3:
-                    raise ValueError("4-dimensional input slope images not supported.")
-                cube = np.vstack((cube, image))
-            else:
+            if ndim_base[-2:] != ndim[-2:]:
                 raise ValueError("Input images are of inconsistent size in x/y dimension.")
+        if len(image.shape) == 2:
+            image = np.expand_dims(image, 0)
+        elif len(image.shape) > 3:
+            raise ValueError("4-dimensional input slope images not supported.")
+        images.append(image)
         exptimes.append([exptime] * num_ints)
 
+    # Stack all inputs together in one go, rather than growing the cube
+    # (and copying it) with each file
+    cube = np.concatenate(images)
+
     return cube, exptimes
 
 
+@functools.lru_cache()
+def pipeline_versions():
+    """Return the versions that the output of the pipeline depends on:
+    those of the ``jwst`` package and of the CRDS context in use
+
+    Returns
+    -------
+    versions : dict
+        The ``jwst`` version and the name of the CRDS context
+    """
+
+    return {'jwst': jwst.__version__, 'crds_context': crds.get_context_name('jwst')}
+
+
 def run_calwebb_detector1_steps(input_file, steps):
     """Run the steps of ``calwebb_detector1`` specified in the steps
     dictionary on the input file
@@ -202,22 +382,15 @@ def run_calwebb_detector1_steps(input_file, steps):
         ``PIPE_KEYWORDS`` values above). Boolean values indicate whether
         a step should be run or not. Steps are run in the official
         ``calwebb_detector1`` order.
+
+    Returns
+    -------
+    output_filename : str
+        Name of the file the output of the last step was saved to
     """
 
-    first_step_to_be_run = True
-    for step_name in steps:
-        if steps[step_name]:
-            if first_step_to_be_run:
-                model = PIPELINE_STEP_MAPPING[step_name].call(input_file)
-                first_step_to_be_run = False
-            else:
-                model = PIPELINE_STEP_MAPPING[step_name].call(model)
-            suffix = step_name
-    output_filename = input_file.replace('.fits', '_{}.fits'.format(suffix))
-    if suffix != 'rate':
-        model.save(output_filename)
-    else:
-        model[0].save(output_filename)
+    model, output_filename = calwebb_detector1_model(input_file, steps)
+    model.save(output_filename)
 
     return output_filename
 
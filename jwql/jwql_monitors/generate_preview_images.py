@@ -24,21 +24,85 @@ Use
     ::
 
         python generate_preview_images.py
+
+    By default, images are drawn with ``matplotlib``.  To use the faster
+    renderer, which writes the images directly with ``Pillow``:
+
+    ::
+
+        python generate_preview_images.py --renderer fast
+
+    To also save mosaics and stage 3 products as tile pyramids, which
+    the web app displays with a zoomable viewer:
+
+    ::
+
+        python generate_preview_images.py --tiles
+
+    Each exposure group (a single file, or the NIRCam files that are
+    combined into a mosaic) is processed as a separate task, spread
+    over ``cores`` worker processes.  The memory of each worker
+    process can be limited (in GB):
+
+    ::
+
+        python generate_preview_images.py --max-memory 8
+
+    The source files of each completed exposure group are recorded,
+    along with their modification times and the images made from
+    them, in the ``preview_manifest`` database table.  Only the
+    exposure groups with files that are new or have been modified
+    since they were recorded are processed, so an interrupted run can
+    be resumed without redoing completed groups.  By default every
+    program directory is scanned.  In incremental mode, program
+    directories that have not changed since the last run are not
+    scanned at all, so that the cost of a run scales with the amount
+    of new data rather than with the size of the filesystem:
+
+    ::
+
+        python generate_preview_images.py --incremental
+
+    To spread the work over several hosts, one host adds the exposure
+    groups to a queue kept in ``jwql_dir`` (which must be on a
+    filesystem shared by the hosts), and any number of hosts then
+    process groups from the queue until it is empty.  Each host claims
+    a lease on the groups it is processing and renews it while they
+    are in progress.  If a host dies, its leases expire and its groups
+    are taken up by the other hosts.
+
+    ::
+
+        python generate_preview_images.py --incremental --enqueue --worker  # first host
+        python generate_preview_images.py --worker  # other hosts
+
+    The web app adds the files whose preview images a user is waiting
+    for to the same queue with a higher priority (``USER_PRIORITY``),
+    so that workers process them ahead of the backlog.  It also starts
+    a local worker that processes only those files.
 """
 
+import argparse
+from collections import OrderedDict
+from functools import partial
 import glob
 import logging
 import multiprocessing
 import os
 import re
+import time
+import traceback
 
 import numpy as np
 
+from jwql.database.database_interface import session
+from jwql.database.database_interface import PreviewManifest, PreviewManifestDirectory
 from jwql.utils import permissions
 from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
 from jwql.utils.logging_functions import configure_logging, log_info, log_fail
 from jwql.utils.preview_image import PreviewImage
-from jwql.utils.utils import get_config, filename_parser
+from jwql.utils.utils import get_config, filename_parser, group_exposures, limit_process_memory
+from jwql.utils.work_queue import default_worker_name, WorkQueue
 
 # Size of NIRCam inter- and intra-module chip gaps
 SW_MOD_GAP = 1387  # pixels = int(43 arcsec / 0.031 arcsec/pixel)
@@ -47,6 +111,22 @@ SW_DET_GAP = 145  # pixels = int(4.5 arcsec / 0.031 arcsec/pixel)
 FULLX = 2048  # Width of the full detector
 FULLY = 2048  # Height of the full detector
 
+# Number of exposure groups each worker process handles before it is
+# replaced, which returns its memory to the system
+MAX_TASKS_PER_CHILD = 50
+
+# Queue of exposure groups shared by the hosts that generate preview
+# images, the number of seconds that a host's claim on a group lasts
+# without being renewed, and how often (seconds) a host checks on the
+# groups it is processing
+QUEUE_FILE = os.path.join(get_config()['jwql_dir'], 'preview_queue.db')
+LEASE_TIME = 1800
+POLL_INTERVAL = 1
+
+# Priority of the exposure groups requested from the web app, which
+# are processed before those of the bulk backlog
+USER_PRIORITY = 1
+
 
 def array_coordinates(channelmod, detector_list, lowerleft_list):
     """Create an appropriately sized ``numpy`` array to contain the
@@ -277,6 +357,11 @@ def create_mosaic(filenames):
     the appropriate files and create a mosaic so that the preview image
     will show all the data together.
 
+    The data of the individual detectors are memory-mapped rather than
+    read, and the mosaic of each integration is only assembled when it
+    is needed, so that the memory used is about that of a single
+    integration's mosaic.
+
     Parameters
     ----------
     filenames : list
@@ -284,62 +369,54 @@ def create_mosaic(filenames):
 
     Returns
     -------
-    mosaic_filename : str
-        Name of fits file containing the mosaicked data
+    frames : generator
+        Generator of the 2D mosaic of each integration
+    full_dq : obj
+        2D ``numpy`` array containing the DQ array of the mosaic
     """
 
-    # Use preview_image to load data and create difference image
-    # for each detector. Save in a list
-    data = []
+    # Use preview_image to memory-map the data of each detector
+    images = []
     detector = []
     data_lower_left = []
     for filename in filenames:
         image = PreviewImage(filename, "SCI")  # Now have image.data, image.dq
-        data_dim = len(image.data.shape)
-        if data_dim == 4:
-            diff_im = image.difference_image(image.data)
-        else:
-            diff_im = image.data
-        data.append(diff_im)
+        if len(image.data.shape) not in [2, 3, 4]:
+            raise ValueError(('Data for {} must be either 2D, 3D or 4D.'.format(filename)))
+        images.append(image)
         detector.append(filename_parser(filename)['detector'].upper())
         data_lower_left.append((image.xstart, image.ystart))
 
-    # Make sure SW and LW data are not being mixed. Create the
-    # appropriately sized numpy array to hold all the data based
-    # on the channel, module, and subarray size
+    nints = set([1 if len(image.data.shape) == 2 else image.data.shape[0] for image in images])
+    if len(nints) > 1:
+        raise ValueError('Files for {} have different numbers of integrations.'
+                         .format(filenames[0]))
+
+    # Make sure SW and LW data are not being mixed. Find the size of
+    # the array needed to hold all the data based on the channel,
+    # module, and subarray size
     mosaic_channel = find_data_channel(detector)
     full_xdim, full_ydim, full_lower_left = array_coordinates(mosaic_channel, detector,
                                                               data_lower_left)
 
-    # Create the array to hold all the data
-    datashape = data[0].shape
-    datadim = len(datashape)
-    if datadim == 2:
-        full_array = np.zeros((1, full_ydim, full_xdim)) * np.nan
-    elif datadim == 3:
-        full_array = np.zeros((datashape[0], full_ydim, full_xdim)) * np.nan
-    else:
-        raise ValueError(('Difference image for {} must be either 2D or 3D.'.format(filenames[0])))
-
-    # Place the data from the individual detectors in the appropriate
-    # places in the final image
-    for pixdata, detect in zip(data, detector):
+    # Find where the data from the individual detectors are placed in
+    # the final image
+    placements = OrderedDict()
+    for image, detect in zip(images, detector):
         x0, y0 = full_lower_left[detect]
-        if datadim == 2:
-            yd, xd = pixdata.shape
-            full_array[0, y0: y0 + yd, x0: x0 + xd] = pixdata
-        elif datadim == 3:
-            ints, yd, xd = pixdata.shape
-            full_array[:, y0: y0 + yd, x0: x0 + xd] = pixdata
+        yd, xd = image.data.shape[-2:]
+        placements[detect] = (x0, y0, xd, yd)
 
     # Create associated DQ array and set unpopulated pixels to be skipped
     # in preview image scaling
-    full_dq = create_dq_array(full_xdim, full_ydim, full_array[0, :, :], mosaic_channel)
+    full_dq = create_dq_array(full_xdim, full_ydim, placements, mosaic_channel)
+
+    frames = mosaic_frames(images, list(placements.values()), full_xdim, full_ydim)
 
-    return full_array, full_dq
+    return frames, full_dq
 
 
-def create_dq_array(xd, yd, mosaic, module):
+def create_dq_array(xd, yd, placements, module):
     """Create DQ array that goes with the mosaic image. Set unpopulated
     pixels to be skipped in preview image scaling. Same for the
     reference pixels for all detectors
@@ -352,8 +429,10 @@ def create_dq_array(xd, yd, mosaic, module):
     yd : int
         Y-coordinate dimension of the DQ array
 
-    mosaic : obj
-        2D ``numpy`` array containing the mosaic image
+    placements : dict
+        The ``(x, y, xdim, ydim)`` lower left corner and dimensions of
+        the data from each detector within the mosaic, keyed by
+        detector
 
     module : str
         Module used for mosaic. Options are ``LW``,`` SW``, ``SWA``,
@@ -368,11 +447,11 @@ def create_dq_array(xd, yd, mosaic, module):
         skipped.
     """
 
-    # Create array
-    dq = np.ones((yd, xd), dtype="bool")
-
-    # Flag inter-chip and inter-module pixels as False
-    dq[np.isnan(mosaic)] = 0
+    # Create array, with the inter-chip and inter-module pixels
+    # flagged as False
+    dq = np.zeros((yd, xd), dtype="bool")
+    for x0, y0, xlen, ylen in placements.values():
+        dq[y0: y0 + ylen, x0: x0 + xlen] = 1
 
     # Flag reference pixels as False
 
@@ -407,14 +486,12 @@ def create_dq_array(xd, yd, mosaic, module):
 
     else:
         # Subarrays: expand the pixels flagged due to chip gaps
-        # by one row and column
-        nan_indexes = np.where(np.isnan(mosaic))
-        match = nan_indexes[0] == yd - 1
-        vert_xmin = np.min(nan_indexes[1][match])
+        # by one row and column. The gaps begin at the upper and
+        # right edges of the detector in the lower left corner.
+        vert_xmin = min([x0 + xlen for x0, y0, xlen, ylen in placements.values() if x0 == 0])
         vert_xmax = vert_xmin + SW_DET_GAP - 1
 
-        match2 = nan_indexes[1] == xd - 1
-        horiz_ymin = np.min(nan_indexes[0][match2])
+        horiz_ymin = min([y0 + ylen for x0, y0, xlen, ylen in placements.values() if y0 == 0])
         horiz_ymax = horiz_ymin + SW_DET_GAP - 1
 
         dq[:, vert_xmin - 4:vert_xmin] = 0
@@ -451,6 +528,41 @@ def detector_check(detector_list, search_string):
     return total
 
 
+def enqueue_groups(queue, groups, file_mtimes, priority=0):
+    """Add exposure groups to the shared work queue.  Each group is
+    keyed by the names of its files, which are also made the members of
+    its task, so that the task can be found from any of its files.
+
+    Parameters
+    ----------
+    queue : jwql.utils.work_queue.WorkQueue
+        The shared work queue
+    groups : list
+        The exposure groups, as ``(file_list, overwrite)`` tuples (see
+        ``scan_program``)
+    file_mtimes : dict
+        Modification times of the files in ``groups``, keyed by path
+    priority : int
+        Priority of the exposure groups in the queue
+
+    Returns
+    -------
+    added : int
+        The number of exposure groups added to the queue
+    """
+
+    tasks = OrderedDict()
+    members = {}
+    for file_list, overwrite in groups:
+        basenames = sorted([os.path.basename(filename) for filename in file_list])
+        key = ','.join(basenames)
+        tasks[key] = {'files': file_list, 'overwrite': overwrite,
+                      'mtimes': [file_mtimes[filename] for filename in file_list]}
+        members[key] = basenames
+
+    return queue.add(tasks, priority=priority, members=members)
+
+
 def find_data_channel(detectors):
     """Using a list of detectors, identify the channel(s) that the data
     are from.
@@ -497,6 +609,55 @@ def find_data_channel(detectors):
     return channel
 
 
+def find_new_groups(filesystem, incremental=False):
+    """Find the exposure groups in the filesystem that contain files
+    that are not in the ``preview_manifest`` table, or that have been
+    modified since they were recorded.
+
+    Parameters
+    ----------
+    filesystem : str
+        Path to the top level of the filesystem
+    incremental : bool
+        If ``True``, program directories whose modification time is
+        unchanged since they were recorded in the
+        ``preview_manifest_directory`` table are not scanned
+
+    Returns
+    -------
+    groups : list
+        The exposure groups to process, as ``(file_list, overwrite)``
+        tuples (see ``scan_program``)
+    file_mtimes : dict
+        Modification times of the files in ``groups``, keyed by path
+    directories : dict
+        Modification times of the scanned program directories, keyed by
+        directory name
+    """
+
+    stored_directories = dict(session.query(PreviewManifestDirectory.directory,
+                                            PreviewManifestDirectory.mtime).all())
+
+    groups, file_mtimes, directories = [], {}, {}
+    for entry in sorted(os.scandir(filesystem), key=lambda entry: entry.name):
+        if not entry.is_dir():
+            continue
+        mtime = entry.stat().st_mtime
+        if incremental and stored_directories.get(entry.name) == mtime:
+            continue
+        directories[entry.name] = mtime
+
+        stored_mtimes = dict(session.query(PreviewManifest.filename, PreviewManifest.mtime)
+                             .filter(PreviewManifest.directory == entry.name).all())
+        program_groups, program_mtimes = scan_program(entry.path, stored_mtimes)
+        groups.extend(program_groups)
+        file_mtimes.update(program_mtimes)
+
+    logging.info('Scanned {} program directories'.format(len(directories)))
+
+    return groups, file_mtimes, directories
+
+
 def get_base_output_name(filename_dict):
     """Returns the base output name used for preview images and
     thumbnails.
@@ -524,19 +685,70 @@ def get_base_output_name(filename_dict):
 
 @log_fail
 @log_info
-def generate_preview_images():
+def generate_preview_images(renderer='matplotlib', max_memory=None, incremental=False,
+                            enqueue=False, worker=False, tiles=False):
     """The main function of the ``generate_preview_image`` module.
-    See module docstring for further details."""
+    See module docstring for further details.
+
+    Parameters
+    ----------
+    renderer : str
+        The ``PreviewImage`` renderer to use (``matplotlib`` or
+        ``fast``)
+    max_memory : float
+        Maximum memory (GB) that each worker process may use.  If
+        ``None``, the memory is not limited.
+    incremental : bool
+        If ``True``, only the program directories that have changed
+        since the last run are scanned for new or modified files
+    enqueue : bool
+        If ``True``, the exposure groups with new or modified files are
+        added to the queue shared by all hosts, instead of being
+        processed directly
+    worker : bool
+        If ``True``, exposure groups are taken from the shared queue
+        and processed until the queue is empty
+    tiles : bool
+        If ``True``, images of large mosaics and stage 3 products are
+        also saved as tile pyramids
+    """
 
     # Begin logging
     logging.info("Beginning the script run")
 
-    # Process programs in parallel
-    program_list = [os.path.basename(item) for item in glob.glob(os.path.join(get_config()['filesystem'], '*'))]
-    pool = multiprocessing.Pool(processes=int(get_config()['cores']))
-    pool.map(process_program, program_list)
-    pool.close()
-    pool.join()
+    if enqueue or worker:
+        queue = WorkQueue(QUEUE_FILE, lease_time=LEASE_TIME)
+
+        # Add the exposure groups with new or modified files to the
+        # shared queue.  The queue now holds the outstanding work for
+        # the scanned directories, so they are recorded as scanned.
+        if enqueue:
+            groups, file_mtimes, directories = find_new_groups(get_config()['filesystem'],
+                                                               incremental=incremental)
+            groups.sort(key=lambda group: len(group[0]), reverse=True)
+            added = enqueue_groups(queue, groups, file_mtimes)
+            record_directories(directories)
+            logging.info('Added {} exposure groups to the queue'.format(added))
+
+        if worker:
+            run_worker(queue, renderer=renderer, max_memory=max_memory, tiles=tiles)
+        logging.info('Queue status: {}'.format(queue.counts()))
+
+    else:
+        # Find the exposure groups with new or modified files and
+        # process them on this host
+        groups, file_mtimes, directories = find_new_groups(get_config()['filesystem'],
+                                                           incremental=incremental)
+        groups.sort(key=lambda group: len(group[0]), reverse=True)
+        failed_directories = process_groups(groups, file_mtimes, renderer=renderer,
+                                            max_memory=max_memory, tiles=tiles)
+
+        # Directories with failed groups are scanned again on the next run
+        for directory in failed_directories:
+            del directories[directory]
+        record_directories(directories)
+        logging.info('{} directories contained exposure groups that failed'
+                     .format(len(failed_directories)))
 
     # Complete logging:
     logging.info("Completed.")
@@ -552,6 +764,7 @@ def group_filenames(filenames):
     a given exposure will be kept separate from one another and no
     mosaic will be made.  Stage 3 files will remain as individual
     files, and will not be grouped together with any other files.
+    See ``jwql.utils.utils.group_exposures``.
 
     Parameters
     ----------
@@ -566,138 +779,469 @@ def group_filenames(filenames):
         information.
     """
 
-    # Some initializations
-    grouped, matched_names = [], []
-    filenames.sort()
+    return group_exposures(filenames)
 
-    # Loop over each file in the list of good files
-    for filename in filenames:
 
-        # Holds list of matching files for exposure
-        subgroup = []
+def mosaic_frames(images, placements, xdim, ydim):
+    """Generate the mosaic of each integration in turn. The mosaic is
+    preallocated once, with unpopulated pixels set to ``NaN``, and is
+    filled in one detector at a time for each integration. The same
+    array is therefore yielded for every integration, and is
+    overwritten when the next integration is generated.
 
-        # Generate string to be matched with other filenames
-        filename_dict = filename_parser(os.path.basename(filename))
+    Parameters
+    ----------
+    images : list
+        The ``PreviewImage`` of each detector
+    placements : list
+        The ``(x, y, xdim, ydim)`` lower left corner and dimensions of
+        the data from each detector within the mosaic
+    xdim : int
+        X-coordinate dimension of the mosaic
+    ydim : int
+        Y-coordinate dimension of the mosaic
 
-        # If the filename was already involved in a match, then skip
-        if filename not in matched_names:
+    Yields
+    ------
+    mosaic : obj
+        2D ``numpy`` array of 32-bit floats containing the mosaic of
+        one integration
+    """
 
-            # For stage 3 filenames, treat individually
-            if 'stage_3' in filename_dict['filename_type']:
-                matched_names.append(filename)
-                subgroup.append(filename)
+    detector_frames = [image.integration_frames() for image in images]
+    nints = 1 if len(images[0].data.shape) == 2 else images[0].data.shape[0]
+    mosaic = np.full((ydim, xdim), np.nan, dtype=np.float32)
+    for integration in range(nints):
+        for frames, (x0, y0, xlen, ylen) in zip(detector_frames, placements):
+            mosaic[y0: y0 + ylen, x0: x0 + xlen] = next(frames)
+        yield mosaic
 
-            # Group together stage 1 and 2 filenames
-            elif filename_dict['filename_type'] == 'stage_1_and_2':
 
-                # Determine detector naming convention
-                if filename_dict['detector'].upper() in NIRCAM_SHORTWAVE_DETECTORS:
-                    detector_str = 'NRC[AB][1234]'
-                elif filename_dict['detector'].upper() in NIRCAM_LONGWAVE_DETECTORS:
-                    detector_str = 'NRC[AB]5'
-                else:  # non-NIRCam detectors
-                    detector_str = filename_dict['detector'].upper()
+def parse_args():
+    """Parse command line arguments
 
-                # Build pattern to match against
-                base_output_name = get_base_output_name(filename_dict)
-                match_str = '{}{}_{}.fits'.format(base_output_name, detector_str, filename_dict['suffix'])
-                match_str = os.path.join(os.path.dirname(filename), match_str)
-                pattern = re.compile(match_str, re.IGNORECASE)
+    Returns
+    -------
+    args : obj
+        The parsed command line arguments
+    """
 
-                # Try to match the substring to each good file
-                for file_to_match in filenames:
-                    if pattern.match(file_to_match) is not None:
-                        matched_names.append(file_to_match)
-                        subgroup.append(file_to_match)
+    parser = argparse.ArgumentParser(description='Generate preview images and thumbnails')
+    parser.add_argument('--renderer', choices=['matplotlib', 'fast'], default='matplotlib',
+                        help='How the images are rendered')
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='Maximum memory (GB) used by each worker process')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only scan program directories that have changed since the last run')
+    parser.add_argument('--enqueue', action='store_true',
+                        help='Add new or modified exposure groups to the queue shared by all hosts')
+    parser.add_argument('--worker', action='store_true',
+                        help='Process exposure groups from the queue shared by all hosts')
+    parser.add_argument('--tiles', action='store_true',
+                        help=('Also save large mosaics and stage 3 products as zoomable tile '
+                              'pyramids'))
+    args = parser.parse_args()
+
+    return args
+
+
+def process_group(file_list, renderer='matplotlib', overwrite=False, tiles=False):
+    """Generate the preview images and thumbnails for a single
+    exposure group (as returned by ``group_filenames``), making a
+    mosaic if the group contains more than one file.
 
-        if len(subgroup) > 0:
-            grouped.append(subgroup)
+    Parameters
+    ----------
+    file_list : list
+        The files in the exposure group
+    renderer : str
+        The ``PreviewImage`` renderer to use (``matplotlib`` or
+        ``fast``)
+    overwrite : bool
+        If ``True``, the images are generated even if preview images
+        for the group already exist
+    tiles : bool
+        If ``True``, the images of mosaics of more than one file, and
+        of stage 3 products, are also saved as tile pyramids.  The
+        preview images of mosaics are then kept to the standard size.
 
-    return grouped
+    Returns
+    -------
+    outputs : list
+        The preview images and thumbnails that were generated
+    """
 
+    filename = file_list[0]
+
+    # Determine the save location
+    try:
+        identifier = 'jw{}'.format(filename_parser(filename)['program_id'])
+    except ValueError:
+        identifier = os.path.basename(filename).split('.fits')[0]
+    preview_output_directory = os.path.join(get_config()['preview_image_filesystem'], identifier)
+    thumbnail_output_directory = os.path.join(get_config()['thumbnail_filesystem'], identifier)
+
+    # Check to see if the preview images already exist and skip if they do
+    file_exists = check_existence(file_list, preview_output_directory)
+    if file_exists and not overwrite:
+        logging.info("JPG already exists for {}, skipping.".format(filename))
+        return []
+
+    # Create the output directories if necessary
+    if not os.path.exists(preview_output_directory):
+        os.makedirs(preview_output_directory)
+        permissions.set_permissions(preview_output_directory)
+        logging.info('Created directory {}'.format(preview_output_directory))
+    if not os.path.exists(thumbnail_output_directory):
+        os.makedirs(thumbnail_output_directory)
+        permissions.set_permissions(thumbnail_output_directory)
+        logging.info('Created directory {}'.format(thumbnail_output_directory))
+
+    # If the exposure contains more than one file (because more
+    # than one detector was used), then create a mosaic
+    max_size = 8
+    numfiles = len(file_list)
+    if numfiles > 1:
+        try:
+            mosaic_integrations, mosaic_dq = create_mosaic(file_list)
+            logging.info('Created mosiac for:')
+            for item in file_list:
+                logging.info('\t{}'.format(item))
+        except (ValueError, FileNotFoundError) as error:
+            logging.error(error)
+            return []
+        dummy_file = create_dummy_filename(file_list)
+        if numfiles in [2, 4]:
+            max_size = 16
+        elif numfiles in [8]:
+            max_size = 32
+
+    # Large mosaics and stage 3 products can be zoomed through their
+    # tile pyramids, so their preview images do not need to be larger
+    # than usual
+    try:
+        stage_3 = 'stage_3' in filename_parser(filename)['filename_type']
+    except ValueError:
+        stage_3 = False
+    make_tiles = tiles and (numfiles > 1 or stage_3)
+    if make_tiles:
+        max_size = 8
 
-def process_program(program):
-    """Generate preview images and thumbnails for the given program.
+    # Create the nominal preview image and thumbnail. The integrations
+    # of a mosaic are read while the images are made, so errors in
+    # reading them are caught here too.
+    try:
+        im = PreviewImage(filename, "SCI")
+        im.clip_percent = 0.01
+        im.scaling = 'log'
+        im.cmap = 'viridis'
+        im.output_format = 'jpg'
+        im.renderer = renderer
+        im.tiles = make_tiles
+        im.preview_output_directory = preview_output_directory
+        im.thumbnail_output_directory = thumbnail_output_directory
+
+        # If a mosaic was made from more than one file
+        # insert its associated DQ array into the instance
+        # of PreviewImage, and make the images from its
+        # integrations. Also set the input filename to
+        # indicate that we have mosaicked data
+        frames = None
+        if numfiles != 1:
+            frames = mosaic_integrations
+            im.dq = mosaic_dq
+            im.file = dummy_file
+
+        im.make_image(max_img_size=max_size, frames=frames)
+        logging.info('Created preview image and thumbnail for: {}'.format(filename))
+    except (ValueError, FileNotFoundError) as error:
+        logging.warning(error)
+        return []
+
+    return im.preview_images + im.thumbnail_images + im.tile_images
+
+
+def process_group_task(group, renderer='matplotlib', tiles=False):
+    """Wrapper around ``process_group`` for use with a
+    ``multiprocessing`` pool.  Errors are logged and reported back
+    rather than raised, so that a failure affects only its own
+    exposure group.
 
     Parameters
     ----------
-    program : str
-        The program identifier (e.g. ``88600``)
+    group : tuple
+        The files in the exposure group, and whether existing preview
+        images should be overwritten (see ``scan_program``)
+    renderer : str
+        The ``PreviewImage`` renderer to use (``matplotlib`` or
+        ``fast``)
+    tiles : bool
+        If ``True``, large images are also saved as tile pyramids
+
+    Returns
+    -------
+    file_list : list
+        The files in the exposure group
+    outputs : list or None
+        The preview images and thumbnails that were generated, or
+        ``None`` if the exposure group could not be processed
     """
 
-    # Group together common exposures
-    filenames = glob.glob(os.path.join(get_config()['filesystem'], program, '*.fits'))
-    grouped_filenames = group_filenames(filenames)
-    logging.info('Found {} filenames'.format(len(filenames)))
+    file_list, overwrite = group
+    try:
+        outputs = process_group(file_list, renderer=renderer, overwrite=overwrite, tiles=tiles)
+    except Exception:
+        logging.error('Failed to process exposure group {}:\n{}'.format(
+            ', '.join(file_list), traceback.format_exc()))
+        outputs = None
 
-    for file_list in grouped_filenames:
-        filename = file_list[0]
+    return file_list, outputs
 
-        # Determine the save location
-        try:
-            identifier = 'jw{}'.format(filename_parser(filename)['program_id'])
-        except ValueError:
-            identifier = os.path.basename(filename).split('.fits')[0]
-        preview_output_directory = os.path.join(get_config()['preview_image_filesystem'], identifier)
-        thumbnail_output_directory = os.path.join(get_config()['thumbnail_filesystem'], identifier)
-
-        # Check to see if the preview images already exist and skip if they do
-        file_exists = check_existence(file_list, preview_output_directory)
-        if file_exists:
-            logging.info("JPG already exists for {}, skipping.".format(filename))
+
+def process_groups(groups, file_mtimes, renderer='matplotlib', max_memory=None, tiles=False):
+    """Process exposure groups in parallel on this host, one group per
+    task, recording each group in the manifest as it completes.
+
+    Parameters
+    ----------
+    groups : list
+        The exposure groups, as ``(file_list, overwrite)`` tuples (see
+        ``scan_program``)
+    file_mtimes : dict
+        Modification times of the files in ``groups``, keyed by path
+    renderer : str
+        The ``PreviewImage`` renderer to use (``matplotlib`` or
+        ``fast``)
+    max_memory : float
+        Maximum memory (GB) that each worker process may use
+    tiles : bool
+        If ``True``, large images are also saved as tile pyramids
+
+    Returns
+    -------
+    failed_directories : set
+        The program directories containing groups that failed
+    """
+
+    pool = multiprocessing.Pool(processes=int(get_config()['cores']),
+                                initializer=limit_process_memory, initargs=(max_memory,),
+                                maxtasksperchild=MAX_TASKS_PER_CHILD)
+    start_time = time.time()
+    number_done, failed_directories = 0, set()
+    task = partial(process_group_task, renderer=renderer, tiles=tiles)
+    for file_list, outputs in pool.imap_unordered(task, groups):
+        number_done += 1
+        if outputs is None:
+            failed_directories.add(os.path.basename(os.path.dirname(file_list[0])))
+        else:
+            record_group(file_list, file_mtimes, outputs)
+
+        # Report progress
+        if number_done % max(1, len(groups) // 100) == 0 or number_done == len(groups):
+            elapsed = time.time() - start_time
+            remaining = elapsed / number_done * (len(groups) - number_done)
+            logging.info('Processed {}/{} exposure groups, {:.1f} groups/minute, '
+                         '{:.0f} minutes remaining'
+                         .format(number_done, len(groups), number_done / elapsed * 60,
+                                 remaining / 60))
+    pool.close()
+    pool.join()
+
+    return failed_directories
+
+
+def record_directories(directories):
+    """Record the modification times of program directories in the
+    ``preview_manifest_directory`` table.
+
+    Parameters
+    ----------
+    directories : dict
+        Modification times keyed by directory name
+    """
+
+    if not directories:
+        return
+
+    session.query(PreviewManifestDirectory)\
+        .filter(PreviewManifestDirectory.directory.in_(list(directories)))\
+        .delete(synchronize_session=False)
+    session.execute(PreviewManifestDirectory.__table__.insert(),
+                    [{'directory': directory, 'mtime': mtime}
+                     for directory, mtime in directories.items()])
+    session.commit()
+
+
+def record_group(file_list, file_mtimes, outputs):
+    """Record the files of a completed exposure group in the
+    ``preview_manifest`` table.
+
+    Parameters
+    ----------
+    file_list : list
+        The files in the exposure group
+    file_mtimes : dict
+        Modification times of the files when they were found, keyed
+        by path.  Files modified since then are processed again on the
+        next run.
+    outputs : list
+        The preview images and thumbnails made from the group
+    """
+
+    filenames = [os.path.basename(filename) for filename in file_list]
+    records = [{'filename': os.path.basename(filename),
+                'directory': os.path.basename(os.path.dirname(filename)),
+                'mtime': file_mtimes[filename],
+                'outputs': ','.join(outputs)} for filename in file_list]
+
+    session.query(PreviewManifest).filter(PreviewManifest.filename.in_(filenames))\
+        .delete(synchronize_session=False)
+    session.execute(PreviewManifest.__table__.insert(), records)
+    session.commit()
+
+
+def render_requested_groups(linger=0):
+    """Process the exposure groups requested from the web app (see
+    ``USER_PRIORITY``) with the ``fast`` renderer, leaving the bulk
+    backlog to the other workers.  This is run in a separate process
+    started by the web app.
+
+    Parameters
+    ----------
+    linger : float
+        Number of seconds to wait for new requests once there are none
+        left before stopping
+    """
+
+    queue = WorkQueue(QUEUE_FILE, lease_time=LEASE_TIME)
+    run_worker(queue, renderer='fast', min_priority=USER_PRIORITY, linger=linger)
+
+
+def run_worker(queue, renderer='matplotlib', max_memory=None, tiles=False, min_priority=None,
+               linger=0):
+    """Take exposure groups from the shared work queue and process
+    them on this host until the queue is empty.  Each of the ``cores``
+    worker processes works on one group at a time, and the leases on
+    the groups in progress are renewed periodically so that other
+    hosts do not claim them.  Groups with higher priorities (e.g.
+    those requested from the web app) are processed first.
+
+    Parameters
+    ----------
+    queue : jwql.utils.work_queue.WorkQueue
+        The shared work queue
+    renderer : str
+        The ``PreviewImage`` renderer to use (``matplotlib`` or
+        ``fast``)
+    max_memory : float
+        Maximum memory (GB) that each worker process may use
+    tiles : bool
+        If ``True``, large images are also saved as tile pyramids
+    min_priority : int
+        If given, only groups with at least this priority are
+        processed
+    linger : float
+        Number of seconds to wait for new groups once the queue is
+        empty before stopping
+    """
+
+    worker = default_worker_name()
+    processes = int(get_config()['cores'])
+    pool = multiprocessing.Pool(processes=processes, initializer=limit_process_memory,
+                                initargs=(max_memory,), maxtasksperchild=MAX_TASKS_PER_CHILD)
+    logging.info('Worker {} started'.format(worker))
+
+    running = {}
+    last_heartbeat = time.time()
+    last_claim = time.time()
+    number_done, number_failed = 0, 0
+    while True:
+
+        # Keep every worker process busy
+        while len(running) < processes:
+            task = queue.claim(worker, min_priority=min_priority)
+            if task is None:
+                break
+            last_claim = time.time()
+            task_id, _, payload = task
+            result = pool.apply_async(process_group_task,
+                                      ((payload['files'], payload['overwrite']),),
+                                      {'renderer': renderer, 'tiles': tiles})
+            running[task_id] = (payload, result)
+        if not running:
+            if time.time() - last_claim >= linger:
+                break
+            time.sleep(POLL_INTERVAL)
             continue
 
-        # Create the output directories if necessary
-        if not os.path.exists(preview_output_directory):
-            os.makedirs(preview_output_directory)
-            permissions.set_permissions(preview_output_directory)
-            logging.info('Created directory {}'.format(preview_output_directory))
-        if not os.path.exists(thumbnail_output_directory):
-            os.makedirs(thumbnail_output_directory)
-            permissions.set_permissions(thumbnail_output_directory)
-            logging.info('Created directory {}'.format(thumbnail_output_directory))
-
-        # If the exposure contains more than one file (because more
-        # than one detector was used), then create a mosaic
-        max_size = 8
-        numfiles = len(file_list)
-        if numfiles > 1:
-            try:
-                mosaic_image, mosaic_dq = create_mosaic(file_list)
-                logging.info('Created mosiac for:')
-                for item in file_list:
-                    logging.info('\t{}'.format(item))
-            except (ValueError, FileNotFoundError) as error:
-                logging.error(error)
-            dummy_file = create_dummy_filename(file_list)
-            if numfiles in [2, 4]:
-                max_size = 16
-            elif numfiles in [8]:
-                max_size = 32
-
-        # Create the nominal preview image and thumbnail
-        try:
-            im = PreviewImage(filename, "SCI")
-            im.clip_percent = 0.01
-            im.scaling = 'log'
-            im.cmap = 'viridis'
-            im.output_format = 'jpg'
-            im.preview_output_directory = preview_output_directory
-            im.thumbnail_output_directory = thumbnail_output_directory
-
-            # If a mosaic was made from more than one file
-            # insert it and it's associated DQ array into the
-            # instance of PreviewImage. Also set the input
-            # filename to indicate that we have mosaicked data
-            if numfiles != 1:
-                im.data = mosaic_image
-                im.dq = mosaic_dq
-                im.file = dummy_file
-
-            im.make_image(max_img_size=max_size)
-            logging.info('Created preview image and thumbnail for: {}'.format(filename))
-        except ValueError as error:
-            logging.warning(error)
+        # Record the completed groups and release them
+        finished = [task_id for task_id, (_, result) in running.items() if result.ready()]
+        for task_id in finished:
+            payload, result = running.pop(task_id)
+            file_list, outputs = result.get()
+            if outputs is None:
+                number_failed += 1
+            else:
+                record_group(file_list, dict(zip(payload['files'], payload['mtimes'])), outputs)
+                number_done += 1
+            if not queue.complete(task_id, worker, success=outputs is not None):
+                logging.warning('Lease on exposure group {} was lost before it completed'
+                                .format(task_id))
+
+        # Renew the leases on the groups in progress
+        if time.time() - last_heartbeat > queue.lease_time / 3:
+            for task_id in running:
+                if not queue.heartbeat(task_id, worker):
+                    logging.warning('Lease on exposure group {} was lost'.format(task_id))
+            last_heartbeat = time.time()
+            logging.info('Worker {} has processed {} exposure groups ({} failed)'.format(
+                worker, number_done, number_failed))
+
+        if not finished:
+            time.sleep(POLL_INTERVAL)
+
+    pool.close()
+    pool.join()
+    logging.info('Worker {} processed {} exposure groups ({} failed)'
+                 .format(worker, number_done, number_failed))
+
+
+def scan_program(program_dir, stored_mtimes):
+    """Find the exposure groups in a program directory that contain
+    files that are new or have been modified since they were recorded.
+
+    Parameters
+    ----------
+    program_dir : str
+        Path to the program directory
+    stored_mtimes : dict
+        Recorded modification times of the files in the directory,
+        keyed by filename
+
+    Returns
+    -------
+    groups : list
+        The exposure groups to process, as ``(file_list, overwrite)``
+        tuples.  ``overwrite`` is ``True`` if any file in the group
+        has been recorded before, in which case existing preview
+        images of the group are out of date.
+    file_mtimes : dict
+        Modification times of the files in the directory, keyed by path
+    """
+
+    file_mtimes = {entry.path: entry.stat().st_mtime for entry in os.scandir(program_dir)
+                   if entry.name.endswith('.fits') and entry.is_file()}
+
+    groups = []
+    for file_list in group_filenames(sorted(file_mtimes)):
+        filenames = [os.path.basename(filename) for filename in file_list]
+        if all([stored_mtimes.get(name) == file_mtimes[filename]
+                for name, filename in zip(filenames, file_list)]):
+            continue
+        overwrite = any([name in stored_mtimes for name in filenames])
+        groups.append((file_list, overwrite))
+
+    return groups, file_mtimes
 
 
 if __name__ == '__main__':
@@ -705,4 +1249,7 @@ if __name__ == '__main__':
     module = os.path.basename(__file__).strip('.py')
     configure_logging(module)
 
-    generate_preview_images()
+    args = parse_args()
+    generate_preview_images(renderer=args.renderer, max_memory=args.max_memory,
+                            incremental=args.incremental, enqueue=args.enqueue, worker=args.worker,
+                            tiles=args.tiles)
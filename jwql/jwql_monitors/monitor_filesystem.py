@@ -27,6 +27,16 @@ Use
       - ``filesystem`` - The path to the filesystem
       - ``outputs`` - The path to where the output plots will be
                       written
+      - ``cores`` - The number of processes used to walk the
+                    filesystem
+
+    Each run also updates the catalog of FITS files kept by
+    ``jwql.utils.file_catalog``.
+
+    The counts and sizes of the files in each directory are saved to
+    ``outputs/monitor_filesystem/directory_snapshots.json``.  On
+    subsequent runs, only directories whose modification times have
+    changed are rescanned.
 
 Dependencies
 ------------
@@ -38,7 +48,9 @@ Dependencies
 from collections import defaultdict
 import datetime
 import itertools
+import json
 import logging
+import multiprocessing
 import os
 import subprocess
 
@@ -51,19 +63,74 @@ from jwql.database.database_interface import engine
 from jwql.database.database_interface import session
 from jwql.database.database_interface import FilesystemGeneral
 from jwql.database.database_interface import FilesystemInstrument
+from jwql.utils.file_catalog import update_catalog
 from jwql.utils.logging_functions import configure_logging, log_info, log_fail
 from jwql.utils.permissions import set_permissions
 from jwql.utils.constants import FILE_SUFFIX_TYPES, JWST_INSTRUMENT_NAMES, JWST_INSTRUMENT_NAMES_MIXEDCASE
-from jwql.utils.utils import filename_parser
+from jwql.utils.utils import ensure_dir_exists
+from jwql.utils.utils import filename_parser_batch
 from jwql.utils.utils import get_config
 
 FILESYSTEM = get_config()['filesystem']
+SNAPSHOT_FILE = os.path.join(get_config()['outputs'], 'monitor_filesystem',
+                             'directory_snapshots.json')
+
+
+def aggregate_snapshots(snapshots, general_results_dict, instrument_results_dict):
+    """Sum the per-directory snapshots into the statistics stored in
+    the database
+
+    Parameters
+    ----------
+    snapshots : dict
+        Per-directory snapshots, as returned by ``scan_directory``,
+        keyed by the path of the directory relative to the filesystem
+    general_results_dict : dict
+        A dictionary for the ``filesystem_general`` database table
+    instrument_results_dict : dict
+        A dictionary for the ``filesystem_instrument`` database table
+
+    Returns
+    -------
+    general_results_dict : dict
+        A dictionary for the ``filesystem_general`` database table
+    instrument_results_dict : dict
+        A dictionary for the ``filesystem_instrument`` database table
+    """
+
+    for snapshot in snapshots.values():
+        general_results_dict['total_file_count'] += snapshot['total_file_count']
+        general_results_dict['total_file_size'] += snapshot['total_file_size']
+        general_results_dict['fits_file_count'] += snapshot['fits_file_count']
+        general_results_dict['fits_file_size'] += snapshot['fits_file_size']
+
+        for instrument in snapshot['instruments']:
+            if instrument not in instrument_results_dict:
+                instrument_results_dict[instrument] = {}
+            for filetype, stats in snapshot['instruments'][instrument].items():
+                if filetype not in instrument_results_dict[instrument]:
+                    instrument_results_dict[instrument][filetype] = {}
+                    instrument_results_dict[instrument][filetype]['count'] = 0
+                    instrument_results_dict[instrument][filetype]['size'] = 0
+                instrument_results_dict[instrument][filetype]['count'] += stats['count']
+                instrument_results_dict[instrument][filetype]['size'] += stats['size'] / (2**40)
+
+    # Convert file sizes to terabytes
+    general_results_dict['total_file_size'] = general_results_dict['total_file_size'] / (2**40)
+    general_results_dict['fits_file_size'] = general_results_dict['fits_file_size'] / (2**40)
+
+    return general_results_dict, instrument_results_dict
 
 
 def gather_statistics(general_results_dict, instrument_results_dict):
     """Walks the filesytem to gather various statistics to eventually
     store in the database
 
+    Each program directory at the top of the filesystem is walked by a
+    separate worker process.  Directories whose modification time has
+    not changed since the previous run are not rescanned; their counts
+    and sizes are taken from the snapshot saved by that run.
+
     Parameters
     ----------
     general_results_dict : dict
@@ -81,37 +148,33 @@ def gather_statistics(general_results_dict, instrument_results_dict):
 
     logging.info('Searching filesystem...')
 
-    for dirpath, _, files in os.walk(FILESYSTEM):
-        general_results_dict['total_file_count'] += len(files)
-        for filename in files:
+    previous_snapshots = load_snapshots()
 
-            file_path = os.path.join(dirpath, filename)
-            general_results_dict['total_file_size'] += os.path.getsize(file_path)
+    # The top level of the filesystem is handled here, and each of its
+    # subdirectories is walked by a worker
+    snapshots = walk_directory_tree((FILESYSTEM, '', previous_snapshots, False))
+    subdirectories = snapshots['']['subdirectories']
 
-            if filename.endswith(".fits"):
+    tasks = []
+    for subdirectory in subdirectories:
+        previous = {path: snapshot for path, snapshot in previous_snapshots.items()
+                    if path == subdirectory or path.startswith(subdirectory + os.sep)}
+        tasks.append((FILESYSTEM, subdirectory, previous, True))
 
-                # Parse out filename information
-                filename_dict = filename_parser(filename)
-                filetype = filename_dict['suffix']
-                instrument = filename_dict['instrument']
+    pool = multiprocessing.Pool(processes=int(get_config()['cores']))
+    for subdirectory_snapshots in pool.imap_unordered(walk_directory_tree, tasks):
+        snapshots.update(subdirectory_snapshots)
+    pool.close()
+    pool.join()
 
-                # Populate general stats
-                general_results_dict['fits_file_count'] += 1
-                general_results_dict['fits_file_size'] += os.path.getsize(file_path)
+    rescanned = len([path for path in snapshots if path not in previous_snapshots or
+                     snapshots[path]['mtime'] != previous_snapshots[path]['mtime']])
+    logging.info('{} of {} directories rescanned'.format(rescanned, len(snapshots)))
 
-                # Populate instrument specific stats
-                if instrument not in instrument_results_dict:
-                    instrument_results_dict[instrument] = {}
-                if filetype not in instrument_results_dict[instrument]:
-                    instrument_results_dict[instrument][filetype] = {}
-                    instrument_results_dict[instrument][filetype]['count'] = 0
-                    instrument_results_dict[instrument][filetype]['size'] = 0
-                instrument_results_dict[instrument][filetype]['count'] += 1
-                instrument_results_dict[instrument][filetype]['size'] += os.path.getsize(file_path) / (2**40)
+    save_snapshots(snapshots)
 
-    # Convert file sizes to terabytes
-    general_results_dict['total_file_size'] = general_results_dict['total_file_size'] / (2**40)
-    general_results_dict['fits_file_size'] = general_results_dict['fits_file_size'] / (2**40)
+    general_results_dict, instrument_results_dict = aggregate_snapshots(
+        snapshots, general_results_dict, instrument_results_dict)
 
     logging.info('{} files found in filesystem'.format(general_results_dict['fits_file_count']))
 
@@ -168,12 +231,32 @@ def initialize_results_dicts():
     return general_results_dict, instrument_results_dict
 
 
+def load_snapshots():
+    """Read in the per-directory snapshots saved by the previous run
+
+    Returns
+    -------
+    snapshots : dict
+        Per-directory snapshots keyed by the path of the directory
+        relative to the filesystem.  Empty if no snapshots exist.
+    """
+
+    if not os.path.isfile(SNAPSHOT_FILE):
+        logging.info('No directory snapshots found. The full filesystem will be scanned.')
+        return {}
+
+    with open(SNAPSHOT_FILE, 'r') as f:
+        snapshots = json.load(f)
+
+    return snapshots
+
+
 @log_fail
 @log_info
 def monitor_filesystem():
     """
     Tabulates the inventory of the JWST filesystem, saving statistics
-    to database tables, and generates plots.
+    to database tables, updates the file catalog, and generates plots.
     """
 
     logging.info('Beginning filesystem monitoring.')
@@ -190,6 +273,11 @@ def monitor_filesystem():
     # Add data to database tables
     update_database(general_results_dict, instrument_results_dict)
 
+    # Bring the file catalog used by the web app up to date
+    summary = update_catalog(FILESYSTEM)
+    logging.info('File catalog: {} files added, {} updated, {} removed'
+                 .format(summary['added'], summary['updated'], summary['removed']))
+
     # Create the plots
     plot_filesystem_stats()
 
@@ -362,6 +450,87 @@ def plot_total_file_counts():
     return plot
 
 
+def save_snapshots(snapshots):
+    """Save the per-directory snapshots for use by the next run
+
+    Parameters
+    ----------
+    snapshots : dict
+        Per-directory snapshots keyed by the path of the directory
+        relative to the filesystem
+    """
+
+    ensure_dir_exists(os.path.dirname(SNAPSHOT_FILE))
+
+    # Write to a temporary file first so an interrupted run cannot
+    # leave a truncated snapshot file behind
+    temporary_file = '{}.tmp'.format(SNAPSHOT_FILE)
+    with open(temporary_file, 'w') as f:
+        json.dump(snapshots, f)
+    os.replace(temporary_file, SNAPSHOT_FILE)
+    set_permissions(SNAPSHOT_FILE)
+
+
+def scan_directory(path):
+    """Tabulate the files directly within the given directory
+
+    Parameters
+    ----------
+    path : str
+        Full path to the directory
+
+    Returns
+    -------
+    snapshot : dict
+        Counts and sizes (in bytes) of all files and of FITS files
+        within the directory, FITS counts and sizes by instrument and
+        filetype, and the names of the subdirectories to descend into
+    """
+
+    snapshot = {'total_file_count': 0, 'total_file_size': 0, 'fits_file_count': 0,
+                'fits_file_size': 0, 'instruments': {}, 'subdirectories': []}
+
+    fits_files = []
+    fits_sizes = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+
+            if entry.is_dir():
+                # Symbolic links to directories are not followed
+                if not entry.is_symlink():
+                    snapshot['subdirectories'].append(entry.name)
+                continue
+
+            size = entry.stat().st_size
+            snapshot['total_file_count'] += 1
+            snapshot['total_file_size'] += size
+
+            if entry.name.endswith('.fits'):
+                fits_files.append(entry.name)
+                fits_sizes.append(size)
+
+    snapshot['fits_file_count'] = len(fits_files)
+    snapshot['fits_file_size'] = sum(fits_sizes)
+
+    # Parse out filename information
+    filename_info = filename_parser_batch(fits_files)
+    for i, size in enumerate(fits_sizes):
+        if not filename_info['valid'][i]:
+            logging.warning('{} does not follow JWST naming conventions'.format(fits_files[i]))
+            continue
+        filetype = filename_info['suffix'][i]
+        instrument = filename_info['instrument'][i]
+
+        # Populate instrument specific stats
+        filetypes = snapshot['instruments'].setdefault(instrument, {})
+        if filetype not in filetypes:
+            filetypes[filetype] = {'count': 0, 'size': 0}
+        filetypes[filetype]['count'] += 1
+        filetypes[filetype]['size'] += size
+
+    return snapshot
+
+
 def update_database(general_results_dict, instrument_results_dict):
     """Updates the ``filesystem_general`` and ``filesystem_instrument``
     database tables.
@@ -391,6 +560,58 @@ def update_database(general_results_dict, instrument_results_dict):
             session.commit()
 
 
+def walk_directory_tree(args):
+    """Gather the snapshots of a directory and, optionally, all of the
+    directories beneath it.  Directories whose modification time
+    matches their previous snapshot are not rescanned.
+
+    Parameters
+    ----------
+    args : tuple
+        ``(filesystem, relative_path, previous_snapshots, recursive)``,
+        where ``filesystem`` is the top of the filesystem,
+        ``relative_path`` is the path of the directory to walk relative
+        to ``filesystem``, ``previous_snapshots`` holds the snapshots
+        from the previous run for the directories being walked, and
+        ``recursive`` determines whether subdirectories are walked
+
+    Returns
+    -------
+    snapshots : dict
+        Snapshots keyed by the path of each directory relative to the
+        filesystem
+    """
+
+    filesystem, relative_path, previous_snapshots, recursive = args
+
+    snapshots = {}
+    directories = [relative_path]
+    while directories:
+        directory = directories.pop()
+        path = os.path.join(filesystem, directory)
+
+        # The modification time is read before the directory is listed
+        # so that changes made during the listing are caught next time
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            continue
+
+        previous = previous_snapshots.get(directory)
+        if previous is not None and previous['mtime'] == mtime:
+            snapshot = previous
+        else:
+            snapshot = scan_directory(path)
+            snapshot['mtime'] = mtime
+        snapshots[directory] = snapshot
+
+        if recursive:
+            directories.extend([os.path.join(directory, subdirectory)
+                                for subdirectory in snapshot['subdirectories']])
+
+    return snapshots
+
+
 if __name__ == '__main__':
 
     # Configure logging
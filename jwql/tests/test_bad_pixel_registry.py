@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+
+"""Tests for the ``bad_pixel_registry`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_bad_pixel_registry.py
+"""
+
+import numpy as np
+import pytest
+
+from jwql.utils.bad_pixel_registry import BadPixelRegistry
+
+
+def test_bad_pixel_registry():
+    """Test membership, set operations, and packing of the registry"""
+
+    registry = BadPixelRegistry()
+    registry.add(([1, 10, 2048], [5, 10, 2048]))
+
+    assert len(registry) == 3
+    assert (10, 10) in registry
+    assert (2048, 2048) in registry
+    assert (5, 1) not in registry
+    assert list(registry.contains(([1, 5], [5, 1]))) == [True, False]
+
+    # New pixels are returned in their original order
+    image = np.zeros((2048, 2048))
+    image[[3, 10, 1], [4, 10, 7]] = 1
+    new_pixels = registry.difference(np.where(image == 1))
+    assert new_pixels == ([1, 3], [7, 4])
+
+    other = BadPixelRegistry()
+    other.add(new_pixels)
+    combined = registry.union(other)
+    assert len(combined) == 5
+    assert len(registry) == 3
+
+    unpacked = BadPixelRegistry.from_bytes(combined.to_bytes())
+    assert np.array_equal(unpacked.bitmap, combined.bitmap)
+    assert [list(axis) for axis in unpacked.coordinates] == [[1, 1, 3, 10, 2048],
+                                                             [5, 7, 4, 10, 2048]]
+
+
+def test_bad_pixel_registry_outside_full_frame():
+    """Test that pixels outside of the full frame are rejected rather
+    than wrapped around"""
+
+    registry = BadPixelRegistry()
+    for coordinates in [([0], [5]), ([2049], [5]), ([5], [0])]:
+        with pytest.raises(ValueError):
+            registry.difference(coordinates)
+    assert len(registry) == 0
@@ -17,7 +17,10 @@ Use
         pytest -s test_calculations.py
 """
 
+from astropy.io import fits
+from astropy.stats import sigma_clip
 import numpy as np
+from scipy.stats import sigmaclip
 
 from jwql.utils import calculations
 
@@ -62,6 +65,18 @@ def test_gaussian1d_fit():
     assert ((sigma_value <= width[0]+3*width[1]) & (sigma_value >= width[0]-3*width[1]))
 
 
+def test_histogram_moments():
+    """Test the peak, mean, and standard deviation of histograms"""
+
+    bin_centers = np.array([1., 2., 3., 4.])
+    hist = np.array([[0, 1, 2, 1], [2, 0, 0, 2]])
+
+    peak, mean_value, stdev_value = calculations.histogram_moments(hist, bin_centers)
+    assert np.all(peak == [2, 2])
+    assert np.allclose(mean_value, [3., 2.5])
+    assert np.allclose(stdev_value, [np.sqrt(0.5), 1.5])
+
+
 def test_mean_image():
     """Test the sigma-clipped mean and stdev image calculator"""
 
@@ -91,6 +106,36 @@ def test_mean_image():
     assert np.all(dev_img == 0.5)
 
 
+def test_mean_image_stack(tmp_path):
+    """Assert that combining memory-mapped files and arrays a block of
+    rows at a time gives the same images as ``mean_image`` on the full
+    stack"""
+
+    np.random.seed(0)
+    images = [np.random.normal(4.5, 0.5, (2, 20, 6)).astype(np.float32),
+              np.random.normal(4.5, 0.5, (20, 6)).astype(np.float32),
+              np.random.normal(4.5, 0.5, (3, 20, 6)).astype(np.float32)]
+    images[0][1, 5, 2] = 150.
+    images[2][0, 17, 4] = np.nan
+
+    filenames = []
+    for i, image in enumerate(images):
+        filename = str(tmp_path / 'slope_{}.fits'.format(i))
+        fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(image)]).writeto(filename)
+        filenames.append(filename)
+
+    cube = np.vstack([images[0], images[1][np.newaxis, :, :], images[2]])
+    mean_img, dev_img = calculations.mean_image(cube, sigma_threshold=3)
+
+    # Files, and a mix of files and arrays
+    for stack in [filenames, [filenames[0], images[1], images[2]]]:
+        for processes in [1, 2]:
+            stack_mean_img, stack_dev_img = calculations.mean_image_stack(
+                stack, sigma_threshold=3, block_size=100, processes=processes)
+            assert np.array_equal(stack_mean_img, mean_img)
+            assert np.array_equal(stack_dev_img, dev_img)
+
+
 def test_mean_stdev():
     """Test calcualtion of the sigma-clipped mean from an image"""
 
@@ -103,3 +148,56 @@ def test_mean_stdev():
     meanval, stdval = calculations.mean_stdev(image, sigma_threshold=3)
     assert meanval == 1.
     assert stdval == 0.
+
+
+def test_region_histograms():
+    """Test that histograms on a shared grid match those of
+    ``numpy.histogram`` over the grid region and cover the others"""
+
+    np.random.seed(2)
+    image = np.random.normal(1., 0.1, (100, 100))
+    image[:, 50:] += 0.5
+    image[0, 0] = np.nan
+    regions = {'1': [(0, 0), (50, 100)], '2': [(50, 0), (100, 100)], '5': [(0, 0), (100, 100)]}
+    ranges = {'1': (0.3, 1.7), '2': (0.8, 2.2), '5': (0.5, 2.)}
+
+    hist, bin_centers, windows = calculations.region_histograms(image, regions, ranges, '5')
+
+    expected, bin_edges = np.histogram(image, bins='auto', range=ranges['5'])
+    assert np.array_equal(hist[2, windows['5']], expected)
+    assert np.allclose(bin_centers[windows['5']], (bin_edges[1:] + bin_edges[:-1]) / 2.)
+    assert np.array_equal(hist[0] + hist[1], hist[2])
+    assert bin_centers[windows['1']][0] < 0.3 + (bin_centers[1] - bin_centers[0])
+    assert bin_centers[windows['2']][-1] > 2.2 - (bin_centers[1] - bin_centers[0])
+    assert hist[0].sum() == 4999
+    assert hist[1].sum() == 5000
+
+
+def test_sigma_clipped_mean_stdev():
+    """Assert that the clipping kernel rejects the same values as
+    ``astropy.stats.sigma_clip`` along an axis and
+    ``scipy.stats.sigmaclip`` over all values, and gives the same
+    statistics"""
+
+    np.random.seed(0)
+    cube = (np.random.standard_cauchy((15, 12, 10)) + 4.5).astype(np.float32)
+    cube[np.random.rand(*cube.shape) < 0.05] = np.nan
+    cube[:, 0, 0] = np.nan
+
+    for cenfunc in ['median', 'mean']:
+        clipped_cube = sigma_clip(cube, sigma=3, axis=0, cenfunc=cenfunc, masked=False)
+        data = cube.copy()
+        mean_img, dev_img = calculations.sigma_clipped_mean_stdev(
+            data, sigma_threshold=3, axis=0, cenfunc=cenfunc, clip_data=True)
+        assert np.array_equal(np.isnan(data), np.isnan(clipped_cube))
+        assert np.allclose(mean_img, np.nanmean(clipped_cube, axis=0), rtol=1e-12, atol=0,
+                           equal_nan=True)
+        assert np.allclose(dev_img, np.nanstd(clipped_cube, axis=0), rtol=1e-9, atol=0,
+                           equal_nan=True)
+
+    image = np.random.standard_cauchy((40, 50)) + 4.5
+    clipped, lower, upper = sigmaclip(image, low=3, high=3)
+    mean_value, stdev_value = calculations.sigma_clipped_mean_stdev(
+        image, sigma_threshold=3, cenfunc='mean', maxiters=None)
+    assert np.isclose(mean_value, np.mean(clipped), rtol=1e-12, atol=0)
+    assert np.isclose(stdev_value, np.std(clipped), rtol=1e-9, atol=0)
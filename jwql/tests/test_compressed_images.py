@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+
+"""Tests for the ``compressed_images`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_compressed_images.py
+"""
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.utils.compressed_images import read_image_region, write_compressed_images
+
+
+def test_compressed_images(tmp_path):
+    """Test that images are stored losslessly as float32 and that
+    regions and decimated views can be read back"""
+
+    filename = str(tmp_path / 'mean_slope_image.fits')
+    np.random.seed(4)
+    mean_image = np.random.normal(0.01, 0.003, (64, 80))
+    mean_image[5, 7] = np.nan
+    header = fits.Header()
+    header['INSTRUME'] = 'nircam'
+
+    write_compressed_images(filename, {'MEAN': mean_image, 'STDEV': mean_image * 2}, header=header)
+
+    with fits.open(filename) as hdu_list:
+        assert hdu_list[0].header['INSTRUME'] == 'nircam'
+        assert isinstance(hdu_list['MEAN'], fits.CompImageHDU)
+
+    image = read_image_region(filename, 'MEAN')
+    assert image.dtype == np.float32
+    np.testing.assert_array_equal(image, mean_image.astype(np.float32))
+
+    cutout = read_image_region(filename, 'STDEV', region=[(10, 20), (42, 36)], step=2)
+    assert np.array_equal(cutout, (mean_image * 2).astype(np.float32)[20:36:2, 10:42:2])
+
+    # Uncompressed files can be read too
+    uncompressed_filename = str(tmp_path / 'uncompressed.fits')
+    hdu_list = fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(mean_image, name='MEAN')])
+    hdu_list.writeto(uncompressed_filename)
+    np.testing.assert_array_equal(read_image_region(uncompressed_filename, 'MEAN', step=4),
+                                  mean_image[::4, ::4])
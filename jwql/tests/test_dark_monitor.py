@@ -24,6 +24,7 @@ from astropy.time import Time
 import numpy as np
 
 from jwql.instrument_monitors.common_monitors import dark_monitor
+from jwql.utils.bad_pixel_registry import BadPixelRegistry
 from jwql.utils.utils import get_config
 
 
@@ -134,3 +135,29 @@ def test_shift_to_full_frame():
 
     assert np.all(new_coords[0] == np.array([518, 519]))
     assert np.all(new_coords[1] == np.array([518, 515]))
+
+
+def test_shift_to_full_frame_registry():
+    """Test that bad pixels in the last row and column of the detector,
+    shifted by the 1-based subarray origin, can be registered"""
+
+    # The logging decorators of Dark do not return the instance
+    monitor = dark_monitor.Dark.__wrapped__.__wrapped__(testing=True)
+    registry = BadPixelRegistry()
+
+    # A full frame and a 64 x 64 subarray in the corner of the detector
+    for substrt, size in [(1, 2048), (1985, 64)]:
+        monitor.x0 = substrt
+        monitor.y0 = substrt
+        image = np.zeros((size, size))
+        image[size - 1, 10] = 1
+        image[size - 1, size - 1] = 1
+        new_pixels = registry.difference(monitor.shift_to_full_frame(np.where(image == 1)))
+        registry.add(new_pixels)
+
+        if substrt == 1:
+            assert new_pixels == ([2048, 2048], [11, 2048])
+        else:
+            assert new_pixels == ([2048], [1995])
+
+    assert [list(axis) for axis in registry.coordinates] == [[2048, 2048, 2048], [11, 1995, 2048]]
@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+
+"""Tests for the ``data_containers`` module in the ``jwql`` web
+application.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_data_containers.py
+"""
+
+import json
+import os
+
+import pytest
+
+from jwql.jwql_monitors.generate_preview_images import enqueue_groups, USER_PRIORITY
+from jwql.utils.work_queue import WorkQueue
+from jwql.website.apps.jwql import data_containers
+
+EXPOSURE_FILES = ['jw93065002001_02101_00001_nrca1_cal.fits',
+                  'jw93065002001_02101_00001_nrca2_cal.fits',
+                  'jw93065002001_02101_00001_nrca5_cal.fits',
+                  'jw93065002001_02101_00001_nrcb5_cal.fits']
+
+
+@pytest.fixture
+def web_app(tmp_path, monkeypatch):
+    """Point the web app at a temporary preview image directory and
+    queue, with a catalog holding the files of one NIRCam exposure, and
+    record the render processes started instead of starting them"""
+
+    def get_filenames_by_rootname(rootname):
+        return sorted([filename for filename in EXPOSURE_FILES if filename.startswith(rootname)])
+
+    monkeypatch.setattr(data_containers, 'get_config', lambda: {'jwql_dir': str(tmp_path)})
+    monkeypatch.setattr(data_containers, 'QUEUE_FILE', str(tmp_path / 'preview_queue.db'))
+    monkeypatch.setattr(data_containers.file_catalog, 'get_filenames_by_rootname',
+                        get_filenames_by_rootname)
+    monkeypatch.setattr(data_containers.os.path, 'getmtime', lambda filename: 0.)
+    render_processes = []
+    monkeypatch.setattr(data_containers, 'start_render_process',
+                        lambda: render_processes.append(True))
+
+    return tmp_path, render_processes
+
+
+def test_get_mosaic_filenames(web_app):
+    """Test that the files of a detector are matched with the mosaic
+    of their channel"""
+
+    assert data_containers.get_mosaic_filenames('jw93065002001_02101_00001_nrca2') == \
+        ['jw93065002001_02101_00001_NRC_SWA_MOSAIC_cal.fits']
+    assert data_containers.get_mosaic_filenames('jw93065002001_02101_00001_nrcb5') == \
+        ['jw93065002001_02101_00001_NRC_LW_MOSAIC_cal.fits']
+    assert data_containers.get_mosaic_filenames('jw93065002001_02101_00002_nrca1') == []
+
+
+def test_get_image_info_tiled_mosaic(web_app):
+    """Test that the tile pyramids of the mosaic that a file is part of,
+    and of the file itself, are offered on the image view page of the
+    file, keyed by the suffix and integration that they show"""
+
+    tmp_path, render_processes = web_app
+    preview_dir = tmp_path / 'preview_images' / 'jw93065'
+    preview_dir.mkdir(parents=True)
+    for name in ['jw93065002001_02101_00001_NRC_SWA_MOSAIC_cal_integ0.dzi',
+                 'jw93065002001_02101_00001_NRC_LW_MOSAIC_cal_integ0.dzi']:
+        (preview_dir / name).write_text('')
+
+    (preview_dir / 'jw93065002001_02101_00001_nrca1_rate_integ0.dzi').write_text('')
+
+    image_info = data_containers.get_image_info('jw93065002001_02101_00001_nrca1', False)
+
+    assert image_info['tiled_images'] == {
+        'cal_integ0': 'jw93065002001_02101_00001_NRC_SWA_MOSAIC_cal_integ0.dzi',
+        'rate_integ0': 'jw93065002001_02101_00001_nrca1_rate_integ0.dzi'}
+    assert os.path.basename(image_info['all_files'][0]) == EXPOSURE_FILES[0]
+
+
+def test_get_preview_status(web_app):
+    """Test that files whose own tasks have been processed without
+    making a preview image are reported as failed while the page waits,
+    and are requested again when the page is shown again"""
+
+    tmp_path, render_processes = web_app
+    file_root = 'jw93065002001_02101_00001_nrca1'
+    filename = '{}_cal.fits'.format(file_root)
+    data_containers.get_image_info(file_root, False)
+    assert data_containers.get_preview_status(file_root) == {'pending': [filename], 'failed': []}
+
+    queue = WorkQueue(data_containers.QUEUE_FILE)
+    task_id, _, _ = queue.claim('worker-1')
+    queue.complete(task_id, 'worker-1')
+    assert data_containers.get_preview_status(file_root) == {'pending': [], 'failed': [filename]}
+
+    assert data_containers.get_image_info(file_root, False)['pending'] == [filename]
+    assert queue.status([filename]) == {filename: 'pending'}
+
+    # Once the preview image exists the file is neither pending nor failed
+    preview_dir = tmp_path / 'preview_images' / 'jw93065'
+    preview_dir.mkdir(parents=True)
+    (preview_dir / '{}_cal_integ0.jpg'.format(file_root)).write_text('')
+    assert data_containers.get_preview_status(file_root) == {'pending': [], 'failed': []}
+
+
+def test_preview_status_ajax(web_app, monkeypatch):
+    """Test that the image view page is told which preview images it is
+    waiting for"""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jwql.website.jwql_proj.settings')
+    import django
+    django.setup()
+    from django.test import RequestFactory
+    from jwql.website.apps.jwql import oauth, views
+
+    class UserInfo():
+        def json(self):
+            return {'ezid': 'user', 'anon': False}
+
+    monkeypatch.setattr(oauth.requests, 'get', lambda *args, **kwargs: UserInfo())
+    monkeypatch.setattr(views, 'get_preview_status', data_containers.get_preview_status)
+    file_root = 'jw93065002001_02101_00001_nrca1'
+    data_containers.get_image_info(file_root, False)
+
+    request = RequestFactory().get('/ajax/nircam/{}/preview_status/'.format(file_root))
+    request.COOKIES['ASB-AUTH'] = 'token'
+    response = views.preview_status_ajax(request, inst='nircam', file_root=file_root)
+
+    assert json.loads(response.content.decode()) == \
+        {'pending': ['{}_cal.fits'.format(file_root)], 'failed': []}
+
+
+def test_request_preview_images(web_app):
+    """Test that missing preview images are requested ahead of the bulk
+    backlog, and only once"""
+
+    tmp_path, render_processes = web_app
+    queue = WorkQueue(data_containers.QUEUE_FILE)
+    queue.add({'backlog': {}})
+    file_root = 'jw93065002001_02101_00001_nrca1'
+    filename = '{}_cal.fits'.format(file_root)
+
+    assert data_containers.get_image_info(file_root, False)['pending'] == [filename]
+    assert data_containers.get_image_info(file_root, False)['pending'] == [filename]
+    assert render_processes
+    assert queue.counts()['pending'] == 2
+
+    task_id, key, payload = queue.claim('worker-1', min_priority=USER_PRIORITY)
+    assert key == filename
+    assert payload['files'] == [os.path.join(data_containers.FILESYSTEM_DIR, 'jw93065', filename)]
+
+
+def test_request_preview_images_bulk_group(web_app):
+    """Test that files in exposure groups queued in bulk are not
+    requested again while their groups are on the way, but that the
+    groups are raised to the priority of user requests"""
+
+    tmp_path, render_processes = web_app
+    queue = WorkQueue(data_containers.QUEUE_FILE)
+    files = [os.path.join(data_containers.FILESYSTEM_DIR, 'jw93065', filename)
+             for filename in EXPOSURE_FILES[:3]]
+    enqueue_groups(queue, [(files, False)], {file: 0. for file in files})
+
+    image_info = data_containers.get_image_info('jw93065002001_02101_00001_nrca2', False)
+
+    assert image_info['pending'] == ['jw93065002001_02101_00001_nrca2_cal.fits']
+    assert queue.counts()['pending'] == 1
+    task_id, key, _ = queue.claim('worker-1', min_priority=USER_PRIORITY)
+    assert key == ','.join(EXPOSURE_FILES[:3])
+
+    # The group only makes the preview image of its mosaic, so the file
+    # is then requested on its own
+    queue.complete(task_id, 'worker-1')
+    assert data_containers.get_preview_status('jw93065002001_02101_00001_nrca2') == \
+        {'pending': ['jw93065002001_02101_00001_nrca2_cal.fits'], 'failed': []}
+    task_id, key, _ = queue.claim('worker-1', min_priority=USER_PRIORITY)
+    assert key == 'jw93065002001_02101_00001_nrca2_cal.fits'
@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+
+"""Tests for the ``file_catalog`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_file_catalog.py
+"""
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from jwql.database.database_interface import FilesystemCatalog, FilesystemCatalogDirectory
+from jwql.utils import file_catalog
+from jwql.utils.file_catalog import scan_directory
+
+
+def test_get_filenames_by_rootname(tmp_path, monkeypatch):
+    """Test that rootnames are looked up in the catalog, and in the
+    filesystem for files added since the catalog was updated"""
+
+    engine = create_engine('sqlite:///{}'.format(tmp_path / 'catalog.db'))
+    FilesystemCatalog.__table__.create(engine)
+    FilesystemCatalogDirectory.__table__.create(engine)
+    monkeypatch.setattr(file_catalog, 'session', scoped_session(sessionmaker(bind=engine)))
+
+    filesystem = tmp_path / 'filesystem'
+    monkeypatch.setattr(file_catalog, 'get_config', lambda: {'filesystem': str(filesystem)})
+    directory = filesystem / 'jw00327'
+    directory.mkdir(parents=True)
+    (directory / 'jw00327001001_02101_00002_nrca1_rate.fits').write_bytes(b'0' * 10)
+    file_catalog.update_catalog(str(filesystem))
+
+    # Files that arrived after the update are not in the catalog
+    (directory / 'jw00327001001_02101_00002_nrca1_cal.fits').write_bytes(b'0' * 10)
+    (directory / 'jw00327001001_02101_00003_nrca1_rate.fits').write_bytes(b'0' * 10)
+
+    assert file_catalog.get_filenames_by_rootname('jw00327001001_02101_00002_nrca1') == \
+        ['jw00327001001_02101_00002_nrca1_rate.fits']
+    assert file_catalog.get_filenames_by_rootname('jw00327001001_02101_00003_nrca1') == \
+        ['jw00327001001_02101_00003_nrca1_rate.fits']
+    assert file_catalog.get_filenames_by_rootname('jw00327001001_02101_00004_nrca1') == []
+
+
+def test_scan_directory(tmp_path):
+    """Test that the catalog records for a directory contain the parsed
+    filename properties of each FITS file"""
+
+    directory = tmp_path / 'jw00327'
+    directory.mkdir()
+    for filename in ['jw00327001001_02101_00002_nrca1_rate.fits',
+                     'jw00327001001_02101_00002_nrca1_uncal.fits',
+                     'nonstandard_name.fits',
+                     'notes.txt']:
+        (directory / filename).write_bytes(b'0' * 10)
+
+    records = scan_directory(str(directory))
+
+    assert sorted(records) == ['jw00327001001_02101_00002_nrca1_rate.fits',
+                               'jw00327001001_02101_00002_nrca1_uncal.fits',
+                               'nonstandard_name.fits']
+
+    record = records['jw00327001001_02101_00002_nrca1_rate.fits']
+    assert record['directory'] == 'jw00327'
+    assert record['program_id'] == '00327'
+    assert record['observation'] == '001'
+    assert record['detector'] == 'nrca1'
+    assert record['suffix'] == 'rate'
+    assert record['instrument'] == 'nircam'
+    assert record['size'] == 10
+
+    assert records['nonstandard_name.fits']['instrument'] is None
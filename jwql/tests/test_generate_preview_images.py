@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+
+"""Tests for the ``generate_preview_images`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_generate_preview_images.py
+"""
+
+import os
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.jwql_monitors import generate_preview_images
+from jwql.jwql_monitors.generate_preview_images import create_mosaic, process_group, scan_program
+
+
+def write_subarray_files(directory, detectors, size=64):
+    """Write a two-integration subarray exposure in the corner of each
+    of the given NIRCam detectors, holding the index of the detector
+    plus 10 times the integration number, and return the filenames"""
+
+    substrt = 2048 - size + 1
+    filenames = []
+    for i, detector in enumerate(detectors):
+        header = fits.Header([('SUBSTRT1', substrt), ('SUBSTRT2', substrt),
+                              ('SUBSIZE1', size), ('SUBSIZE2', size)])
+        data = np.full((2, size, size), i, dtype=np.float32)
+        data += np.arange(2)[:, np.newaxis, np.newaxis] * 10
+        filename = str(directory / 'jw00327001001_02101_00001_{}_rateints.fits'.format(detector))
+        hdu_list = fits.HDUList([fits.PrimaryHDU(header=header), fits.ImageHDU(data, name='SCI')])
+        hdu_list.writeto(filename)
+        filenames.append(filename)
+
+    return filenames
+
+
+def test_create_mosaic(tmp_path):
+    """Test that the mosaic of each integration of a subarray exposure
+    holds the data of each detector in its place, and that the DQ
+    array flags the chip gaps and the pixels beside them"""
+
+    size = 64
+    filenames = write_subarray_files(tmp_path, ['nrca1', 'nrca2', 'nrca3', 'nrca4'], size=size)
+
+    frames, dq = create_mosaic(filenames)
+    frames = [frame.copy() for frame in frames]
+    assert len(frames) == 2
+
+    # NRCA1 is in the lower left and NRCA4 in the upper right corner
+    for integration, frame in enumerate(frames):
+        assert frame.dtype == np.float32
+        assert np.all(frame[:size, :size] == integration * 10)
+        assert np.all(frame[-size - 1:-1, -size - 1:-1] == 3 + integration * 10)
+        assert np.all(np.isnan(frame[size:-size - 1, :]))
+        assert np.all(np.isnan(frame[:, size:-size - 1]))
+
+    assert dq.shape == frames[0].shape
+    assert not np.any(dq[:, size - 4:size + 4]) and np.all(dq[:size - 4, :size - 4])
+    assert not np.any(dq[np.isnan(frames[0])])
+
+
+def test_process_group(tmp_path, monkeypatch):
+    """Test that the preview images, thumbnails, and tile pyramids
+    listed as the outputs of an exposure group are the files saved"""
+
+    monkeypatch.setattr(generate_preview_images, 'get_config', lambda: {
+        'preview_image_filesystem': str(tmp_path / 'preview_images'),
+        'thumbnail_filesystem': str(tmp_path / 'thumbnails')})
+    filenames = write_subarray_files(tmp_path, ['nrca1', 'nrca2', 'nrca3', 'nrca4'])
+
+    for file_list in [filenames[:1], filenames]:
+        outputs = process_group(file_list, renderer='fast', tiles=True)
+
+        assert len([output for output in outputs if output.endswith('.jpg')]) == 2
+        assert len([output for output in outputs if output.endswith('.thumb')]) == 2
+        assert all([os.path.isfile(output) for output in outputs])
+    assert len([output for output in outputs if output.endswith('.dzi')]) == 2
+    assert os.path.basename(outputs[0]) == \
+        'jw00327001001_02101_00001_NRC_SWA_MOSAIC_rateints_integ0.jpg'
+
+
+def test_process_group_unreadable_mosaic(tmp_path, monkeypatch):
+    """Test that exposure groups whose mosaics cannot be made, or whose
+    files cannot be read while the images are made, are skipped"""
+
+    monkeypatch.setattr(generate_preview_images, 'get_config', lambda: {
+        'preview_image_filesystem': str(tmp_path / 'preview_images'),
+        'thumbnail_filesystem': str(tmp_path / 'thumbnails')})
+    filenames = write_subarray_files(tmp_path, ['nrca1', 'nrca2'])
+
+    missing_file = str(tmp_path / 'jw00327001001_02101_00001_nrca3_rateints.fits')
+    assert process_group(filenames + [missing_file], renderer='fast') == []
+
+    def unreadable_frames(images, placements, xdim, ydim):
+        raise FileNotFoundError('File disappeared')
+        yield
+
+    monkeypatch.setattr(generate_preview_images, 'mosaic_frames', unreadable_frames)
+    assert process_group(filenames, renderer='fast') == []
+
+
+def test_scan_program(tmp_path):
+    """Test that only the exposure groups with new or modified files
+    are found, and that previously recorded groups are overwritten"""
+
+    program_dir = tmp_path / 'jw00327'
+    program_dir.mkdir()
+    filenames = ['jw00327001001_02101_00001_nrca1_rate.fits',
+                 'jw00327001001_02101_00001_nrca2_rate.fits',
+                 'jw00327001001_02101_00002_nrca1_rate.fits',
+                 'jw00327001001_02101_00003_nrca1_rate.fits']
+    for filename in filenames:
+        (program_dir / filename).write_bytes(b'0' * 10)
+    mtimes = {filename: os.stat(str(program_dir / filename)).st_mtime for filename in filenames}
+
+    # Nothing has been recorded, so every group is new
+    groups, file_mtimes = scan_program(str(program_dir), {})
+    assert len(groups) == 3
+    assert not any([overwrite for _, overwrite in groups])
+    assert file_mtimes[str(program_dir / filenames[0])] == mtimes[filenames[0]]
+
+    # The mosaic group gains a modified file and exposure 3 is new
+    stored_mtimes = dict(mtimes)
+    stored_mtimes[filenames[1]] -= 1
+    del stored_mtimes[filenames[3]]
+    groups, _ = scan_program(str(program_dir), stored_mtimes)
+    groups = {tuple(sorted(os.path.basename(filename) for filename in file_list)): overwrite
+              for file_list, overwrite in groups}
+    assert groups == {tuple(filenames[:2]): True, (filenames[3],): False}
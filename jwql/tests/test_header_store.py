@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+"""Tests for the ``header_store`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_header_store.py
+"""
+
+from astropy.io import fits
+
+from jwql.utils import header_store
+from jwql.utils.header_store import decompress_header, extract_header_record
+
+
+def test_extract_header_record(tmp_path):
+    """Test that selected keywords are stored in their own columns and
+    that the full header can be rebuilt from the record"""
+
+    filepath = str(tmp_path / 'jw00327001001_02101_00002_nrca1_uncal.fits')
+    hdu = fits.PrimaryHDU()
+    hdu.header['DETECTOR'] = 'NRCA1'
+    hdu.header['SUBSIZE1'] = 2048
+    hdu.header['S_DQINIT'] = 'COMPLETE'
+    hdu.writeto(filepath)
+
+    record = extract_header_record(filepath)
+
+    assert record['filename'] == 'jw00327001001_02101_00002_nrca1_uncal.fits'
+    assert record['detector'] == 'NRCA1'
+    assert record['subsize1'] == 2048
+    assert record['readpatt'] is None
+
+    header = decompress_header(record['header'])
+    assert header['S_DQINIT'] == 'COMPLETE'
+    assert header.tostring() == fits.getheader(filepath).tostring()
+
+
+def test_get_header_record_outside_filesystem(tmp_path, monkeypatch):
+    """Test that the headers of files outside of the filesystem are
+    read from the files, without using the store, so that they cannot
+    replace the records of files in the filesystem with the same
+    names"""
+
+    class Session():
+        def __getattr__(self, name):
+            raise AssertionError('The header store was used')
+
+    filesystem_dir = tmp_path / 'filesystem'
+    (filesystem_dir / 'jw00327').mkdir(parents=True)
+    monkeypatch.setattr(header_store, 'get_config', lambda: {'filesystem': str(filesystem_dir)})
+    monkeypatch.setattr(header_store, 'session', Session())
+
+    filepath = str(tmp_path / 'jw00327001001_02101_00002_nrca1_rate.fits')
+    hdu = fits.PrimaryHDU()
+    hdu.header['DETECTOR'] = 'NRCA1'
+    hdu.writeto(filepath)
+
+    assert header_store.get_header_record(filepath)['detector'] == 'NRCA1'
+    assert not header_store.in_filesystem(filepath)
+    filesystem_filepath = filesystem_dir / 'jw00327' / 'jw00327001001_02101_00002_nrca1_rate.fits'
+    assert header_store.in_filesystem(str(filesystem_filepath))
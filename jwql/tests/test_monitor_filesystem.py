@@ -0,0 +1,58 @@
+#! /usr/bin/env python
+
+"""Tests for the ``monitor_filesystem`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_monitor_filesystem.py
+"""
+
+import os
+
+from jwql.jwql_monitors.monitor_filesystem import aggregate_snapshots
+from jwql.jwql_monitors.monitor_filesystem import initialize_results_dicts
+from jwql.jwql_monitors.monitor_filesystem import walk_directory_tree
+
+
+def test_walk_directory_tree(tmp_path):
+    """Test that directory snapshots are gathered for the full tree,
+    that unchanged directories are reused from the previous snapshots,
+    and that the snapshots aggregate into the database statistics"""
+
+    program_dir = tmp_path / 'jw00327'
+    program_dir.mkdir()
+    (program_dir / 'jw00327001001_02101_00002_nrca1_rate.fits').write_bytes(b'0' * 10)
+    (program_dir / 'jw00327001001_02101_00002_nrca1_uncal.fits').write_bytes(b'0' * 20)
+    (program_dir / 'notes.txt').write_bytes(b'0' * 5)
+    sub_dir = program_dir / 'extra'
+    sub_dir.mkdir()
+    (sub_dir / 'jw00327001001_02101_00002_nrca2_rate.fits').write_bytes(b'0' * 30)
+
+    snapshots = walk_directory_tree((str(tmp_path), 'jw00327', {}, True))
+    assert sorted(snapshots) == ['jw00327', os.path.join('jw00327', 'extra')]
+    assert snapshots['jw00327']['total_file_count'] == 3
+    assert snapshots['jw00327']['fits_file_size'] == 30
+    assert snapshots['jw00327']['instruments']['nircam']['rate'] == {'count': 1, 'size': 10}
+
+    # Unchanged directories are not rescanned
+    previous = {path: dict(snapshot, total_file_count=-1) for path, snapshot in snapshots.items()}
+    rewalked = walk_directory_tree((str(tmp_path), 'jw00327', previous, True))
+    assert rewalked['jw00327']['total_file_count'] == -1
+
+    general_results_dict, instrument_results_dict = initialize_results_dicts()
+    general_results_dict, instrument_results_dict = aggregate_snapshots(
+        snapshots, general_results_dict, instrument_results_dict)
+    assert general_results_dict['total_file_count'] == 4
+    assert general_results_dict['fits_file_count'] == 3
+    assert instrument_results_dict['nircam']['rate']['count'] == 2
+    assert instrument_results_dict['nircam']['rate']['size'] == 40 / (2**40)
@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+"""Tests for the ``pipeline_cache`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_pipeline_cache.py
+"""
+
+from collections import OrderedDict
+import os
+
+from jwql.utils.pipeline_cache import PipelineCache, cache_key
+
+
+def test_cache_key(tmp_path):
+    """Test that the key depends on the file contents, the steps run,
+    and the versions, but not on the file name"""
+
+    filename = str(tmp_path / 'jw00327001001_02101_00002_nrca1_uncal.fits')
+    with open(filename, 'wb') as file_object:
+        file_object.write(b'ramp')
+    copy_filename = str(tmp_path / 'copy_uncal.fits')
+    with open(copy_filename, 'wb') as file_object:
+        file_object.write(b'ramp')
+
+    steps = OrderedDict([('dq_init', True), ('jump', False), ('rate', True)])
+    versions = {'jwst': '0.13.1', 'crds_context': 'jwst_0541.pmap'}
+    key = cache_key(filename, steps, versions)
+
+    assert cache_key(copy_filename, steps, versions) == key
+    other_steps = OrderedDict([('dq_init', True), ('jump', True), ('rate', True)])
+    assert cache_key(filename, other_steps, versions) != key
+    assert cache_key(filename, steps, {'jwst': '0.13.1', 'crds_context': 'jwst_0542.pmap'}) != key
+
+    with open(copy_filename, 'wb') as file_object:
+        file_object.write(b'other ramp')
+    assert cache_key(copy_filename, steps, versions) != key
+
+
+def test_pipeline_cache_eviction(tmp_path):
+    """Test that the least recently used outputs are removed once the
+    cache grows past its size limit"""
+
+    cache = PipelineCache(str(tmp_path / 'cache'), max_size=250)
+    output_filename = str(tmp_path / 'output_rate.fits')
+    with open(output_filename, 'wb') as file_object:
+        file_object.write(b'x' * 100)
+
+    for index, key in enumerate(['a', 'b']):
+        cache.put(key, output_filename)
+        os.utime(cache.path(key), (index, index))
+    assert cache.get('c') is None
+
+    # Using 'a' makes 'b' the least recently used output
+    assert cache.get('a') == cache.path('a')
+    cache.put('c', output_filename)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.size == 200
@@ -26,8 +26,12 @@ import pytest
 import shutil
 
 from astropy.io import fits
+import numpy as np
+from PIL import Image
 
-from jwql.utils.preview_image import PreviewImage
+from jwql.utils import preview_image
+from jwql.utils.preview_image import clip_limits, colormap_lookup_table, PreviewImage, \
+    write_tile_pyramid
 from jwql.utils.utils import get_config, ensure_dir_exists
 
 # directory to be created and populated during tests running
@@ -67,6 +71,159 @@ def test_directory(test_dir=TEST_DIRECTORY):
         os.remove(file)
 
 
+def test_clip_limits():
+    """Assert that the selection-based limits match those found by
+    sorting the science pixels, for single images and for cubes."""
+
+    np.random.seed(0)
+    cube = np.random.normal(100, 10, (5, 64, 32))
+    cube[2, 10, 10] = np.nan
+    pixmap = np.ones((64, 32), dtype=bool)
+    pixmap[:4, :] = False
+
+    minvals, maxvals = clip_limits(cube, pixmap, 0.01)
+    for i, frame in enumerate(cube):
+        values = np.sort(frame[pixmap])
+        numclip = int(0.01 * values.size)
+        assert clip_limits(frame, pixmap, 0.01) == (values[numclip], values[-numclip - 1])
+        assert (minvals[i], maxvals[i]) == (values[numclip], values[-numclip - 1])
+
+
+def test_difference_frames(tmp_path):
+    """Assert that the difference images made one integration at a
+    time from the memory-mapped ramps of a scaled (unsigned integer)
+    file match those made from the fully read data."""
+
+    np.random.seed(0)
+    ramps = np.random.randint(0, 65535, (3, 4, 16, 8)).astype(np.uint16)
+    filename = str(tmp_path / 'jw00000001001_01101_00001_nrca1_uncal.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(ramps, name='SCI')]).writeto(filename)
+
+    image = PreviewImage(filename, 'SCI')
+    expected = ramps[:, -1, :, :].astype(np.float64) - ramps[:, 0, :, :]
+
+    frames = list(image.difference_frames(image.data))
+    assert len(frames) == 3
+    for frame, expected_frame in zip(frames, expected):
+        assert frame.dtype == np.float32
+        assert np.array_equal(frame, expected_frame)
+    assert np.array_equal(image.difference_image(image.data), expected)
+
+
+def test_fast_renderer(tmp_path):
+    """Assert that the ``fast`` renderer scales a synthetic image onto
+    the colormap, with pixels that have no data shown in white, draws
+    the title and colorbar around it, and saves a preview image and
+    thumbnail per integration."""
+
+    np.random.seed(0)
+    cube = np.random.uniform(10, 1000, (2, 40, 60)).astype(np.float32)
+    cube[0, 0, 0] = 10.
+    cube[0, 0, 1] = 1000.
+    cube[0, 0, 2] = np.nan
+    filename = str(tmp_path / 'jw00000001001_01101_00001_nrca1_rateints.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(cube, name='SCI')]).writeto(filename)
+
+    image = PreviewImage(filename, 'SCI')
+    image.renderer = 'fast'
+    frame = image.data[0]
+
+    # Display limits map onto the ends of the colormap in both scalings
+    for scale in ['linear', 'log']:
+        scaled = image.scale_image(frame, 10., 1000., scale)
+        np.testing.assert_allclose(scaled[0, :2], [0., 1.], atol=1e-6)
+        assert np.isnan(scaled[0, 2])
+        assert np.all((scaled[1:] >= 0) & (scaled[1:] <= 1))
+
+    lookup_table = colormap_lookup_table('viridis')
+    assert lookup_table.shape == (256, 3)
+    assert lookup_table.dtype == np.uint8
+
+    # At 60 pixels the image is not resized
+    rendered = image.render_image(frame, 10., 1000., 'linear', maxsize=0.6)
+    assert rendered.size == (60, 40)
+    assert rendered.getpixel((0, 0)) == tuple(lookup_table[0])
+    assert rendered.getpixel((1, 0)) == tuple(lookup_table[255])
+    assert rendered.getpixel((2, 0)) == (255, 255, 255)
+
+    # Log scaled images are flipped, as by the matplotlib renderer
+    log_image = image.render_image(frame, 10., 1000., 'log', maxsize=0.6)
+    assert log_image.getpixel((1, 39)) == tuple(lookup_table[255])
+
+    overlaid = image.add_overlay(rendered, 0, 10., 1000., 'linear')
+    assert overlaid.size == (60 + 20 + 20 + 80, 40 + 30 + 10)
+    assert overlaid.getpixel((1, 30)) == tuple(lookup_table[255])
+
+    image.preview_output_directory = str(tmp_path / 'previews')
+    image.thumbnail_output_directory = str(tmp_path / 'thumbnails')
+    os.makedirs(image.preview_output_directory)
+    os.makedirs(image.thumbnail_output_directory)
+    image.make_image(max_img_size=1)
+
+    root = 'jw00000001001_01101_00001_nrca1_rateints'
+    assert sorted(os.listdir(image.preview_output_directory)) == ['{}_integ0.jpg'.format(root),
+                                                                  '{}_integ1.jpg'.format(root)]
+    assert sorted(os.listdir(image.thumbnail_output_directory)) == ['{}_integ0.thumb'.format(root),
+                                                                    '{}_integ1.thumb'.format(root)]
+    assert Image.open(image.preview_images[0]).size == (100 + 120, 67 + 40)
+
+
+def test_frames_with_limits(tmp_path, monkeypatch):
+    """Assert that the limits found for batches of integrations match
+    those found one integration at a time, also for frames made by a
+    generator that reuses its output array (as for mosaics)."""
+
+    np.random.seed(0)
+    cube = np.random.normal(100, 10, (5, 16, 8)).astype(np.float32)
+    filename = str(tmp_path / 'jw00000001001_01101_00001_nrca1_rateints.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(cube, name='SCI')]).writeto(filename)
+    image = PreviewImage(filename, 'SCI')
+
+    def reused_frames():
+        frame = np.zeros((16, 8), dtype=np.float32)
+        for integration in cube:
+            frame[:] = integration
+            yield frame
+
+    # Batches of two integrations, and integrations that are used as
+    # they are, each of which is checked before the next is made
+    for batch_size in [2 * 16 * 8, 16 * 8]:
+        monkeypatch.setattr(preview_image, 'LIMITS_BATCH_SIZE', batch_size)
+        count = 0
+        results = image.frames_with_limits(reused_frames())
+        for integration, (frame, minval, maxval) in zip(cube, results):
+            assert np.array_equal(frame, integration)
+            assert (minval, maxval) == clip_limits(integration, image.dq, image.clip_percent)
+            count += 1
+        assert count == 5
+
+    # Frames kept from a batch are not overwritten by later ones
+    monkeypatch.setattr(preview_image, 'LIMITS_BATCH_SIZE', 2 * 16 * 8)
+    frames = [frame for frame, minval, maxval in image.frames_with_limits(reused_frames())]
+    assert np.array_equal(frames[0], cube[0])
+
+
+def test_write_tile_pyramid(tmp_path):
+    """Assert that the tile pyramid has one level per halving of the
+    image, that each level is covered by overlapping tiles, and that
+    the descriptor records the full image size."""
+
+    image = Image.fromarray(np.zeros((600, 1000, 3), dtype=np.uint8))
+    dzi = write_tile_pyramid(image, str(tmp_path / 'mosaic'), tile_size=256, overlap=1)
+
+    assert dzi == str(tmp_path / 'mosaic.dzi')
+    with open(dzi) as f:
+        descriptor = f.read()
+    assert 'Width="1000" Height="600"' in descriptor
+    assert 'TileSize="256" Overlap="1"' in descriptor or 'Overlap="1" TileSize="256"' in descriptor
+
+    levels = sorted(int(level) for level in os.listdir(str(tmp_path / 'mosaic_files')))
+    assert levels == list(range(11))
+    assert len(os.listdir(str(tmp_path / 'mosaic_files' / '10'))) == 4 * 3
+    assert Image.open(str(tmp_path / 'mosaic_files' / '10' / '1_1.jpg')).size == (258, 258)
+    assert Image.open(str(tmp_path / 'mosaic_files' / '0' / '0_0.jpg')).size == (1, 1)
+
+
 def get_test_fits_files():
     """Get a list of the FITS files on central storage to make preview images.
 
@@ -88,7 +245,8 @@ def get_test_fits_files():
 
 @pytest.mark.skipif(ON_JENKINS, reason='Requires access to central storage.')
 @pytest.mark.parametrize('filename', get_test_fits_files())
-def test_make_image(test_directory, filename):
+@pytest.mark.parametrize('renderer', ['matplotlib', 'fast'])
+def test_make_image(test_directory, filename, renderer):
     """Use PreviewImage.make_image to create preview images of a sample
     JWST exposure.
 
@@ -101,6 +259,8 @@ def test_make_image(test_directory, filename):
         Path of directory used for testing
     filename : str
         Path of FITS image to generate preview of
+    renderer : str
+        The ``PreviewImage`` renderer to use
     """
 
     header = fits.getheader(filename)
@@ -113,6 +273,7 @@ def test_make_image(test_directory, filename):
             image.scaling = 'log'
             image.cmap = 'viridis'
             image.output_format = 'jpg'
+            image.renderer = renderer
             image.thumbnail = create_thumbnail
 
             if create_thumbnail:
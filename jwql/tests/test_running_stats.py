@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+
+"""Tests for the ``running_stats`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_running_stats.py
+"""
+
+import numpy as np
+
+from jwql.utils.running_stats import RunningStats
+
+
+def test_running_stats(tmp_path):
+    """Test that statistics folded in over several updates, with a
+    save and load in between, match those of all images at once"""
+
+    np.random.seed(3)
+    images = np.random.normal(0.01, 0.005, (7, 10, 12)).astype(np.float32)
+    images[2, 4, 5] = np.nan
+    filename = str(tmp_path / 'nircam_nrca1_running_stats.fits')
+
+    stats = RunningStats((10, 12))
+    stats.add(images[:3])
+    stats.record_update(58000., 58010., 3, np.nanmedian(images[:3]))
+    stats.save(filename)
+
+    stats = RunningStats.load(filename)
+    for image in images[3:]:
+        stats.add(image)
+    stats.record_update(58010., 58020., 4, np.nanmedian(images[3:]))
+    stats.save(filename)
+
+    stats = RunningStats.load(filename)
+    assert stats.count[4, 5] == 6
+    assert np.all(stats.count[0] == 7)
+    images = images.astype(np.float64)
+    assert np.allclose(stats.mean, np.nanmean(images, axis=0), rtol=1e-10, atol=0)
+    assert np.allclose(stats.stdev, np.nanstd(images, axis=0), rtol=1e-8, atol=0)
+    assert list(stats.updates['NFILES']) == [3, 4]
+    assert list(stats.updates['QRY_END']) == [58010., 58020.]
@@ -22,7 +22,8 @@ import os
 from pathlib import Path
 import pytest
 
-from jwql.utils.utils import copy_files, get_config, filename_parser, filesystem_path
+from jwql.utils.utils import copy_files, get_config, filename_parser, filename_parser_batch, \
+    filesystem_path, group_exposures
 
 
 FILENAME_PARSER_TEST_DATA = [
@@ -297,6 +298,55 @@ def test_filename_parser(filename, solution):
     assert filename_parser(filename) == solution
 
 
+def test_filename_parser_batch():
+    """Assert that the batch parser gives the same results as
+    ``filename_parser`` and flags files that cannot be parsed.
+    """
+
+    filenames = [filename for filename, _ in FILENAME_PARSER_TEST_DATA]
+    filenames += ['not_a_jwst_file.fits', filenames[0]]
+    results = filename_parser_batch(filenames)
+
+    assert list(results['valid']) == [True] * len(FILENAME_PARSER_TEST_DATA) + [False, True]
+    for i, (_, solution) in enumerate(FILENAME_PARSER_TEST_DATA):
+        for key in results:
+            if key != 'valid':
+                assert results[key][i] == solution.get(key)
+    assert results['program_id'][-2] is None
+
+
+def test_group_exposures():
+    """Assert that only the detectors of one NIRCam channel are grouped
+    together, and that stage 3 and unrecognized files are kept apart.
+    """
+
+    filenames = ['/fs/jw00327/jw00327001001_02101_00002_nrcb1_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00002_nrca5_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00002_nrca1_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00002_nrcb5_rate.fits',
+                 '/fs/jw00327/jw00327001001_02101_00002_nrca1_uncal.fits',
+                 '/fs/jw00327/jw00327001001_02101_00003_nrca1_rate.fits',
+                 '/fs/jw00327/jw00327-o001_t001_nircam_f150w_i2d.fits',
+                 '/fs/jw00327/jw00327-o001_t001_nircam_f200w_i2d.fits',
+                 '/fs/jw86600/jw86600008001_02101_00007_guider1_cal.fits',
+                 '/fs/jw86600/jw86600008001_02101_00007_guider2_cal.fits',
+                 '/fs/jw86600/jw86600008001_gs-id_1_image_cal.fits',
+                 '/fs/other/nonstandard_name.fits']
+
+    assert group_exposures(filenames) == [
+        ['/fs/jw00327/jw00327-o001_t001_nircam_f150w_i2d.fits'],
+        ['/fs/jw00327/jw00327-o001_t001_nircam_f200w_i2d.fits'],
+        ['/fs/jw00327/jw00327001001_02101_00002_nrca1_rate.fits',
+         '/fs/jw00327/jw00327001001_02101_00002_nrcb1_rate.fits'],
+        ['/fs/jw00327/jw00327001001_02101_00002_nrca1_uncal.fits'],
+        ['/fs/jw00327/jw00327001001_02101_00002_nrca5_rate.fits',
+         '/fs/jw00327/jw00327001001_02101_00002_nrcb5_rate.fits'],
+        ['/fs/jw00327/jw00327001001_02101_00003_nrca1_rate.fits'],
+        ['/fs/jw86600/jw86600008001_02101_00007_guider1_cal.fits'],
+        ['/fs/jw86600/jw86600008001_02101_00007_guider2_cal.fits'],
+        ['/fs/other/nonstandard_name.fits']]
+
+
 @pytest.mark.skipif(os.path.expanduser('~') == '/home/jenkins',
                     reason='Requires access to central storage.')
 def test_filename_parser_whole_filesystem():
@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+
+"""Tests for the ``work_queue`` module.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    These tests can be run via the command line (omit the ``-s`` to
+    suppress verbose output to stdout):
+    ::
+
+        pytest -s test_work_queue.py
+"""
+
+import multiprocessing
+
+from jwql.utils.work_queue import WorkQueue
+
+
+def claim_all(path):
+    """Claim and complete tasks until the queue is empty, returning the
+    keys of the claimed tasks"""
+
+    queue = WorkQueue(path)
+    keys = []
+    task = queue.claim()
+    while task is not None:
+        task_id, key, _ = task
+        keys.append(key)
+        queue.complete(task_id)
+        task = queue.claim()
+
+    return keys
+
+
+def test_claim_and_complete(tmp_path):
+    """Test that tasks are claimed in order, retried after a failure,
+    and marked as failed once they run out of attempts"""
+
+    queue = WorkQueue(str(tmp_path / 'queue.db'), max_attempts=2)
+    assert queue.add({'a': {'files': ['a.fits']}, 'b': {'files': ['b.fits']}}) == 2
+    assert queue.add({'a': {'files': ['a.fits']}}) == 0
+
+    task_id, key, payload = queue.claim('worker-1')
+    assert key == 'a'
+    assert payload == {'files': ['a.fits']}
+    assert not queue.complete(task_id, 'worker-2')
+    assert queue.complete(task_id, 'worker-1', success=False)
+
+    task_id, key, _ = queue.claim('worker-1')
+    assert key == 'a'
+    assert queue.complete(task_id, 'worker-1', success=False)
+
+    task_id, key, _ = queue.claim('worker-1')
+    assert key == 'b'
+    assert queue.complete(task_id, 'worker-1')
+
+    assert queue.claim('worker-1') is None
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 1, 'failed': 1}
+
+    # Completed tasks that are added again are reset
+    assert queue.add({'b': {'files': ['b.fits']}}) == 1
+    assert queue.counts()['pending'] == 1
+
+
+def test_concurrent_claims(tmp_path):
+    """Test that each task is claimed by exactly one of several
+    competing processes"""
+
+    path = str(tmp_path / 'queue.db')
+    WorkQueue(path).add({str(i): {} for i in range(200)})
+
+    pool = multiprocessing.Pool(4)
+    keys = sum(pool.map(claim_all, [path] * 4), [])
+    pool.close()
+    pool.join()
+
+    assert sorted(keys, key=int) == [str(i) for i in range(200)]
+
+
+def test_expired_lease(tmp_path):
+    """Test that a task whose lease has expired is claimed by another
+    worker, and that the original worker can no longer release it"""
+
+    queue = WorkQueue(str(tmp_path / 'queue.db'), lease_time=-1)
+    queue.add({'a': {}})
+
+    task_id, _, _ = queue.claim('worker-1')
+    assert queue.claim('worker-2')[0] == task_id
+    assert not queue.heartbeat(task_id, 'worker-1')
+    assert queue.heartbeat(task_id, 'worker-2')
+    assert not queue.complete(task_id, 'worker-1')
+
+
+def test_priority(tmp_path):
+    """Test that higher priority tasks are claimed first, that adding a
+    pending task again raises its priority without duplicating it, and
+    that workers can be limited to high priority tasks"""
+
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.add({'a': {}, 'b': {}, 'c': {}})
+    assert queue.add({'d': {}, 'c': {}}, priority=1) == 1
+    assert queue.status(['b', 'c', 'e']) == {'b': 'pending', 'c': 'pending'}
+
+    task_id, key, _ = queue.claim('worker-1', min_priority=1)
+    assert key == 'c'
+    queue.complete(task_id, 'worker-1')
+    assert queue.status(['c']) == {'c': 'done'}
+
+    assert queue.claim('worker-1', min_priority=1)[1] == 'd'
+    assert queue.claim('worker-1', min_priority=1) is None
+    assert queue.claim('worker-1')[1] == 'a'
+
+
+def test_members(tmp_path):
+    """Test that tasks can be found and prioritized through their
+    members, with a member of several tasks taking the status of the
+    most active of them"""
+
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.add({'a.fits,b.fits': {}, 'c.fits': {}}, members={'a.fits,b.fits': ['a.fits', 'b.fits'],
+                                                            'c.fits': ['c.fits']})
+    queue.add({'a.fits': {}}, members={'a.fits': ['a.fits']})
+    assert queue.member_status(['a.fits', 'b.fits', 'd.fits']) == \
+        {'a.fits': 'pending', 'b.fits': 'pending'}
+
+    assert queue.prioritize(['b.fits'], 1) == 1
+    assert queue.prioritize(['b.fits'], 1) == 0
+    task_id, key, _ = queue.claim('worker-1', min_priority=1)
+    assert key == 'a.fits,b.fits'
+    assert queue.member_status(['a.fits']) == {'a.fits': 'running'}
+
+    queue.complete(task_id, 'worker-1')
+    assert queue.member_status(['a.fits', 'b.fits']) == {'a.fits': 'pending', 'b.fits': 'done'}
@@ -0,0 +1,322 @@
+#! /usr/bin/env python
+
+"""Keep a registry of the bad pixels found by the dark monitor.
+
+For each detector and type of bad pixel (``hot``, ``dead``, or
+``noisy``), the registry is a bitmap covering the full frame, with a
+bit set for each pixel that has been flagged. This makes checking
+whether pixels have been found before a matter of indexing the bitmap,
+rather than of searching every pixel ever recorded in the
+``<Instrument>DarkPixelStats`` tables.
+
+Each time pixels are added, a snapshot of the bitmap is saved, packed
+and compressed with ``zlib``, to the ``<Instrument>DarkPixelRegistry``
+table, so that the registry as it was on any date can be recovered.
+When loaded, a snapshot is brought up to date with any pixels recorded
+in the ``<Instrument>DarkPixelStats`` table since it was saved (or with
+all of them, if there is no snapshot yet).
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.database.database_interface import session
+        from jwql.utils.bad_pixel_registry import load_registry, save_registry
+        registry = load_registry(NIRCamDarkPixelRegistry, NIRCamDarkPixelStats, 'NRCA1', 'hot')
+        new_hot_pixels = registry.difference(hot_pixels)
+        registry.add(new_hot_pixels)
+        save_registry(NIRCamDarkPixelRegistry, 'NRCA1', 'hot', registry, datetime.datetime.now())
+        session.commit()
+
+Dependencies
+------------
+
+    The user must have a configuration file named ``config.json``
+    placed in the ``utils`` directory.
+"""
+
+import zlib
+
+import numpy as np
+
+from jwql.database.database_interface import session
+
+# Shape of the bitmaps, which covers the full frame of every detector
+REGISTRY_SHAPE = (2048, 2048)
+
+# Coordinate of the first pixel of the full frame. The dark monitor
+# shifts pixels to the full frame by adding the 1-based ``SUBSTRT1`` and
+# ``SUBSTRT2`` (see ``Dark.shift_to_full_frame``).
+COORDINATE_ORIGIN = 1
+
+
+class BadPixelRegistry():
+    """A set of pixels, kept as a bitmap covering the full frame.
+
+    Pixel coordinates are given as a tuple of two sequences, in the
+    order returned by ``numpy.where`` for an image (and stored in the
+    ``x_coord`` and ``y_coord`` columns of the bad pixel tables), and
+    are full frame coordinates starting at ``COORDINATE_ORIGIN``.
+
+    Attributes
+    ----------
+    bitmap : numpy.ndarray
+        2D boolean array, ``True`` for the pixels in the registry
+    """
+
+    def __init__(self, bitmap=None):
+        """Initialize the ``BadPixelRegistry`` object.
+
+        Parameters
+        ----------
+        bitmap : numpy.ndarray
+            2D boolean array of the pixels in the registry. If
+            ``None``, the registry starts empty.
+        """
+
+        if bitmap is None:
+            bitmap = np.zeros(REGISTRY_SHAPE, dtype=bool)
+        self.bitmap = bitmap
+
+    def __contains__(self, pixel):
+        """Return whether a single ``(x, y)`` pixel is in the registry"""
+
+        return bool(self.bitmap[self._indices(([pixel[0]], [pixel[1]]))][0])
+
+    def __len__(self):
+        """Return the number of pixels in the registry"""
+
+        return int(np.count_nonzero(self.bitmap))
+
+    def _indices(self, coordinates):
+        """Convert pixel coordinates to indices of the bitmap.
+
+        Parameters
+        ----------
+        coordinates : tuple
+            Tuple of two sequences containing the x and y coordinates
+            of the pixels
+
+        Returns
+        -------
+        indices : tuple
+            Tuple of two ``numpy.ndarray`` of indices into the bitmap
+
+        Raises
+        ------
+        ValueError
+            If any of the pixels are outside of the full frame
+        """
+
+        indices = tuple(np.asarray(axis, dtype=int) - COORDINATE_ORIGIN for axis in coordinates)
+        for axis, size in zip(indices, REGISTRY_SHAPE):
+            if np.any((axis < 0) | (axis >= size)):
+                raise ValueError('Pixel coordinates outside of the full frame: {}'.format(
+                    axis[(axis < 0) | (axis >= size)] + COORDINATE_ORIGIN))
+
+        return indices
+
+    def add(self, coordinates):
+        """Add pixels to the registry.
+
+        Parameters
+        ----------
+        coordinates : tuple
+            Tuple of two sequences containing the x and y coordinates
+            of the pixels
+        """
+
+        self.bitmap[self._indices(coordinates)] = True
+
+    def contains(self, coordinates):
+        """Determine which of the given pixels are in the registry.
+
+        Parameters
+        ----------
+        coordinates : tuple
+            Tuple of two sequences containing the x and y coordinates
+            of the pixels
+
+        Returns
+        -------
+        found : numpy.ndarray
+            1D boolean array, ``True`` for the pixels in the registry
+        """
+
+        return self.bitmap[self._indices(coordinates)]
+
+    @property
+    def coordinates(self):
+        """The x and y coordinates of the pixels in the registry, in the
+        order returned by ``numpy.where``"""
+
+        return tuple(axis + COORDINATE_ORIGIN for axis in np.where(self.bitmap))
+
+    def difference(self, coordinates):
+        """Return the given pixels that are not in the registry, in
+        their original order.
+
+        Parameters
+        ----------
+        coordinates : tuple
+            Tuple of two sequences containing the x and y coordinates
+            of the pixels
+
+        Returns
+        -------
+        new_pixels_x : list
+            List of x coordinates of the pixels not in the registry
+
+        new_pixels_y : list
+            List of y coordinates of the pixels not in the registry
+        """
+
+        x_coords = np.asarray(coordinates[0], dtype=int)
+        y_coords = np.asarray(coordinates[1], dtype=int)
+        new = ~self.bitmap[self._indices((x_coords, y_coords))]
+
+        return (x_coords[new].tolist(), y_coords[new].tolist())
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Create a registry from a bitmap packed by ``to_bytes``.
+
+        Parameters
+        ----------
+        data : bytes
+            The packed and compressed bitmap
+
+        Returns
+        -------
+        registry : BadPixelRegistry
+            The registry
+        """
+
+        bits = np.unpackbits(np.frombuffer(zlib.decompress(data), dtype=np.uint8))
+        bitmap = bits[:np.prod(REGISTRY_SHAPE)].reshape(REGISTRY_SHAPE).astype(bool)
+
+        return cls(bitmap)
+
+    def to_bytes(self):
+        """Pack the bitmap to one bit per pixel and compress it.
+
+        Returns
+        -------
+        data : bytes
+            The packed and compressed bitmap
+        """
+
+        return zlib.compress(np.packbits(self.bitmap).tobytes())
+
+    def union(self, other):
+        """Return a new registry with the pixels of this registry and
+        of another.
+
+        Parameters
+        ----------
+        other : BadPixelRegistry
+            The other registry
+
+        Returns
+        -------
+        registry : BadPixelRegistry
+            The combined registry
+        """
+
+        return BadPixelRegistry(self.bitmap | other.bitmap)
+
+
+def load_registry(registry_table, pixel_table, detector, pixel_type, date=None):
+    """Load the bad pixel registry of a detector and bad pixel type.
+
+    Parameters
+    ----------
+    registry_table : sqlalchemy table
+        The ``<Instrument>DarkPixelRegistry`` table
+
+    pixel_table : sqlalchemy table
+        The ``<Instrument>DarkPixelStats`` table
+
+    detector : str
+        Name of the detector, e.g. ``NRCA1``
+
+    pixel_type : str
+        Type of bad pixel. Options are ``hot``, ``dead``, and
+        ``noisy``
+
+    date : datetime.datetime
+        Load the registry as it was on this date. If ``None``, the
+        current registry is loaded.
+
+    Returns
+    -------
+    registry : BadPixelRegistry
+        The registry
+    """
+
+    # Start from the latest snapshot
+    query = session.query(registry_table) \
+        .filter(registry_table.detector == detector) \
+        .filter(registry_table.type == pixel_type)
+    if date is not None:
+        query = query.filter(registry_table.entry_date <= date)
+    snapshot = query.order_by(registry_table.entry_date.desc()).first()
+
+    if snapshot is not None:
+        registry = BadPixelRegistry.from_bytes(snapshot.bitmap)
+    else:
+        registry = BadPixelRegistry()
+
+    # Add any pixels recorded since the snapshot
+    query = session.query(pixel_table.x_coord, pixel_table.y_coord) \
+        .filter(pixel_table.detector == detector) \
+        .filter(pixel_table.type == pixel_type)
+    if snapshot is not None:
+        query = query.filter(pixel_table.entry_date > snapshot.entry_date)
+    if date is not None:
+        query = query.filter(pixel_table.entry_date <= date)
+    for x_coords, y_coords in query.all():
+        registry.add((x_coords, y_coords))
+
+    return registry
+
+
+def save_registry(registry_table, detector, pixel_type, registry, date):
+    """Save a snapshot of the bad pixel registry of a detector and bad
+    pixel type.  The snapshot is added to the current transaction of
+    the session, so that it is committed (or rolled back) along with
+    the pixels it records.
+
+    Parameters
+    ----------
+    registry_table : sqlalchemy table
+        The ``<Instrument>DarkPixelRegistry`` table
+
+    detector : str
+        Name of the detector, e.g. ``NRCA1``
+
+    pixel_type : str
+        Type of bad pixel. Options are ``hot``, ``dead``, and
+        ``noisy``
+
+    registry : BadPixelRegistry
+        The registry to save
+
+    date : datetime.datetime
+        Date of the snapshot
+    """
+
+    entry = {'detector': detector,
+             'type': pixel_type,
+             'pixel_count': len(registry),
+             'bitmap': registry.to_bytes(),
+             'entry_date': date}
+    session.execute(registry_table.__table__.insert(), [entry])
@@ -16,12 +16,25 @@ Use
         mean_val, stdev_val = calculations.mean_stdev(image, sigma_threshold=4)
  """
 
+from multiprocessing import get_context
+
 import numpy as np
 
+from astropy.io import fits
 from astropy.modeling import fitting, models
-from astropy.stats import sigma_clip
 from scipy.optimize import curve_fit
-from scipy.stats import sigmaclip
+
+# Number of pixel values (images x pixels) in each block of rows that
+# ``mean_image_stack`` works on
+MEAN_IMAGE_BLOCK_SIZE = 2**24
+
+# Number of values that ``sigma_clipped_mean_stdev`` sorts and sums at
+# once
+SIGMA_CLIP_CHUNK_SIZE = 2**20
+
+# Scale factor that makes the median absolute deviation an estimate of
+# the standard deviation of normally distributed values
+MAD_STD_SCALE = 1.482602218505602
 
 
 def double_gaussian(x, amp1, peak1, sigma1, amp2, peak2, sigma2):
@@ -110,6 +123,39 @@ def gaussian1d_fit(x_values, y_values, params):
     return amplitude, peak, width
 
 
+def histogram_moments(hist, bin_centers):
+    """Calculate the peak, mean, and standard deviation of each of a
+    set of histograms sharing the same bins
+
+    Parameters
+    ----------
+    hist : numpy.ndarray
+        2D array containing one histogram per row
+
+    bin_centers : numpy.ndarray
+        1D array of bin centers that match the ``hist`` values
+
+    Returns
+    -------
+    peak : numpy.ndarray
+        Largest value of each histogram
+
+    mean_value : numpy.ndarray
+        Mean of the values in each histogram
+
+    stdev_value : numpy.ndarray
+        Standard deviation of the values in each histogram
+    """
+
+    total = np.sum(hist, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_value = np.sum(hist * bin_centers, axis=1) / total
+        deviations = bin_centers - mean_value[:, np.newaxis]
+        stdev_value = np.sqrt(np.sum(hist * deviations**2, axis=1) / total)
+
+    return np.max(hist, axis=1), mean_value, stdev_value
+
+
 def mean_image(cube, sigma_threshold=3):
     """Combine a stack of 2D images into a mean slope image, using
     sigma-clipping on a pixel-by-pixel basis
@@ -132,13 +178,84 @@ def mean_image(cube, sigma_threshold=3):
         2D sigma-clipped standard deviation image
     """
 
-    clipped_cube = sigma_clip(cube, sigma=sigma_threshold, axis=0, masked=False)
-    mean_image = np.nanmean(clipped_cube, axis=0)
-    std_image = np.nanstd(clipped_cube, axis=0)
+    mean_image, std_image = sigma_clipped_mean_stdev(cube, sigma_threshold=sigma_threshold, axis=0)
 
     return mean_image, std_image
 
 
+def mean_image_stack(images, sigma_threshold=3, block_size=MEAN_IMAGE_BLOCK_SIZE, processes=1,
+                     start_method=None):
+    """Combine a stack of 2D images into a mean slope image, using
+    sigma-clipping on a pixel-by-pixel basis, as ``mean_image`` does.
+    The stack is never assembled in full. Instead the detector is
+    worked through a block of rows at a time, with FITS files
+    memory-mapped, so that the memory used does not depend on the
+    number of images. The results are identical to those of
+    ``mean_image`` on the full stack.
+
+    Parameters
+    ----------
+    images : list
+        2D or 3D arrays, or names of FITS files with the images in
+        their first extension, to be stacked along their first axis.
+        When using several processes, only the rows of a block of the
+        arrays, and only the names of the files, are sent to the
+        process working on it.
+
+    sigma_threshold : int
+        Number of sigma to use when sigma-clipping values in each
+        pixel
+
+    block_size : int
+        Approximate number of pixel values in each block of rows
+
+    processes : int
+        Number of processes that work on blocks at the same time
+
+    start_method : str
+        ``multiprocessing`` start method of the processes (e.g.
+        ``forkserver``, which is safe to use from a multithreaded
+        process). If ``None``, the platform default is used.
+
+    Returns
+    -------
+    mean_image : numpy.ndarray
+        2D sigma-clipped mean image
+
+    stdev_image : numpy.ndarray
+        2D sigma-clipped standard deviation image
+    """
+
+    # Check that the images can be stacked, without reading the data
+    nimages = 0
+    for i, image in enumerate(_stack_images(images)):
+        if image.ndim > 3:
+            raise ValueError("4-dimensional input slope images not supported.")
+        if i == 0:
+            ny, nx = image.shape[-2:]
+        elif image.shape[-2:] != (ny, nx):
+            raise ValueError("Input images are of inconsistent size in x/y dimension.")
+        nimages += image.shape[0]
+
+    nrows = max(1, block_size // (nimages * nx))
+    blocks = []
+    for row in range(0, ny, nrows):
+        rows = slice(row, min(row + nrows, ny))
+        block_images = [image if isinstance(image, str) else image[..., rows, :]
+                        for image in images]
+        blocks.append((block_images, rows, sigma_threshold))
+    if processes > 1:
+        pool = get_context(start_method).Pool(min(processes, len(blocks)))
+        results = pool.starmap(_mean_image_block, blocks)
+        pool.close()
+        pool.join()
+    else:
+        results = [_mean_image_block(*block) for block in blocks]
+
+    mean_image_rows, std_image_rows = zip(*results)
+    return np.concatenate(mean_image_rows), np.concatenate(std_image_rows)
+
+
 def mean_stdev(image, sigma_threshold=3):
     """Calculate the sigma-clipped mean and stdev of an input array
 
@@ -159,8 +276,471 @@ def mean_stdev(image, sigma_threshold=3):
         Sigma-clipped standard deviation of image
     """
 
-    clipped, lower, upper = sigmaclip(image, low=sigma_threshold, high=sigma_threshold)
-    mean_value = np.mean(clipped)
-    stdev_value = np.std(clipped)
+    mean_value, stdev_value = sigma_clipped_mean_stdev(image, sigma_threshold=sigma_threshold,
+                                                       cenfunc='mean', maxiters=None)
 
     return mean_value, stdev_value
+
+
+def region_histograms(image, regions, ranges, grid_key):
+    """Histogram several regions of an image on a shared grid of bins.
+
+    The bins are those that ``numpy.histogram`` chooses with
+    ``bins='auto'`` for the ``grid_key`` region over its own range,
+    extended by whole bins to cover the ranges of the other regions.
+    Each pixel is assigned to a bin once, and the histogram of each
+    region is counted from the bin assignments.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        2D image
+
+    regions : dict
+        Coordinates of each region,
+        ``regions[key] = [(xmin, ymin), (xmax, ymax)]``
+
+    ranges : dict
+        ``(lower, upper)`` range of the values to histogram in each
+        region, with the same keys as ``regions``
+
+    grid_key : str
+        Key of the region whose bins define the grid
+
+    Returns
+    -------
+    hist : numpy.ndarray
+        2D array containing the histogram of each region, in the
+        order of ``regions``, over all bins of the grid
+
+    bin_centers : numpy.ndarray
+        1D array of bin centers that match the ``hist`` values
+
+    windows : dict
+        Slice of the bins covering the range of each region
+    """
+
+    # Find the width of the bins, and how many to add below and above
+    # the range of the grid region to cover the other regions
+    (x_start, y_start), (x_end, y_end) = regions[grid_key]
+    lower, upper = ranges[grid_key]
+    grid_edges = np.histogram_bin_edges(image[y_start: y_end, x_start: x_end], bins='auto',
+                                        range=(lower, upper))
+    grid_bins = len(grid_edges) - 1
+    width = (upper - lower) / grid_bins
+    bins_below = int(np.ceil((lower - min(low for low, high in ranges.values())) / width))
+    bins_above = int(np.ceil((max(high for low, high in ranges.values()) - upper) / width))
+    nbins = bins_below + grid_bins + bins_above
+    bin_edges = np.concatenate([lower - width * np.arange(bins_below, 0, -1), grid_edges,
+                                upper + width * np.arange(1, bins_above + 1)])
+
+    # Assign each pixel to a bin, correcting for round-off at the bin
+    # edges as numpy.histogram does. Pixels outside the grid are put
+    # in an extra bin that is dropped.
+    values = image.astype(np.float64)
+    with np.errstate(invalid='ignore'):
+        outside = ~((values >= bin_edges[0]) & (values <= bin_edges[-1]))
+        values[outside] = bin_edges[0]
+    indices = ((values - bin_edges[0]) / width).astype(np.intp)
+    indices[indices == nbins] -= 1
+    indices[values < bin_edges[indices]] -= 1
+    indices[(values >= bin_edges[indices + 1]) & (indices != nbins - 1)] += 1
+    indices[outside] = nbins
+
+    hist = np.empty((len(regions), nbins), dtype=np.intp)
+    windows = {}
+    for i, key in enumerate(regions):
+        (x_start, y_start), (x_end, y_end) = regions[key]
+        counts = np.bincount(indices[y_start: y_end, x_start: x_end].ravel(), minlength=nbins + 1)
+        hist[i] = counts[:nbins]
+
+        if key == grid_key:
+            windows[key] = slice(bins_below, bins_below + grid_bins)
+        else:
+            low, high = ranges[key]
+            first = max(0, int(np.floor((low - bin_edges[0]) / width)))
+            last = min(nbins, int(np.ceil((high - bin_edges[0]) / width)))
+            windows[key] = slice(first, last)
+
+    bin_centers = (bin_edges[1:] + bin_edges[0: -1]) / 2.
+
+    return hist, bin_centers, windows
+
+
+def sigma_clipped_mean_stdev(data, sigma_threshold=3, axis=None, cenfunc='median', stdfunc='std',
+                             maxiters=5, clip_data=False):
+    """Iteratively sigma-clip the data along an axis and calculate the
+    mean and standard deviation of the values that remain.
+
+    In each iteration, values further than ``sigma_threshold`` times
+    the spread from the center are rejected, until no more values are
+    rejected or ``maxiters`` iterations have been made. Non-finite
+    values are always rejected. This reproduces the clipping of
+    ``astropy.stats.sigma_clip`` (and of ``scipy.stats.sigmaclip``
+    with ``cenfunc='mean'`` and ``maxiters=None``), but works on the
+    values of each pixel sorted once, so that the remaining values
+    are always a contiguous run of them, and the values of pixels that
+    no longer change are not clipped again. Float32 data are not
+    converted to float64 as a whole, and statistics are accumulated
+    in float64.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Array of values to clip
+
+    sigma_threshold : float
+        Number of sigma to use when sigma-clipping
+
+    axis : int
+        Axis along which to clip. If ``None``, all values are clipped
+        together.
+
+    cenfunc : str
+        Center of the values, ``'median'`` or ``'mean'``
+
+    stdfunc : str
+        Spread of the values, ``'std'`` for the standard deviation or
+        ``'mad_std'`` for the scaled median absolute deviation
+
+    maxiters : int
+        Maximum number of clipping iterations. If ``None``, clip until
+        no more values are rejected.
+
+    clip_data : bool
+        If ``True``, rejected values in ``data`` (which must be a
+        floating point array) are replaced with NaN, in place
+
+    Returns
+    -------
+    mean_value : numpy.ndarray or float
+        Sigma-clipped mean, with ``axis`` removed
+
+    stdev_value : numpy.ndarray or float
+        Sigma-clipped standard deviation, with ``axis`` removed
+    """
+
+    if cenfunc not in ['median', 'mean']:
+        raise ValueError("Unknown cenfunc {}. Use 'median' or 'mean'.".format(cenfunc))
+    if stdfunc not in ['std', 'mad_std']:
+        raise ValueError("Unknown stdfunc {}. Use 'std' or 'mad_std'.".format(stdfunc))
+
+    # Arrange the data so that the values of each pixel form a column
+    if axis is None:
+        values = np.ravel(data)[:, np.newaxis]
+        shape = ()
+    else:
+        values = np.moveaxis(data, axis, 0)
+        shape = values.shape[1:]
+        values = values.reshape(values.shape[0], -1)
+
+    nvalues, npixels = values.shape
+    mean_value = np.empty(npixels)
+    stdev_value = np.empty(npixels)
+    lower_value = np.empty(npixels)
+    upper_value = np.empty(npixels)
+
+    if npixels == 1:
+        mean_value[0], stdev_value[0], lower_value[0], upper_value[0] = _sigma_clip_values(
+            values[:, 0], sigma_threshold, cenfunc, stdfunc, maxiters)
+    else:
+        chunk = max(1, SIGMA_CLIP_CHUNK_SIZE // max(1, nvalues))
+        for start in range(0, npixels, chunk):
+            stop = min(start + chunk, npixels)
+            (mean_value[start:stop], stdev_value[start:stop],
+             lower_value[start:stop], upper_value[start:stop]) = _sigma_clip_columns(
+                values[:, start:stop], sigma_threshold, cenfunc, stdfunc, maxiters)
+
+    if clip_data:
+        lower_value = lower_value.reshape(shape)
+        upper_value = upper_value.reshape(shape)
+        if axis is not None:
+            lower_value = np.expand_dims(lower_value, axis)
+            upper_value = np.expand_dims(upper_value, axis)
+        with np.errstate(invalid='ignore'):
+            data[~((data >= lower_value) & (data <= upper_value))] = np.nan
+
+    return mean_value.reshape(shape)[()], stdev_value.reshape(shape)[()]
+
+
+def _mean_image_block(images, rows, sigma_threshold):
+    """Calculate the sigma-clipped mean and standard deviation images
+    for one block of rows of a stack of images. Used by
+    ``mean_image_stack``.
+
+    Parameters
+    ----------
+    images : list
+        2D or 3D arrays of the rows of the block, or names of FITS
+        files with the images in their first extension
+
+    rows : slice
+        The rows of the block, which are read from the files
+
+    sigma_threshold : int
+        Number of sigma to use when sigma-clipping values in each
+        pixel
+
+    Returns
+    -------
+    mean_image : numpy.ndarray
+        2D sigma-clipped mean image of the block
+
+    stdev_image : numpy.ndarray
+        2D sigma-clipped standard deviation image of the block
+    """
+
+    images = [image[:, rows, :] if isinstance(name, str) else image
+              for name, image in zip(images, _stack_images(images))]
+    nimages = sum([image.shape[0] for image in images])
+    nx = images[0].shape[-1]
+    block = np.empty((nimages, rows.stop - rows.start, nx), dtype=np.result_type(*images))
+    start = 0
+    for image in images:
+        block[start:start + image.shape[0]] = image
+        start += image.shape[0]
+
+    return mean_image(block, sigma_threshold=sigma_threshold)
+
+
+def _sigma_clip_columns(values, sigma_threshold, cenfunc, stdfunc, maxiters):
+    """Sigma-clip each column of a 2D array. Used by
+    ``sigma_clipped_mean_stdev``.
+
+    The columns are sorted, after which the values that remain are
+    the rows ``lower`` to ``upper`` of each column, and the median can
+    be read from them directly. The mean and standard deviation are
+    summed over the values in their original order, as ``numpy.nanmean``
+    and ``numpy.nanstd`` do. After each iteration, only the columns in
+    which values were rejected are clipped again.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2D array, with the values of each pixel in a column
+
+    sigma_threshold : float
+        Number of sigma to use when sigma-clipping
+
+    cenfunc : str
+        Center of the values, ``'median'`` or ``'mean'``
+
+    stdfunc : str
+        Spread of the values, ``'std'`` or ``'mad_std'``
+
+    maxiters : int
+        Maximum number of clipping iterations, or ``None``
+
+    Returns
+    -------
+    mean_value : numpy.ndarray
+        Sigma-clipped mean of each column
+
+    stdev_value : numpy.ndarray
+        Sigma-clipped standard deviation of each column
+
+    lower_value : numpy.ndarray
+        Smallest value remaining in each column
+
+    upper_value : numpy.ndarray
+        Largest value remaining in each column
+    """
+
+    sorted_values = np.sort(values, axis=0)
+    nrows, ncolumns = sorted_values.shape
+    rows = np.arange(nrows)[:, np.newaxis]
+
+    # Non-finite values sort to the ends of the columns
+    lower = np.zeros(ncolumns, dtype=int)
+    upper = np.full(ncolumns, nrows)
+    nonfinite = ~(np.isfinite(sorted_values[0]) & np.isfinite(sorted_values[-1]))
+    if np.any(nonfinite):
+        with np.errstate(invalid='ignore'):
+            lower[nonfinite] = np.count_nonzero(sorted_values[:, nonfinite] == -np.inf, axis=0)
+            upper[nonfinite] = np.count_nonzero(sorted_values[:, nonfinite] < np.inf, axis=0)
+
+    mean_value = np.empty(ncolumns)
+    stdev_value = np.empty(ncolumns)
+    active = np.arange(ncolumns)
+    subset = sorted_values
+    subset_values = values
+    iteration = 0
+    while active.size > 0:
+        subset_lower = lower[active]
+        subset_upper = upper[active]
+        count = subset_upper - subset_lower
+        columns = np.arange(active.size)
+
+        # The values that remain are the finite ones at first, and then
+        # those between the smallest and largest remaining values
+        remaining = subset_values.astype(np.float64)
+        if iteration == 0:
+            excluded = ~np.isfinite(remaining)
+        else:
+            lowest = subset[np.clip(subset_lower, 0, nrows - 1), columns]
+            highest = subset[np.clip(subset_upper - 1, 0, nrows - 1), columns]
+            lowest = np.where(count > 0, lowest, np.inf)
+            highest = np.where(count > 0, highest, -np.inf)
+            with np.errstate(invalid='ignore'):
+                excluded = ~((remaining >= lowest) & (remaining <= highest))
+        remaining[excluded] = 0.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = _sum_rows(remaining) / count
+            np.subtract(remaining, mean, out=remaining)
+            remaining[excluded] = 0.
+            stdev = np.sqrt(_sum_rows(np.square(remaining, out=remaining)) / count)
+        mean_value[active] = mean
+        stdev_value[active] = stdev
+
+        if iteration == maxiters:
+            break
+        iteration += 1
+
+        if cenfunc == 'median' or stdfunc == 'mad_std':
+            low = subset[np.clip(subset_lower + (count - 1) // 2, 0, nrows - 1), columns]
+            high = subset[np.clip(subset_lower + count // 2, 0, nrows - 1), columns]
+            median = (low.astype(np.float64) + high) / 2
+        center = median if cenfunc == 'median' else mean
+        if stdfunc == 'mad_std':
+            with np.errstate(invalid='ignore'):
+                deviations = np.abs(subset - median)
+                deviations[(rows < subset_lower) | (rows >= subset_upper)] = np.nan
+                stdev = np.nanmedian(deviations, axis=0) * MAD_STD_SCALE
+
+        with np.errstate(invalid='ignore'):
+            below = np.count_nonzero(subset < center - sigma_threshold * stdev, axis=0)
+            not_above = np.count_nonzero(subset <= center + sigma_threshold * stdev, axis=0)
+        new_lower = np.maximum(subset_lower, below)
+        new_upper = np.minimum(subset_upper, not_above)
+        new_upper = np.maximum(new_upper, new_lower)
+        lower[active] = new_lower
+        upper[active] = new_upper
+
+        changed = (new_lower != subset_lower) | (new_upper != subset_upper)
+        active = active[changed]
+        subset = subset[:, changed]
+        subset_values = subset_values[:, changed]
+
+    columns = np.arange(ncolumns)
+    empty = upper == lower
+    lower_value = sorted_values[np.clip(lower, 0, nrows - 1), columns].astype(np.float64)
+    upper_value = sorted_values[np.clip(upper - 1, 0, nrows - 1), columns].astype(np.float64)
+    lower_value[empty] = np.inf
+    upper_value[empty] = -np.inf
+
+    return mean_value, stdev_value, lower_value, upper_value
+
+
+def _sigma_clip_values(values, sigma_threshold, cenfunc, stdfunc, maxiters):
+    """Sigma-clip a 1D array, by removing the rejected values in each
+    iteration, as ``scipy.stats.sigmaclip`` does. Used by
+    ``sigma_clipped_mean_stdev`` when all values are clipped together,
+    for which sorting them would be slower.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        1D array of values
+
+    sigma_threshold : float
+        Number of sigma to use when sigma-clipping
+
+    cenfunc : str
+        Center of the values, ``'median'`` or ``'mean'``
+
+    stdfunc : str
+        Spread of the values, ``'std'`` or ``'mad_std'``
+
+    maxiters : int
+        Maximum number of clipping iterations, or ``None``
+
+    Returns
+    -------
+    mean_value : float
+        Sigma-clipped mean
+
+    stdev_value : float
+        Sigma-clipped standard deviation
+
+    lower_value : float
+        Smallest value remaining
+
+    upper_value : float
+        Largest value remaining
+    """
+
+    remaining = values.astype(np.float64)
+    if not np.all(np.isfinite(remaining)):
+        remaining = remaining[np.isfinite(remaining)]
+    iteration = 0
+    while remaining.size > 0:
+        mean = np.mean(remaining)
+        stdev = np.std(remaining)
+        if iteration == maxiters:
+            break
+        iteration += 1
+
+        if cenfunc == 'median' or stdfunc == 'mad_std':
+            median = np.median(remaining)
+        center = median if cenfunc == 'median' else mean
+        if stdfunc == 'mad_std':
+            stdev = np.median(np.abs(remaining - median)) * MAD_STD_SCALE
+
+        keep = ((remaining >= center - sigma_threshold * stdev) &
+                (remaining <= center + sigma_threshold * stdev))
+        if np.all(keep):
+            break
+        remaining = remaining[keep]
+
+    if remaining.size == 0:
+        return np.nan, np.nan, np.inf, -np.inf
+
+    return mean, stdev, remaining.min(), remaining.max()
+
+
+def _stack_images(images):
+    """Yield the given images as 3D arrays, memory-mapping those given
+    as FITS file names.
+
+    Parameters
+    ----------
+    images : list
+        2D or 3D arrays, or names of FITS files with the images in
+        their first extension
+
+    Yields
+    ------
+    image : numpy.ndarray
+        3D array of the images
+    """
+
+    for image in images:
+        if isinstance(image, str):
+            with fits.open(image, memmap=True) as hdu:
+                image = hdu[1].data
+        if image.ndim == 2:
+            image = image[np.newaxis, :, :]
+        yield image
+
+
+def _sum_rows(values):
+    """Sum the rows of a 2D array one after the other, which is the
+    order in which ``numpy`` sums a cube along its first axis,
+    however many columns there are. Used by ``_sigma_clip_columns``.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2D array of values
+
+    Returns
+    -------
+    total : numpy.ndarray
+        Sum of each column
+    """
+
+    total = np.zeros(values.shape[1])
+    for row in values:
+        total += row
+
+    return total
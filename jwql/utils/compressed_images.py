@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+
+"""Write and read images as tile-compressed float32 FITS.
+
+Images such as the mean dark and standard deviation images of the dark
+monitor are written as float32, losslessly compressed with
+``GZIP_2``, with each row of the image compressed as a separate tile.
+Regions and decimated views of an image can then be read by
+decompressing only the rows they contain, where the installed
+``astropy`` supports sections of compressed images (version 5.3 and
+later; older versions decompress the whole image). Images in
+uncompressed FITS files are read through memory mapping, so that only
+the requested region is read from disk.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.compressed_images import read_image_region, write_compressed_images
+        write_compressed_images(filename, {'MEAN': mean_image, 'STDEV': stdev_image})
+        cutout = read_image_region(filename, 'MEAN', region=[(100, 200), (164, 264)])
+        thumbnail = read_image_region(filename, 'MEAN', step=8)
+"""
+
+from astropy.io import fits
+import numpy as np
+
+from jwql.utils.permissions import set_permissions
+
+
+def read_image_region(filename, extname, region=None, step=1):
+    """Read a region of an image, optionally keeping only every
+    ``step``-th row and column.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file
+
+    extname : str
+        Name of the extension containing the image
+
+    region : list
+        Coordinates of the region, ``[(xmin, ymin), (xmax, ymax)]``. If
+        ``None``, the whole image is read.
+
+    step : int
+        Keep every ``step``-th row and column of the region
+
+    Returns
+    -------
+    image : numpy.ndarray
+        2D array of the region
+    """
+
+    if region is None:
+        region = [(None, None), (None, None)]
+    (x_start, y_start), (x_end, y_end) = region
+    index = (slice(y_start, y_end, step), slice(x_start, x_end, step))
+
+    with fits.open(filename) as hdu_list:
+        hdu = hdu_list[extname]
+        if hasattr(hdu, 'section'):
+            image = np.array(hdu.section[index])
+        else:
+            image = np.array(hdu.data[index])
+
+    return image
+
+
+def write_compressed_images(filename, images, header=None):
+    """Write images to a FITS file as tile-compressed float32, one
+    extension per image.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the FITS file
+
+    images : dict
+        2D images, keyed by extension name
+
+    header : astropy.io.fits.Header
+        Header of the primary extension
+    """
+
+    hdu_list = fits.HDUList([fits.PrimaryHDU(header=header)])
+    for extname, image in images.items():
+        image = np.asarray(image, dtype=np.float32)
+
+        # Each row is compressed as a separate tile (the default), and
+        # a quantize level of 0 makes the compression lossless
+        hdu_list.append(fits.CompImageHDU(image, name=extname, compression_type='GZIP_2',
+                                          quantize_level=0.))
+
+    hdu_list.writeto(filename, overwrite=True)
+    set_permissions(filename)
@@ -0,0 +1,396 @@
+#! /usr/bin/env python
+
+"""Maintain and query a persistent catalog of the FITS files in the
+``jwql`` filesystem.
+
+The catalog is stored in the ``filesystem_catalog`` database table,
+with one record per FITS file holding the filename properties parsed
+by ``filename_parser`` (program, observation, visit, detector, suffix,
+instrument, etc.).  Lookups by instrument, proposal, or rootname are
+answered from the catalog, so the web app rarely has to search the
+filesystem itself.  Rootnames missing from the catalog (e.g. files
+that arrived since the previous update) are looked for in the
+filesystem.
+
+The catalog is updated incrementally.  The modification time of each
+program subdirectory is stored in the ``filesystem_catalog_directory``
+table, and only those subdirectories whose modification time has
+changed since the previous update are rescanned.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    The catalog is updated by each run of ``monitor_filesystem``.
+    This module can also be executed from the command line to update
+    the catalog:
+
+    ::
+
+        python file_catalog.py
+
+    The lookup functions can be imported as such:
+
+    ::
+
+        from jwql.utils.file_catalog import get_filenames_by_proposal
+        filenames = get_filenames_by_proposal('86700')
+
+Dependencies
+------------
+
+    The user must have a configuration file named ``config.json``
+    placed in the ``utils`` directory.
+"""
+
+import glob
+import logging
+import os
+
+from sqlalchemy import func
+
+from jwql.database.database_interface import session
+from jwql.database.database_interface import FilesystemCatalog
+from jwql.database.database_interface import FilesystemCatalogDirectory
+from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.utils import filename_parser_batch, get_config
+
+# Filename properties that are stored in the catalog
+CATALOG_PROPERTIES = ['program_id', 'observation', 'visit', 'visit_group', 'parallel_seq_id',
+                      'activity', 'exposure_id', 'detector', 'suffix', 'instrument',
+                      'filename_type']
+
+
+def get_all_proposals():
+    """Return a list of all proposals that exist in the catalog.
+
+    Returns
+    -------
+    proposals : list
+        A sorted list of proposal numbers (e.g. ``86700``)
+    """
+
+    results = session.query(FilesystemCatalog.directory).distinct().all()
+    proposals = [directory.split('jw')[-1] for directory, in results]
+    proposals = sorted([proposal for proposal in proposals if len(proposal) == 5])
+
+    return proposals
+
+
+def get_file_counts_by_proposal(proposals):
+    """Return the number of FITS files that exist for each of the
+    given ``proposals``.
+
+    Parameters
+    ----------
+    proposals : list
+        A list of five-digit proposal numbers (e.g. ``86700``)
+
+    Returns
+    -------
+    file_counts : dict
+        Keys are the proposal numbers, values are the number of FITS
+        files in the catalog for that proposal
+    """
+
+    directories = ['jw{}'.format(proposal) for proposal in proposals]
+    results = session.query(FilesystemCatalog.directory, func.count(FilesystemCatalog.id))\
+        .filter(FilesystemCatalog.directory.in_(directories))\
+        .group_by(FilesystemCatalog.directory).all()
+    counts = dict(results)
+
+    file_counts = {proposal: counts.get('jw{}'.format(proposal), 0) for proposal in proposals}
+
+    return file_counts
+
+
+def get_filenames_by_instrument(instrument):
+    """Return the paths, relative to the filesystem, of the FITS files
+    that belong to the given ``instrument``.
+
+    Parameters
+    ----------
+    instrument : str
+        The instrument of interest (e.g. ``NIRCam``)
+
+    Returns
+    -------
+    filepaths : list
+        A list of paths of the form ``<directory>/<filename>``
+    """
+
+    results = session.query(FilesystemCatalog.directory, FilesystemCatalog.filename)\
+        .filter(FilesystemCatalog.instrument == instrument.lower())\
+        .order_by(FilesystemCatalog.filename).all()
+    filepaths = [os.path.join(directory, filename) for directory, filename in results]
+
+    return filepaths
+
+
+def get_filenames_by_proposal(proposal):
+    """Return a list of the FITS files in the catalog for the given
+    ``proposal``.
+
+    Parameters
+    ----------
+    proposal : str
+        The five-digit proposal number (e.g. ``88600``)
+
+    Returns
+    -------
+    filenames : list
+        A sorted list of filenames associated with the given
+        ``proposal``
+    """
+
+    results = session.query(FilesystemCatalog.filename)\
+        .filter(FilesystemCatalog.directory == 'jw{}'.format(proposal))\
+        .order_by(FilesystemCatalog.filename).all()
+    filenames = [filename for filename, in results]
+
+    return filenames
+
+
+def get_filenames_by_rootname(rootname):
+    """Return a list of the FITS files that are part of the given
+    ``rootname``.  If the catalog has none, the filesystem is searched
+    instead, so that files added since the catalog was last updated
+    are found.
+
+    Parameters
+    ----------
+    rootname : str
+        The rootname of interest (e.g.
+        ``jw86600008001_02101_00007_guider2``)
+
+    Returns
+    -------
+    filenames : list
+        A sorted list of filenames associated with the given
+        ``rootname``
+    """
+
+    proposal = rootname.split('_')[0].split('jw')[-1][0:5]
+    results = session.query(FilesystemCatalog.filename)\
+        .filter(FilesystemCatalog.directory == 'jw{}'.format(proposal))\
+        .filter(FilesystemCatalog.filename.startswith(rootname, autoescape=True))\
+        .order_by(FilesystemCatalog.filename).all()
+    filenames = [filename for filename, in results]
+
+    if not filenames:
+        search_filepath = os.path.join(get_config()['filesystem'], 'jw{}'.format(proposal),
+                                       '{}*.fits'.format(glob.escape(rootname)))
+        filenames = sorted([os.path.basename(filepath) for filepath in glob.glob(search_filepath)])
+
+    return filenames
+
+
+def get_instruments_by_proposal(proposal):
+    """Return the instruments used by the FITS files in the catalog
+    for the given ``proposal``.
+
+    Parameters
+    ----------
+    proposal : str
+        The five-digit proposal number (e.g. ``88600``)
+
+    Returns
+    -------
+    instruments : list
+        A sorted list of instrument names (e.g. ``nircam``)
+    """
+
+    results = session.query(FilesystemCatalog.instrument)\
+        .filter(FilesystemCatalog.directory == 'jw{}'.format(proposal))\
+        .filter(FilesystemCatalog.instrument.isnot(None))\
+        .distinct().all()
+    instruments = sorted([instrument for instrument, in results])
+
+    return instruments
+
+
+def scan_directory(directory_path):
+    """Gather the catalog records for all of the FITS files within the
+    given directory.
+
+    Parameters
+    ----------
+    directory_path : str
+        Full path to the directory to scan
+
+    Returns
+    -------
+    records : dict
+        Keys are the filenames, values are dictionaries holding the
+        catalog columns for the file.  Files that do not follow the
+        JWST naming conventions are kept, with their parsed properties
+        set to ``None``.
+    """
+
+    directory = os.path.basename(os.path.normpath(directory_path))
+
+    entries = []
+    with os.scandir(directory_path) as directory_entries:
+        for entry in directory_entries:
+            if entry.name.endswith('.fits') and entry.is_file():
+                entries.append(entry)
+
+    filename_info = filename_parser_batch([entry.name for entry in entries])
+
+    records = {}
+    for i, entry in enumerate(entries):
+        stat = entry.stat()
+        record = {prop: filename_info[prop][i] for prop in CATALOG_PROPERTIES}
+        record['filename'] = entry.name
+        record['directory'] = directory
+        record['size'] = stat.st_size
+        record['mtime'] = stat.st_mtime
+        records[entry.name] = record
+
+    return records
+
+
+def update_catalog(filesystem_dir):
+    """Bring the catalog up to date with the given filesystem.  Only
+    subdirectories whose modification times have changed since the
+    previous update are rescanned.
+
+    Parameters
+    ----------
+    filesystem_dir : str
+        Path to the top level of the filesystem, which contains one
+        subdirectory per program
+
+    Returns
+    -------
+    summary : dict
+        The number of directories scanned and of files added, updated,
+        and removed
+    """
+
+    summary = {'directories_scanned': 0, 'added': 0, 'updated': 0, 'removed': 0}
+
+    # Directory modification times as of the previous update
+    known_directories = dict(session.query(FilesystemCatalogDirectory.directory,
+                                           FilesystemCatalogDirectory.mtime).all())
+
+    current_directories = {}
+    with os.scandir(filesystem_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                current_directories[entry.name] = entry.stat().st_mtime
+
+    # Remove directories that no longer exist
+    for directory in set(known_directories) - set(current_directories):
+        summary['removed'] += session.query(FilesystemCatalog)\
+            .filter(FilesystemCatalog.directory == directory).delete(synchronize_session=False)
+        session.query(FilesystemCatalogDirectory)\
+            .filter(FilesystemCatalogDirectory.directory == directory)\
+            .delete(synchronize_session=False)
+        session.commit()
+        logging.info('Removed {} from the catalog'.format(directory))
+
+    # Rescan only the directories that have changed
+    for directory in sorted(current_directories):
+        mtime = current_directories[directory]
+        if known_directories.get(directory) == mtime:
+            continue
+
+        added, updated, removed = update_directory(filesystem_dir, directory, mtime)
+        summary['directories_scanned'] += 1
+        summary['added'] += added
+        summary['updated'] += updated
+        summary['removed'] += removed
+
+    return summary
+
+
+def update_directory(filesystem_dir, directory, mtime):
+    """Rescan a single directory of the filesystem and synchronize its
+    catalog records.
+
+    Parameters
+    ----------
+    filesystem_dir : str
+        Path to the top level of the filesystem
+    directory : str
+        Name of the subdirectory to rescan (e.g. ``jw86700``)
+    mtime : float
+        Modification time of the subdirectory
+
+    Returns
+    -------
+    added : int
+        Number of files added to the catalog
+    updated : int
+        Number of files whose records were updated
+    removed : int
+        Number of files removed from the catalog
+    """
+
+    records = scan_directory(os.path.join(filesystem_dir, directory))
+
+    existing = session.query(FilesystemCatalog.filename, FilesystemCatalog.size,
+                             FilesystemCatalog.mtime)\
+        .filter(FilesystemCatalog.directory == directory).all()
+    existing = {filename: (size, file_mtime) for filename, size, file_mtime in existing}
+
+    removed_files = [filename for filename in existing if filename not in records]
+    changed_files = [filename for filename in existing if filename in records and
+                     existing[filename] != (records[filename]['size'], records[filename]['mtime'])]
+    new_records = [records[filename] for filename in records if filename not in existing]
+
+    # Replace the records of changed files
+    stale_files = removed_files + changed_files
+    if stale_files:
+        session.query(FilesystemCatalog).filter(FilesystemCatalog.filename.in_(stale_files))\
+            .delete(synchronize_session=False)
+    new_records += [records[filename] for filename in changed_files]
+    if new_records:
+        session.execute(FilesystemCatalog.__table__.insert(), new_records)
+
+    # Record the state of the directory
+    directory_entry = session.query(FilesystemCatalogDirectory)\
+        .filter(FilesystemCatalogDirectory.directory == directory).first()
+    if directory_entry is None:
+        directory_entry = FilesystemCatalogDirectory(directory=directory)
+        session.add(directory_entry)
+    directory_entry.mtime = mtime
+    directory_entry.file_count = len(records)
+
+    session.commit()
+
+    added = len(new_records) - len(changed_files)
+    logging.info('Updated catalog for {}: {} added, {} updated, {} removed'
+                 .format(directory, added, len(changed_files), len(removed_files)))
+
+    return added, len(changed_files), len(removed_files)
+
+
+@log_fail
+@log_info
+def update_file_catalog():
+    """The main function of the ``file_catalog`` module.  See module
+    docstring for further details."""
+
+    logging.info('Beginning the file catalog update')
+
+    filesystem_dir = get_config()['filesystem']
+    summary = update_catalog(filesystem_dir)
+
+    logging.info('Scanned {} changed directories: {} files added, {} updated, {} removed'
+                 .format(summary['directories_scanned'], summary['added'], summary['updated'],
+                         summary['removed']))
+    logging.info('Completed.')
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).replace('.py', '')
+    configure_logging(module)
+
+    update_file_catalog()
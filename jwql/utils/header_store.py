@@ -0,0 +1,411 @@
+#! /usr/bin/env python
+
+"""Maintain and query a store of the primary headers of the FITS files
+used by the ``jwql`` monitors and web app.
+
+The store is kept in the ``filesystem_header`` database table.  Each
+record holds a set of commonly used header keywords in their own
+columns, along with the full header text compressed with ``zlib``.
+Records are keyed by filename and file modification time, so a record
+is only used while the file it was extracted from is unchanged.  As
+filenames are only unique within the ``filesystem`` directory, the
+store is only used for files in that directory; the headers of other
+files (e.g. the products that monitors make from their local copies of
+files) are read from the files themselves.
+
+Headers are read through ``get_header`` and ``get_keywords``.  When a
+file is not in the store, or has been modified since it was stored,
+its header is read from the FITS file and written to the store.  The
+store can also be refreshed in bulk for every file in the file catalog
+(see ``file_catalog.py``), so that lookups by the web app and monitors
+rarely need to open a FITS file.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This module is intended to be executed from the command line (e.g.
+    as a cron job, after the file catalog is updated) to refresh the
+    store:
+
+    ::
+
+        python header_store.py
+
+    The lookup functions can be imported as such:
+
+    ::
+
+        from jwql.utils.header_store import get_keywords
+        keywords = get_keywords(filename, ['DETECTOR', 'READPATT'])
+
+Dependencies
+------------
+
+    The user must have a configuration file named ``config.json``
+    placed in the ``utils`` directory.
+"""
+
+import logging
+import multiprocessing
+import os
+import zlib
+
+from astropy.io import fits
+from sqlalchemy.exc import SQLAlchemyError
+
+from jwql.database.database_interface import session
+from jwql.database.database_interface import FilesystemCatalog
+from jwql.database.database_interface import FilesystemHeader
+from jwql.utils.logging_functions import configure_logging, log_info, log_fail
+from jwql.utils.utils import get_config
+
+# Header keywords that are stored in their own columns, and their types
+HEADER_KEYWORDS = {'INSTRUME': str, 'DETECTOR': str, 'SUBARRAY': str, 'READPATT': str,
+                   'EXP_TYPE': str, 'DATE-OBS': str, 'EXPSTART': float, 'SUBSTRT1': int,
+                   'SUBSTRT2': int, 'SUBSIZE1': int, 'SUBSIZE2': int, 'NGROUPS': int,
+                   'NINTS': int, 'NFRAMES': int, 'TSAMPLE': float, 'TFRAME': float}
+
+# Number of records inserted into the store at a time
+INSERT_BATCH_SIZE = 1000
+
+
+def compress_header(header):
+    """Compress the text of a FITS header.
+
+    Parameters
+    ----------
+    header : astropy.io.fits.Header
+        The header to compress
+
+    Returns
+    -------
+    compressed_header : bytes
+        The compressed header text
+    """
+
+    return zlib.compress(header.tostring().encode('ascii', errors='replace'))
+
+
+def decompress_header(compressed_header):
+    """Rebuild a FITS header from its compressed text.
+
+    Parameters
+    ----------
+    compressed_header : bytes
+        Header text compressed by ``compress_header``
+
+    Returns
+    -------
+    header : astropy.io.fits.Header
+        The rebuilt header
+    """
+
+    return fits.Header.fromstring(zlib.decompress(compressed_header).decode('ascii'))
+
+
+def extract_header_record(filepath):
+    """Read the primary header of a FITS file and build its record for
+    the store.
+
+    Parameters
+    ----------
+    filepath : str
+        Full path to the FITS file
+
+    Returns
+    -------
+    record : dict
+        The ``filesystem_header`` columns for the file
+    """
+
+    mtime = os.stat(filepath).st_mtime
+    header = fits.getheader(filepath, ext=0)
+
+    record = {'filename': os.path.basename(filepath), 'mtime': mtime,
+              'header': compress_header(header)}
+    for keyword, keyword_type in HEADER_KEYWORDS.items():
+        try:
+            record[keyword_column(keyword)] = keyword_type(header[keyword])
+        except (KeyError, TypeError, ValueError):
+            record[keyword_column(keyword)] = None
+
+    return record
+
+
+def get_header(filepath):
+    """Return the primary header of the given FITS file, from the store
+    if possible.
+
+    Parameters
+    ----------
+    filepath : str
+        Full path to the FITS file
+
+    Returns
+    -------
+    header : astropy.io.fits.Header
+        The primary header of the file
+    """
+
+    record = get_header_record(filepath)
+
+    return decompress_header(record['header'])
+
+
+def get_header_record(filepath):
+    """Return the record of the given FITS file in the store.  If the
+    file is not in the store, or has been modified since it was
+    stored, its header is read from the file and the store is updated.
+    Files outside of the ``filesystem`` directory are always read, and
+    are not stored.
+
+    Parameters
+    ----------
+    filepath : str
+        Full path to the FITS file
+
+    Returns
+    -------
+    record : dict
+        The ``filesystem_header`` columns for the file
+    """
+
+    if not in_filesystem(filepath):
+        return extract_header_record(filepath)
+
+    filename = os.path.basename(filepath)
+    mtime = os.stat(filepath).st_mtime
+
+    try:
+        entry = session.query(FilesystemHeader)\
+            .filter(FilesystemHeader.filename == filename).first()
+        if entry is not None and entry.mtime == mtime:
+            return {column.name: getattr(entry, column.name)
+                    for column in FilesystemHeader.__table__.columns}
+
+        record = extract_header_record(filepath)
+        if entry is not None:
+            session.delete(entry)
+            session.flush()
+        session.execute(FilesystemHeader.__table__.insert(), [record])
+        session.commit()
+
+    # If the store is unavailable, fall back to the file itself
+    except SQLAlchemyError as error:
+        session.rollback()
+        logging.warning('Unable to use header store for {}: {}'.format(filename, error))
+        record = extract_header_record(filepath)
+
+    return record
+
+
+def get_keywords(filepath, keywords):
+    """Return the values of the given primary header keywords for a
+    FITS file, from the store if possible.
+
+    Parameters
+    ----------
+    filepath : str
+        Full path to the FITS file
+    keywords : list
+        The header keywords of interest (e.g. ``['DETECTOR', 'NINTS']``)
+
+    Returns
+    -------
+    values : dict
+        Keys are the keywords, values are their values.  Keywords that
+        are not in the header are omitted.
+    """
+
+    record = get_header_record(filepath)
+
+    values = {}
+    header = None
+    for keyword in keywords:
+        value = record.get(keyword_column(keyword)) if keyword in HEADER_KEYWORDS else None
+
+        # Keywords without their own column come from the full header
+        if value is None:
+            if header is None:
+                header = decompress_header(record['header'])
+            if keyword not in header:
+                continue
+            value = header[keyword]
+
+        values[keyword] = value
+
+    return values
+
+
+def in_filesystem(filepath):
+    """Determine whether a file is in the ``filesystem`` directory, and
+    so can be kept in the store.
+
+    Parameters
+    ----------
+    filepath : str
+        Full path to the FITS file
+
+    Returns
+    -------
+    in_filesystem : bool
+        ``True`` if the file is in the ``filesystem`` directory
+    """
+
+    filesystem_dir = os.path.realpath(get_config()['filesystem'])
+
+    return os.path.realpath(filepath).startswith(filesystem_dir + os.sep)
+
+
+def keyword_column(keyword):
+    """Return the name of the ``filesystem_header`` column that holds
+    the given header keyword.
+
+    Parameters
+    ----------
+    keyword : str
+        Header keyword (e.g. ``DATE-OBS``)
+
+    Returns
+    -------
+    column : str
+        Column name (e.g. ``date_obs``)
+    """
+
+    return keyword.lower().replace('-', '_')
+
+
+def refresh_header_store(filesystem_dir):
+    """Bring the store up to date with the file catalog.  Headers are
+    extracted only for files that are new or have been modified since
+    they were stored, and records for files that are no longer in the
+    catalog are removed.
+
+    Parameters
+    ----------
+    filesystem_dir : str
+        Path to the top level of the filesystem
+
+    Returns
+    -------
+    summary : dict
+        The number of records added, updated, removed, and the number
+        of files that could not be read
+    """
+
+    summary = {'added': 0, 'updated': 0, 'removed': 0, 'failed': 0}
+
+    catalog = session.query(FilesystemCatalog.filename, FilesystemCatalog.directory,
+                            FilesystemCatalog.mtime).all()
+    stored = dict(session.query(FilesystemHeader.filename, FilesystemHeader.mtime).all())
+
+    # Remove records for files that no longer exist
+    catalog_filenames = set([filename for filename, _, _ in catalog])
+    removed_files = [filename for filename in stored if filename not in catalog_filenames]
+    for i in range(0, len(removed_files), INSERT_BATCH_SIZE):
+        summary['removed'] += session.query(FilesystemHeader)\
+            .filter(FilesystemHeader.filename.in_(removed_files[i:i + INSERT_BATCH_SIZE]))\
+            .delete(synchronize_session=False)
+    session.commit()
+
+    # A stored header that is newer than the catalog entry is kept, as
+    # the file has been modified since the catalog was last updated
+    filepaths = [os.path.join(filesystem_dir, directory, filename)
+                 for filename, directory, mtime in catalog
+                 if filename not in stored or stored[filename] < mtime]
+    logging.info('Extracting headers from {} new or modified files'.format(len(filepaths)))
+
+    pool = multiprocessing.Pool(processes=int(get_config()['cores']))
+    records = []
+    for record in pool.imap_unordered(try_extract_header_record, filepaths, chunksize=100):
+        if record is None:
+            summary['failed'] += 1
+            continue
+        if record['filename'] in stored:
+            summary['updated'] += 1
+        else:
+            summary['added'] += 1
+        records.append(record)
+
+        if len(records) == INSERT_BATCH_SIZE:
+            store_records(records)
+            records = []
+    store_records(records)
+    pool.close()
+    pool.join()
+
+    return summary
+
+
+def store_records(records):
+    """Insert records into the store, replacing any existing records
+    for the same files.
+
+    Parameters
+    ----------
+    records : list
+        ``filesystem_header`` records, as returned by
+        ``extract_header_record``
+    """
+
+    if not records:
+        return
+
+    filenames = [record['filename'] for record in records]
+    session.query(FilesystemHeader).filter(FilesystemHeader.filename.in_(filenames))\
+        .delete(synchronize_session=False)
+    session.execute(FilesystemHeader.__table__.insert(), records)
+    session.commit()
+
+
+def try_extract_header_record(filepath):
+    """Wrapper around ``extract_header_record`` for use with a
+    ``multiprocessing`` pool, which returns ``None`` for files that
+    cannot be read rather than raising an exception.
+
+    Parameters
+    ----------
+    filepath : str
+        Full path to the FITS file
+
+    Returns
+    -------
+    record : dict or None
+        The ``filesystem_header`` columns for the file
+    """
+
+    try:
+        return extract_header_record(filepath)
+    except (OSError, ValueError) as error:
+        logging.warning('Unable to read header of {}: {}'.format(filepath, error))
+        return None
+
+
+@log_fail
+@log_info
+def update_header_store():
+    """The main function of the ``header_store`` module.  See module
+    docstring for further details."""
+
+    logging.info('Beginning the header store update')
+
+    filesystem_dir = get_config()['filesystem']
+    summary = refresh_header_store(filesystem_dir)
+
+    logging.info('{} headers added, {} updated, {} removed, {} unreadable'
+                 .format(summary['added'], summary['updated'], summary['removed'],
+                         summary['failed']))
+    logging.info('Completed.')
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).replace('.py', '')
+    configure_logging(module)
+
+    update_header_store()
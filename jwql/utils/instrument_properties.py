@@ -24,6 +24,7 @@ from jwst.datamodels import dqflags
 import numpy as np
 
 from jwql.utils.constants import AMPLIFIER_BOUNDARIES, FOUR_AMP_SUBARRAYS, SUBARRAYS_ONE_OR_FOUR_AMPS
+from jwql.utils.header_store import get_keywords
 
 
 def amplifier_info(filename, omit_reference_pixels=True):
@@ -54,7 +55,8 @@ def amplifier_info(filename, omit_reference_pixels=True):
     """
 
     # First get necessary metadata
-    header = fits.getheader(filename)
+    header = get_keywords(filename, ['INSTRUME', 'DETECTOR', 'SUBSIZE1', 'SUBSIZE2', 'TSAMPLE',
+                                     'TFRAME', 'SUBARRAY'])
     instrument = header['INSTRUME'].lower()
     detector = header['DETECTOR']
     x_dim = header['SUBSIZE1']
@@ -0,0 +1,254 @@
+#! /usr/bin/env python
+
+"""Cache the outputs of the JWST calibration pipeline, so that monitors
+that need the same calibrated products do not recompute them.
+
+Each output is stored under a key computed from the contents of the
+input file, the pipeline steps that were run, and the versions of the
+pipeline and of the CRDS context, so that a cached output is only
+reused when it would be identical to a newly computed one.  Cached
+outputs are kept as ``<key>.fits`` files in a single directory.
+
+The total size of the cache is bounded.  Each lookup that finds an
+output updates its modification time, and when the cache grows past
+its limit, the outputs that were least recently used are removed.
+Outputs are written under a temporary name and then renamed, so that
+several processes can share the cache.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.pipeline_cache import PipelineCache, cache_key
+        cache = PipelineCache(directory, max_size=100 * 2**30)
+        key = cache_key(filename, steps, {'jwst': jwst.__version__})
+        cached_file = cache.get(key)
+        if cached_file is None:
+            cached_file = cache.put(key, output_filename)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from jwql.utils.permissions import set_permissions
+
+# Number of bytes of an input file read at a time when hashing it
+HASH_BLOCK_SIZE = 2**24
+
+
+class PipelineCache():
+    """A directory of pipeline outputs, keyed by ``cache_key``, with
+    least recently used outputs removed once the total size exceeds
+    ``max_size``.
+
+    Attributes
+    ----------
+    directory : str
+        Directory in which the outputs are kept
+
+    max_size : int
+        Maximum total size of the outputs, in bytes
+    """
+
+    def __init__(self, directory, max_size):
+        """Initialize the ``PipelineCache`` object, creating the
+        directory if needed.
+
+        Parameters
+        ----------
+        directory : str
+            Directory in which the outputs are kept
+
+        max_size : int
+            Maximum total size of the outputs, in bytes
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def entries(self):
+        """Return the outputs in the cache, least recently used first.
+
+        Returns
+        -------
+        entries : list
+            List of ``(filename, size, last_used)`` tuples, with the
+            size in bytes and the time of last use as a timestamp
+        """
+
+        entries = []
+        with os.scandir(self.directory) as directory:
+            for entry in directory:
+                if not entry.name.endswith('.fits'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda item: item[2])
+
+    def evict(self):
+        """Remove the least recently used outputs until the total size
+        of the cache is within ``max_size``.
+
+        Returns
+        -------
+        removed : list
+            List of the files removed
+        """
+
+        entries = self.entries()
+        total_size = sum(size for filename, size, last_used in entries)
+
+        removed = []
+        for filename, size, last_used in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(filename)
+                removed.append(filename)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        return removed
+
+    def get(self, key):
+        """Look up an output, marking it as used.
+
+        Parameters
+        ----------
+        key : str
+            Key of the output (see ``cache_key``)
+
+        Returns
+        -------
+        filename : str or None
+            Name of the cached file, or ``None`` if the output is not in
+            the cache
+        """
+
+        filename = self.path(key)
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+
+        return filename
+
+    def path(self, key):
+        """Return the name of the file in which an output is cached.
+
+        Parameters
+        ----------
+        key : str
+            Key of the output (see ``cache_key``)
+
+        Returns
+        -------
+        filename : str
+            Name of the cached file
+        """
+
+        return os.path.join(self.directory, '{}.fits'.format(key))
+
+    def put(self, key, filename):
+        """Copy an output into the cache, and remove the least recently
+        used outputs if the cache has grown past ``max_size``.
+
+        Parameters
+        ----------
+        key : str
+            Key of the output (see ``cache_key``)
+
+        filename : str
+            Name of the file holding the output
+
+        Returns
+        -------
+        cached_filename : str
+            Name of the cached file
+        """
+
+        cached_filename = self.path(key)
+        temporary_filename = '{}.{}.tmp'.format(cached_filename, os.getpid())
+        shutil.copyfile(filename, temporary_filename)
+        os.replace(temporary_filename, cached_filename)
+        set_permissions(cached_filename)
+
+        self.evict()
+
+        return cached_filename
+
+    @property
+    def size(self):
+        """Total size of the outputs in the cache, in bytes"""
+
+        return sum(size for filename, size, last_used in self.entries())
+
+
+def cache_key(input_file, steps, versions):
+    """Compute the key under which the output of running pipeline steps
+    on a file is cached.
+
+    Parameters
+    ----------
+    input_file : str
+        File on which the pipeline steps are run
+
+    steps : collections.OrderedDict
+        Keys are the individual pipeline steps. Boolean values indicate
+        whether a step is run or not.
+
+    versions : dict
+        Versions of the software and reference files that the output
+        depends on, e.g. ``{'jwst': '0.13.1', 'crds_context':
+        'jwst_0541.pmap'}``
+
+    Returns
+    -------
+    key : str
+        Hexadecimal SHA-256 digest of the file contents, the steps run,
+        and the versions
+    """
+
+    description = {'input': file_digest(input_file),
+                   'steps': [step for step in steps if steps[step]],
+                   'versions': versions}
+
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_digest(filename):
+    """Compute the SHA-256 digest of the contents of a file.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal SHA-256 digest
+    """
+
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file_object:
+        for block in iter(lambda: file_object.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
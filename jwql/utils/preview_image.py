@@ -14,6 +14,19 @@ The lower and upper limits to be displayed are defined as the
 version of the image, with accompanying colorbar. The image is then
 saved.
 
+Alternatively, with the ``fast`` renderer, the image is scaled with
+``numpy``, mapped through a lookup table built from the colormap, and
+written directly with ``Pillow``, without building any ``matplotlib``
+figures. The thumbnail is a downsampled copy of the preview image. The
+title and colorbar are drawn onto the preview image as an optional
+overlay.
+
+Optionally, each image is also saved as a Deep Zoom tile pyramid (a
+``.dzi`` description file and a ``_files`` directory of tiles at each
+level of resolution), so that large images can be panned and zoomed
+in the web app while fetching only the tiles that are visible. All of
+the tiles are drawn with the same display limits.
+
 Authors:
 --------
 
@@ -32,14 +45,32 @@ Use:
         im.scaling = 'log'
         im.output_format = 'jpg'
         im.make_image()
+
+    To use the ``fast`` renderer:
+
+    ::
+
+        im.renderer = 'fast'
+        im.make_image()
+
+    To also make a tile pyramid:
+
+    ::
+
+        im.tiles = True
+        im.make_image()
 """
 
+from functools import lru_cache
+import itertools
 import logging
+import math
 import os
 import socket
 
 from astropy.io import fits
 import numpy as np
+from PIL import Image, ImageDraw
 
 from jwql.utils import permissions
 
@@ -53,6 +84,170 @@ import matplotlib.colors as colors
 if 'build' and 'project' not in socket.gethostname():
     from jwst.datamodels import dqflags
 
+# Size (pixels) of the longest side of thumbnails made by the fast renderer
+THUMBNAIL_SIZE = 256
+
+# Size (pixels) of the tiles of tile pyramids, and the number of pixels
+# by which neighboring tiles overlap
+TILE_SIZE = 256
+TILE_OVERLAP = 1
+
+# Maximum number of pixel values handled at once by ``clip_limits``. Small
+# blocks that stay in cache are faster than copying the whole cube.
+CLIP_LIMITS_BLOCK_SIZE = 2**18
+
+# Maximum number of pixel values in the integrations whose display limits
+# are found together by ``PreviewImage.frames_with_limits``
+LIMITS_BATCH_SIZE = 2**22
+
+
+def clip_limits(data, pixmap, clipperc):
+    """Find the minimum and maximum signal levels of one or more images
+    after clipping the top and bottom ``clipperc`` of the science
+    pixels.
+
+    The two order statistics are found with ``numpy.partition`` rather
+    than a full sort, and all of the images in a cube are handled
+    together.  The results are identical to those of sorting.
+
+    Parameters
+    ----------
+    data : obj
+        2D ``numpy`` ``ndarray`` of floats, or 3D ``ndarray`` of
+        images stacked along the first axis
+    pixmap : obj
+        2D ``numpy`` ``ndarray`` boolean array of science pixel
+        locations (``True`` for science pixels, ``False`` for
+        non-science pixels)
+    clipperc : float
+        Fraction of top and bottom signal levels to clip (e.g. 0.01
+        means to clip brightest and dimmest 1% of pixels)
+
+    Returns
+    -------
+    minval : float or obj
+        Minimum signal level, or 1D ``ndarray`` of the minimum signal
+        level of each image for 3D input
+    maxval : float or obj
+        Maximum signal level, or 1D ``ndarray`` of the maximum signal
+        level of each image for 3D input
+    """
+
+    single_image = data.ndim == 2
+    if single_image:
+        data = data[np.newaxis, :, :]
+
+    nelem = int(np.sum(pixmap))
+    numclip = int(clipperc * nelem)
+    kth = [numclip, nelem - numclip - 1]
+
+    # Work through the cube in blocks of images to bound the memory
+    # used by the copies of the science pixels
+    nint = data.shape[0]
+    block = max(1, CLIP_LIMITS_BLOCK_SIZE // max(nelem, 1))
+    minval = np.empty(nint, dtype=data.dtype)
+    maxval = np.empty(nint, dtype=data.dtype)
+    for start in range(0, nint, block):
+        values = data[start:start + block][:, pixmap]
+        values.partition(kth, axis=1)
+        minval[start:start + block] = values[:, kth[0]]
+        maxval[start:start + block] = values[:, kth[1]]
+
+    if single_image:
+        return (minval[0], maxval[0])
+
+    return (minval, maxval)
+
+
+@lru_cache()
+def colormap_lookup_table(cmap):
+    """Return a lookup table of the RGB values of the given colormap.
+
+    Parameters
+    ----------
+    cmap : str
+        Name of a ``matplotlib`` colormap (e.g. ``viridis``)
+
+    Returns
+    -------
+    lookup_table : obj
+        ``(256, 3)`` ``numpy`` ``ndarray`` of ``uint8`` RGB values
+    """
+
+    colormap = plt.get_cmap(cmap, 256)
+    lookup_table = np.round(colormap(np.arange(256))[:, :3] * 255).astype(np.uint8)
+
+    return lookup_table
+
+
+def write_tile_pyramid(image, output_base, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                       output_format='jpg'):
+    """Save an image as a Deep Zoom tile pyramid.
+
+    Level ``N`` of the pyramid is the full resolution image, where
+    ``N`` is the number of times the longest side of the image can be
+    halved (rounding up) before it reaches one pixel. Each lower level
+    is half the size of the one above it. Each level is cut into tiles
+    of ``tile_size`` pixels (plus ``overlap`` pixels on each side that
+    has a neighbor), saved as ``<output_base>_files/<level>/<column>_<row>.<output_format>``.
+
+    Parameters
+    ----------
+    image : obj
+        ``PIL.Image.Image`` to save
+    output_base : str
+        Path of the output, without extension
+    tile_size : int
+        Size of the tiles, in pixels
+    overlap : int
+        Number of pixels by which neighboring tiles overlap
+    output_format : str
+        Format of the tiles (``jpg`` or ``png``)
+
+    Returns
+    -------
+    dzi_file : str
+        Path to the ``.dzi`` file that describes the pyramid
+    """
+
+    width, height = image.size
+    max_level = int(math.ceil(math.log(max(width, height), 2)))
+    tile_dir = '{}_files'.format(output_base)
+    image_format = 'PNG' if output_format == 'png' else 'JPEG'
+
+    # Work down from the full resolution image, halving it each level
+    level_image = image
+    for level in range(max_level, -1, -1):
+        scale = 2 ** (max_level - level)
+        level_size = (int(math.ceil(width / scale)), int(math.ceil(height / scale)))
+        if level_image.size != level_size:
+            level_image = level_image.resize(level_size, Image.BILINEAR)
+
+        level_dir = os.path.join(tile_dir, str(level))
+        if not os.path.exists(level_dir):
+            os.makedirs(level_dir)
+        for column in range(int(math.ceil(level_size[0] / tile_size))):
+            for row in range(int(math.ceil(level_size[1] / tile_size))):
+                box = (max(0, column * tile_size - overlap), max(0, row * tile_size - overlap),
+                       min(level_size[0], (column + 1) * tile_size + overlap),
+                       min(level_size[1], (row + 1) * tile_size + overlap))
+                tile_file = os.path.join(level_dir, '{}_{}.{}'.format(column, row, output_format))
+                level_image.crop(box).save(tile_file, format=image_format, quality=90)
+        permissions.set_permissions(level_dir)
+    permissions.set_permissions(tile_dir)
+
+    dzi_file = '{}.dzi'.format(output_base)
+    with open(dzi_file, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{}" '
+                'Overlap="{}" TileSize="{}">\n'
+                '    <Size Width="{}" Height="{}"/>\n'
+                '</Image>\n'.format(output_format, overlap, tile_size, width, height))
+    permissions.set_permissions(dzi_file)
+    logging.info('Saved tile pyramid to {}'.format(dzi_file))
+
+    return dzi_file
+
 
 class PreviewImage():
     """An object for generating and saving preview images, used by
@@ -60,6 +255,9 @@ class PreviewImage():
 
     Attributes
     ----------
+    annotate : bool
+        If ``True``, the ``fast`` renderer draws the title and colorbar
+        onto the preview image.  Default is ``True``.
     clip_percent : float
         The amount to sigma clip the input data by when scaling the
         preview image.  Default is 0.01.
@@ -75,15 +273,39 @@ class PreviewImage():
     output_format : str
         The format to which the preview image is saved.  Options are
         ``jpg`` and ``thumb``
+    preview_images : list
+        The preview images saved by ``make_image``.
     preview_output_directory : str or None
         The output directory to which the preview image is saved.
+    renderer : str
+        How the images are rendered.  Options are ``matplotlib``
+        (default), which draws ``matplotlib`` figures, and ``fast``,
+        which writes the scaled pixels directly with ``Pillow``.
     scaling : str
         The scaling used in the preview image.  Default is ``log``.
+    thumbnail_images : list
+        The thumbnail images (``.thumb`` files) saved by
+        ``make_image``.
+    tile_images : list
+        The ``.dzi`` files of the tile pyramids saved by
+        ``make_image``.
+    tiles : bool
+        If ``True``, ``make_image`` also saves each image as a tile
+        pyramid, in the same directory as the preview image. Default
+        is ``False``.
     thumbnail_output_directory : str or None
         The output directory to which the thumbnail is saved.
 
     Methods
     -------
+    add_overlay(image, integration_number, min_value, max_value, scale)
+        Draw the title and colorbar onto a rendered image
+    colorize(image, min_value, max_value, scale)
+        Map the image onto the colormap at full resolution
+    difference_frame(integration)
+        Create the difference image of a single integration
+    difference_frames(data)
+        Generate the difference image of each integration in turn
     difference_image(data)
         Create a difference image from the data
     find_limits(data, pixmap, clipperc)
@@ -91,12 +313,20 @@ class PreviewImage():
         ``clipperc``
     get_data(filename, ext)
         Read in data from the given ``filename`` and ``ext``
+    integration_frames()
+        Generate the image of each integration in turn
     make_figure(image, integration_number, min_value, max_value, scale, maxsize, thumbnail)
         Create the ``matplotlib`` figure
-    make_image(max_img_size)
+    make_image(max_img_size, frames)
         Main function
-    save_image(fname, thumbnail)
-        Save the figure
+    make_tiles(image, min_value, max_value, scale, output_base)
+        Save the image as a tile pyramid
+    render_image(image, min_value, max_value, scale, maxsize)
+        Render the image without ``matplotlib``
+    save_image(fname, thumbnail, image)
+        Save the figure or rendered image
+    scale_image(image, min_value, max_value, scale)
+        Normalize the image to the range 0 - 1 for display
     """
 
     def __init__(self, filename, extension):
@@ -109,17 +339,192 @@ class PreviewImage():
         extension : str
             Extension name to be read in
         """
+        self.annotate = True
+        self.bscale = 1.
         self.clip_percent = 0.01
         self.cmap = 'viridis'
         self.file = filename
         self.output_format = 'jpg'
+        self.preview_images = []
         self.preview_output_directory = None
+        self.renderer = 'matplotlib'
         self.scaling = 'log'
+        self.thumbnail_images = []
         self.thumbnail_output_directory = None
+        self.tile_images = []
+        self.tiles = False
 
         # Read in file
         self.data, self.dq = self.get_data(self.file, extension)
 
+    def add_overlay(self, image, integration_number, min_value, max_value, scale):
+        """
+        Draw a title and a labeled colorbar around an image made by
+        ``render_image``, as the ``matplotlib`` renderer does for
+        preview images.
+
+        Parameters
+        ----------
+        image : obj
+            ``PIL.Image.Image`` of the rendered image
+
+        integration_number : int
+            Integration number within exposure
+
+        min_value : float
+            Minimum value for display
+
+        max_value : float
+            Maximum value for display
+
+        scale : str
+            Image scaling (``log``, ``linear``)
+
+        Returns
+        -------
+        result : obj
+            ``PIL.Image.Image`` with the title and colorbar
+        """
+
+        title_height = 30
+        colorbar_width = 20
+        margin = 10
+        label_width = 80
+
+        width, height = image.size
+        canvas = Image.new('RGB', (width + 2 * margin + colorbar_width + label_width,
+                                   height + title_height + margin), 'white')
+        canvas.paste(image, (0, title_height))
+        draw = ImageDraw.Draw(canvas)
+
+        # Title
+        filename = os.path.split(self.file)[-1]
+        draw.text((margin, margin), filename + ' Int: {}'.format(int(integration_number)),
+                  fill='black')
+
+        # Colorbar, with the maximum value at the top
+        lookup_table = colormap_lookup_table(self.cmap)
+        rows = np.linspace(255, 0, height).astype(np.uint8)
+        colorbar = np.repeat(lookup_table[rows][:, np.newaxis, :], colorbar_width, axis=1)
+        x0 = width + margin
+        canvas.paste(Image.fromarray(colorbar), (x0, title_height))
+
+        # Colorbar labels, with original data values.  Log-scaled ticks
+        # are evenly spaced in the displayed (log) space.
+        if scale == 'log':
+            tickvals = np.logspace(0, np.log10(max_value - min_value + 1), 5)
+            tlabelflt = tickvals + min_value - 1
+        else:
+            tlabelflt = np.linspace(min_value, max_value, 5)
+
+        # Adjust the number of digits after the decimal point
+        # in the colorbar labels based on the signal range
+        delta = tlabelflt[-1] - tlabelflt[0]
+        if delta >= 100:
+            dig = 0
+        elif ((delta < 100) & (delta >= 10)):
+            dig = 1
+        elif ((delta < 10) & (delta >= 1)):
+            dig = 2
+        else:
+            dig = 3
+        format_string = "%.{}f".format(dig)
+
+        for i, value in enumerate(tlabelflt):
+            y = title_height + (height - 1) * (1 - i / (len(tlabelflt) - 1))
+            draw.line([(x0 + colorbar_width, y), (x0 + colorbar_width + 4, y)], fill='black')
+            draw.text((x0 + colorbar_width + 6, y - 5), format_string % value, fill='black')
+
+        return canvas
+
+    def colorize(self, image, min_value, max_value, scale):
+        """
+        Map the image onto the colormap at its full resolution, in the
+        same orientation as the ``matplotlib`` renderer.
+
+        Parameters
+        ----------
+        image : obj
+            2D ``numpy`` ``ndarray`` of floats
+
+        min_value : float
+            Minimum value for display
+
+        max_value : float
+            Maximum value for display
+
+        scale : str
+            Image scaling (``log``, ``linear``)
+
+        Returns
+        -------
+        result : obj
+            ``PIL.Image.Image`` of the colorized image
+        """
+
+        scaled = self.scale_image(image, min_value, max_value, scale)
+
+        # Map onto the colormap. Pixels with no data are white.
+        bad = np.isnan(scaled)
+        indices = np.clip(np.nan_to_num(scaled) * 256, 0, 255).astype(np.uint8)
+        rgb = colormap_lookup_table(self.cmap)[indices]
+        rgb[bad] = 255
+
+        # Match the orientation of the matplotlib renderer
+        if scale == 'log':
+            rgb = rgb[::-1]
+
+        return Image.fromarray(rgb)
+
+    def difference_frame(self, integration):
+        """
+        Create the difference image of a single integration, the last
+        group minus the first group.
+
+        Parameters
+        ----------
+        integration : obj
+            3D ``numpy`` ``ndarray`` (or memory map) of the stored
+            values of the ramps of one integration, which are scaled by
+            ``self.bscale``
+
+        Returns
+        -------
+        frame : obj
+            2D ``numpy`` ``ndarray`` of 32-bit floats containing the
+            difference image
+        """
+        frame = integration[-1, :, :].astype(np.float32)
+        frame -= integration[0, :, :]
+        if self.bscale != 1:
+            frame *= self.bscale
+        return frame
+
+    def difference_frames(self, data):
+        """
+        Generate the difference image of each integration in turn. Use
+        last group minus first group in order to maximize signal to
+        noise. Only the first and last groups of one integration are
+        read at a time, so for memory-mapped data the memory used does
+        not depend on the number of integrations.
+
+        Parameters
+        ----------
+        data : obj
+            4D ``numpy`` ``ndarray`` (or memory map) of the stored
+            values of the ramps, which are scaled by ``self.bscale``
+
+        Yields
+        ------
+        frame : obj
+            2D ``numpy`` ``ndarray`` of 32-bit floats containing the
+            difference image of one integration
+        """
+        # The frames are not kept in a local variable, so that the
+        # generator does not hold on to one while it is suspended
+        for integration in data:
+            yield self.difference_frame(integration)
+
     def difference_image(self, data):
         """
         Create a difference image from the data. Use last group minus
@@ -129,15 +534,20 @@ class PreviewImage():
         Parameters
         ----------
         data : obj
-            4D ``numpy`` ``ndarray`` array of floats
+            4D ``numpy`` ``ndarray`` (or memory map) of the stored
+            values of the ramps, which are scaled by ``self.bscale``
 
         Returns
         -------
         result : obj
-            3D ``numpy`` ``ndarray`` containing the difference image(s)
-            from the input exposure
+            3D ``numpy`` ``ndarray`` of 32-bit floats containing the
+            difference image(s) from the input exposure
         """
-        return data[:, -1, :, :] - data[:, 0, :, :]
+        nint, ngroup, ny, nx = data.shape
+        result = np.empty((nint, ny, nx), dtype=np.float32)
+        for i, frame in enumerate(self.difference_frames(data)):
+            result[i] = frame
+        return result
 
     def find_limits(self, data, pixmap, clipperc):
         """
@@ -147,7 +557,8 @@ class PreviewImage():
         Parameters
         ----------
         data : obj
-            2D numpy ndarray of floats
+            2D numpy ndarray of floats, or 3D ndarray of images stacked
+            along the first axis
         pixmap : obj
             2D numpy ndarray boolean array of science pixel locations
             (``True`` for science pixels, ``False`` for non-science
@@ -159,20 +570,71 @@ class PreviewImage():
         Returns
         -------
         results : tuple
-            Tuple of floats, minimum and maximum signal levels
+            Tuple of floats, minimum and maximum signal levels (or of
+            1D arrays of these, one element per image, for 3D input)
+        """
+        return clip_limits(data, pixmap, clipperc)
+
+    def frames_with_limits(self, frames):
+        """
+        Generate the image of each integration together with its
+        display limits.  The limits of consecutive integrations are
+        found together (see ``clip_limits``), which is much faster for
+        many small images (e.g. time series) than one image at a time.
+        The integrations of a batch are copied into one array of at
+        most ``LIMITS_BATCH_SIZE`` pixel values.  Integrations too
+        large to share a batch are used as they are, without a copy.
+
+        Parameters
+        ----------
+        frames : iterable
+            The 2D image of each integration
+
+        Yields
+        ------
+        frame : obj
+            2D ``numpy`` ``ndarray`` containing the image of one
+            integration
+        minval : float
+            Minimum signal level for the display
+        maxval : float
+            Maximum signal level for the display
         """
-        nelem = np.sum(pixmap)
-        numclip = np.int(clipperc * nelem)
-        sorted = np.sort(data[pixmap], axis=None)
-        minval = sorted[numclip]
-        maxval = sorted[-numclip - 1]
-        return (minval, maxval)
+        frames = iter(frames)
+        for frame in frames:
+            batch_size = LIMITS_BATCH_SIZE // frame.size
+            if batch_size <= 1:
+                minval, maxval = self.find_limits(frame, self.dq, self.clip_percent)
+                yield frame, minval, maxval
+                continue
+
+            # The frames are copied, as they may be reused by the
+            # generator that makes them (e.g. the integrations of a
+            # mosaic)
+            batch = np.empty((batch_size,) + frame.shape, dtype=frame.dtype)
+            batch[0] = frame
+            count = 1
+            for count, frame in enumerate(itertools.islice(frames, batch_size - 1), 2):
+                batch[count - 1] = frame
+            batch = batch[:count]
+
+            minvals, maxvals = self.find_limits(batch, self.dq, self.clip_percent)
+            yield from zip(batch, minvals, maxvals)
 
     def get_data(self, filename, ext):
         """
         Read in the data from the given file and extension.  Also find
         how many rows/cols of reference pixels are present.
 
+        4D data (ramps) are memory-mapped rather than read, and are
+        left as the values stored in the file, to be scaled by
+        ``self.bscale`` when the difference images are made (any
+        ``BZERO`` offset cancels in the difference). Only the groups
+        used for the difference images are then ever read from disk.
+        2D and 3D data that are not scaled (e.g. rate images) are
+        memory-mapped too, so that integrations are read one at a
+        time.
+
         Parameters
         ----------
         filename : str
@@ -183,7 +645,8 @@ class PreviewImage():
         Returns
         -------
         data : obj
-            Science data from file. A 2-, 3-, or 4D numpy ndarray
+            Science data from file. A 2-, 3- or 4D numpy ndarray,
+            which may be memory-mapped
         dq : obj
             2D ``ndarray`` boolean map of reference pixels. Science
             pixels flagged as ``True`` and non-science pixels are
@@ -191,7 +654,7 @@ class PreviewImage():
         """
         if os.path.isfile(filename):
             extnames = []
-            with fits.open(filename) as hdulist:
+            with fits.open(filename, memmap=True, do_not_scale_image_data=True) as hdulist:
                 for exten in hdulist:
                     try:
                         extnames.append(exten.header['EXTNAME'])
@@ -199,13 +662,20 @@ class PreviewImage():
                         pass
                 if ext in extnames:
                     dimensions = len(hdulist[ext].data.shape)
+                    bscale = hdulist[ext].header.get('BSCALE', 1.)
+                    bzero = hdulist[ext].header.get('BZERO', 0.)
                     if dimensions == 4:
-                        data = hdulist[ext].data[:, [0, -1], :, :].astype(np.float)
+                        data = hdulist[ext].data
+                        self.bscale = bscale
+                    elif bscale != 1 or bzero != 0:
+                        data = hdulist[ext].data * np.float64(bscale) + bzero
                     else:
-                        data = hdulist[ext].data.astype(np.float)
+                        data = hdulist[ext].data
                 else:
                     raise ValueError(('WARNING: no {} extension in {}!'.format(ext, filename)))
                 if 'PIXELDQ' in extnames:
+                    # The unsigned BZERO offset only affects the
+                    # highest bit, so the stored values can be used
                     dq = hdulist['PIXELDQ'].data
                     dq = (dq & dqflags.pixel['NON_SCIENCE'] == 0)
                 else:
@@ -229,6 +699,25 @@ class PreviewImage():
 
         return data, dq
 
+    def integration_frames(self):
+        """
+        Generate the image of each integration in turn: the difference
+        image for ramps, or each plane of a cube.
+
+        Yields
+        ------
+        frame : obj
+            2D ``numpy`` ``ndarray`` containing the image of one
+            integration
+        """
+        ndim = len(self.data.shape)
+        if ndim == 4:
+            yield from self.difference_frames(self.data)
+        elif ndim == 3:
+            yield from self.data
+        else:
+            yield self.data
+
     def make_figure(self, image, integration_number, min_value, max_value,
                     scale, maxsize=8, thumbnail=False):
         """
@@ -351,80 +840,241 @@ class PreviewImage():
             filename = os.path.split(self.file)[-1]
             ax.set_title(filename + ' Int: {}'.format(np.int(integration_number)))
 
-    def make_image(self, max_img_size=8):
-        """The main function of the ``PreviewImage`` class."""
-
-        shape = self.data.shape
-
-        if len(shape) == 4:
-            # Create difference image(s)
-            diff_img = self.difference_image(self.data)
-        elif len(shape) < 4:
-            diff_img = self.data
+    def make_image(self, max_img_size=8, frames=None):
+        """The main function of the ``PreviewImage`` class.
 
-        # If there are multiple integrations in the file,
-        # work on one integration at a time from here onwards
-        ndim = len(diff_img.shape)
-        if ndim == 2:
-            diff_img = np.expand_dims(diff_img, axis=0)
-        nint, ny, nx = diff_img.shape
+        Parameters
+        ----------
+        max_img_size : float
+            Image size in the largest dimension, in inches
+        frames : iterable
+            The 2D image of each integration to save, used in place of
+            those of ``self.data`` (e.g. the integrations of a mosaic,
+            made one at a time). ``self.dq`` must match their shape.
+        """
 
-        for i in range(nint):
-            frame = diff_img[i, :, :]
+        if frames is None:
+            frames = self.integration_frames()
 
-            # Find signal limits for the display
-            minval, maxval = self.find_limits(frame, self.dq,
-                                              self.clip_percent)
+        # If there are multiple integrations in the file, work on one
+        # integration at a time from here onwards, with the signal limits
+        # for the display found for batches of integrations
+        for i, (frame, minval, maxval) in enumerate(self.frames_with_limits(frames)):
 
-            # Create preview image matplotlib object
+            # Determine the output filenames
             indir, infile = os.path.split(self.file)
             suffix = '_integ{}.{}'.format(i, self.output_format)
             if self.preview_output_directory is None:
                 outdir = indir
             else:
                 outdir = self.preview_output_directory
-            outfile = os.path.join(outdir, infile.split('.')[0] + suffix)
-            self.make_figure(frame, i, minval, maxval, self.scaling.lower(),
-                             maxsize=max_img_size, thumbnail=False)
-            self.save_image(outfile, thumbnail=False)
-            plt.close()
-
-            # Create thumbnail image matplotlib object
+            preview_file = os.path.join(outdir, infile.split('.')[0] + suffix)
             if self.thumbnail_output_directory is None:
                 outdir = indir
             else:
                 outdir = self.thumbnail_output_directory
-            outfile = os.path.join(outdir, infile.split('.')[0] + suffix)
-            self.make_figure(frame, i, minval, maxval, self.scaling.lower(),
-                             maxsize=max_img_size, thumbnail=True)
-            self.save_image(outfile, thumbnail=True)
-            plt.close()
+            thumbnail_file = os.path.join(outdir, infile.split('.')[0] + suffix)
+
+            # Save the full resolution image as a tile pyramid
+            if self.tiles:
+                dzi_file = self.make_tiles(frame, minval, maxval, self.scaling.lower(),
+                                           os.path.splitext(preview_file)[0])
+                self.tile_images.append(dzi_file)
+
+            if self.renderer == 'fast':
+
+                # Render the preview image once and downsample it for
+                # the thumbnail
+                preview = self.render_image(frame, minval, maxval, self.scaling.lower(),
+                                            maxsize=max_img_size)
+                thumbnail = preview.copy()
+                thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BILINEAR)
+                if self.annotate:
+                    preview = self.add_overlay(preview, i, minval, maxval, self.scaling.lower())
+                preview_file = self.save_image(preview_file, thumbnail=False, image=preview)
+                thumbnail_file = self.save_image(thumbnail_file, thumbnail=True, image=thumbnail)
+
+            else:
+
+                # Create preview image matplotlib object
+                self.make_figure(frame, i, minval, maxval, self.scaling.lower(),
+                                 maxsize=max_img_size, thumbnail=False)
+                preview_file = self.save_image(preview_file, thumbnail=False)
+                plt.close()
 
-    def save_image(self, fname, thumbnail=False):
+                # Create thumbnail image matplotlib object
+                self.make_figure(frame, i, minval, maxval, self.scaling.lower(),
+                                 maxsize=max_img_size, thumbnail=True)
+                thumbnail_file = self.save_image(thumbnail_file, thumbnail=True)
+                plt.close()
+
+            self.preview_images.append(preview_file)
+            self.thumbnail_images.append(thumbnail_file)
+
+    def make_tiles(self, image, min_value, max_value, scale, output_base):
         """
-        Save an image in the requested output format and sets the
-        appropriate permissions
+        Save the image at its full resolution as a tile pyramid (see
+        ``write_tile_pyramid``), drawn with the given display limits.
+
+        Parameters
+        ----------
+        image : obj
+            2D ``numpy`` ``ndarray`` of floats
+
+        min_value : float
+            Minimum value for display
+
+        max_value : float
+            Maximum value for display
+
+        scale : str
+            Image scaling (``log``, ``linear``)
+
+        output_base : str
+            Path of the output, without extension
+
+        Returns
+        -------
+        dzi_file : str
+            Path to the ``.dzi`` file that describes the pyramid
+        """
+
+        colorized = self.colorize(image, min_value, max_value, scale)
+
+        return write_tile_pyramid(colorized, output_base, output_format=self.output_format)
+
+    def render_image(self, image, min_value, max_value, scale, maxsize=8):
+        """
+        Render the image without ``matplotlib``, by mapping the scaled
+        pixel values through a lookup table of the colormap.
 
         Parameters
         ----------
         image : obj
-            A ``matplotlib`` figure object
+            2D ``numpy`` ``ndarray`` of floats
+
+        min_value : float
+            Minimum value for display
+
+        max_value : float
+            Maximum value for display
+
+        scale : str
+            Image scaling (``log``, ``linear``)
+
+        maxsize : int
+            Size of the longest dimension of the output image, in
+            hundreds of pixels (i.e. inches at 100 dpi, as for the
+            ``matplotlib`` renderer)
+
+        Returns
+        -------
+        result : obj
+            ``PIL.Image.Image`` of the rendered image
+        """
 
+        rendered = self.colorize(image, min_value, max_value, scale)
+
+        # Resize so that the longest side matches the requested size
+        yd, xd = image.shape
+        factor = maxsize * 100. / max(xd, yd)
+        size = (max(1, int(round(xd * factor))), max(1, int(round(yd * factor))))
+        if factor < 1:
+            rendered = rendered.resize(size, Image.BILINEAR)
+        elif factor > 1:
+            rendered = rendered.resize(size, Image.NEAREST)
+
+        return rendered
+
+    def save_image(self, fname, thumbnail=False, image=None):
+        """
+        Save an image in the requested output format and sets the
+        appropriate permissions
+
+        Parameters
+        ----------
         fname : str
             Output filename
 
         thumbnail : bool
             True if saving a thumbnail image, false for the full
             preview image.
+
+        image : obj
+            ``PIL.Image.Image`` made by the ``fast`` renderer.  If
+            ``None``, the current ``matplotlib`` figure is saved.
+
+        Returns
+        -------
+        fname : str
+            Name of the saved file, which ends in ``.thumb`` for
+            thumbnails
         """
 
-        plt.savefig(fname, bbox_inches='tight', pad_inches=0)
+        if image is None:
+            plt.savefig(fname, bbox_inches='tight', pad_inches=0)
+        else:
+            image.save(fname, format='PNG' if self.output_format == 'png' else 'JPEG', quality=90)
         permissions.set_permissions(fname)
 
         # If the image is a thumbnail, rename to '.thumb'
         if thumbnail:
             thumb_fname = fname.replace('.jpg', '.thumb')
             os.rename(fname, thumb_fname)
-            logging.info('Saved image to {}'.format(thumb_fname))
+            fname = thumb_fname
+        logging.info('Saved image to {}'.format(fname))
+
+        return fname
+
+    def scale_image(self, image, min_value, max_value, scale):
+        """
+        Normalize the image to the range 0 - 1 for display, in the same
+        way as the ``matplotlib`` renderer. Values outside of the
+        display limits fall outside of that range.
+
+        Parameters
+        ----------
+        image : obj
+            2D ``numpy`` ``ndarray`` of floats
+
+        min_value : float
+            Minimum value for display
+
+        max_value : float
+            Maximum value for display
+
+        scale : str
+            Image scaling (``log``, ``linear``)
+
+        Returns
+        -------
+        result : obj
+            2D ``numpy`` ``ndarray`` of normalized values
+        """
+
+        # Check the input scaling
+        if scale not in ['linear', 'log']:
+            raise ValueError(('WARNING: scaling option {} not supported.'.format(scale)))
+
+        image = np.asarray(image, dtype=np.float32)
+
+        # With no range in the display limits, show the lowest color
+        if max_value <= min_value:
+            scaled = np.zeros(image.shape, dtype=np.float32)
+            scaled[np.isnan(image)] = np.nan
+            return scaled
+
+        if scale == 'log':
+
+            # Shift data so everything is positive, as for the
+            # matplotlib renderer, where the display range is 1 to
+            # max_value - min_value + 1. Values below 1 are shown with
+            # the lowest color.
+            shiftdata = image - np.float32(min_value - 1)
+            scaled = np.log10(np.maximum(shiftdata, 1))
+            scaled /= np.float32(np.log10(max_value - min_value + 1))
+
         else:
-            logging.info('Saved image to {}'.format(fname))
+            scaled = (image - np.float32(min_value)) / np.float32(max_value - min_value)
+
+        return scaled
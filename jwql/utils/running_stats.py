@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+
+"""Keep running per-pixel statistics of a series of images.
+
+The dark monitor folds the slope images of each of its runs into a
+per-detector ``RunningStats`` accumulator, which holds for every pixel
+the number of values seen, their mean, and the sum of squared
+differences from the mean (``M2``), updated with Welford's algorithm.
+The mean and standard deviation of every value seen so far can then be
+read out at any time, without going back to the images of earlier
+runs.
+
+Each update is also recorded in a table, with the query dates, the
+number of images, and the median dark rate of the update, from which
+trends can be read.
+
+The accumulator is saved to a FITS file with ``COUNT``, ``MEAN``, and
+``M2`` image extensions and an ``UPDATES`` table extension.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.running_stats import RunningStats
+        stats = RunningStats.load(filename)
+        stats.add(slope_image)
+        stats.record_update(query_start, query_end, 1, np.nanmedian(slope_image))
+        stats.save(filename)
+        mean_image, stdev_image = stats.mean, stats.stdev
+"""
+
+import os
+
+from astropy.io import fits
+from astropy.table import Table
+import numpy as np
+
+from jwql.utils.permissions import set_permissions
+
+# Columns of the table of updates
+UPDATE_COLUMNS = ('QRY_STRT', 'QRY_END', 'NFILES', 'MEDIAN')
+
+
+class RunningStats():
+    """Running per-pixel count, mean, and ``M2`` of a series of
+    images.
+
+    Attributes
+    ----------
+    count : numpy.ndarray
+        2D array of the number of finite values seen in each pixel
+
+    mean : numpy.ndarray
+        2D array of the mean of the values seen in each pixel
+
+    m2 : numpy.ndarray
+        2D array of the sum of squared differences from the mean of
+        the values seen in each pixel
+
+    updates : astropy.table.Table
+        Table of the updates folded in, with the start and end dates
+        (MJD) of the MAST query, the number of files, and the median
+        dark rate of each
+    """
+
+    def __init__(self, shape):
+        """Initialize an empty ``RunningStats`` object.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of the images
+        """
+
+        self.count = np.zeros(shape, dtype=np.int32)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.updates = Table(names=UPDATE_COLUMNS, dtype=(float, float, int, float))
+
+    def add(self, image):
+        """Fold an image, or a 3D stack of images, into the statistics.
+        Non-finite values are skipped.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            2D image or 3D stack of images
+        """
+
+        image = np.asarray(image)
+        if image.shape[-2:] != self.count.shape:
+            raise ValueError('Image shape {} does not match the running statistics shape {}'
+                             .format(image.shape[-2:], self.count.shape))
+
+        for plane in image.reshape(-1, *self.count.shape):
+            finite = np.isfinite(plane)
+            self.count += finite
+            delta = np.where(finite, plane - self.mean, 0.)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.mean += np.where(finite, delta / self.count, 0.)
+            self.m2 += np.where(finite, delta * (plane - self.mean), 0.)
+
+    @classmethod
+    def load(cls, filename):
+        """Read running statistics saved by ``save``.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the FITS file
+
+        Returns
+        -------
+        stats : RunningStats
+            The running statistics
+        """
+
+        with fits.open(filename) as hdu_list:
+            stats = cls(hdu_list['COUNT'].data.shape)
+            stats.count[:] = hdu_list['COUNT'].data
+            stats.mean[:] = hdu_list['MEAN'].data
+            stats.m2[:] = hdu_list['M2'].data
+            stats.updates = Table(hdu_list['UPDATES'].data)
+
+        return stats
+
+    def record_update(self, query_start, query_end, file_count, median_rate):
+        """Record an update in the table of updates.
+
+        Parameters
+        ----------
+        query_start : float
+            Start date (MJD) of the MAST query that found the files
+
+        query_end : float
+            End date (MJD) of the MAST query that found the files
+
+        file_count : int
+            Number of files folded in
+
+        median_rate : float
+            Median dark rate of the files
+        """
+
+        self.updates.add_row((query_start, query_end, file_count, median_rate))
+
+    def save(self, filename):
+        """Save the running statistics to a FITS file. The file is
+        written under a temporary name and then renamed, so that an
+        existing file is never left partly written.
+
+        Parameters
+        ----------
+        filename : str
+            Name of the FITS file
+        """
+
+        hdu_list = fits.HDUList([fits.PrimaryHDU(),
+                                 fits.ImageHDU(self.count, name='COUNT'),
+                                 fits.ImageHDU(self.mean, name='MEAN'),
+                                 fits.ImageHDU(self.m2, name='M2'),
+                                 fits.BinTableHDU(self.updates, name='UPDATES')])
+
+        temporary_filename = '{}.tmp'.format(filename)
+        hdu_list.writeto(temporary_filename, overwrite=True)
+        os.replace(temporary_filename, filename)
+        set_permissions(filename)
+
+    @property
+    def stdev(self):
+        """2D array of the standard deviation of the values seen in
+        each pixel, NaN where there were none"""
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.m2 / self.count)
@@ -29,18 +29,147 @@ References
     - JWST TR JWST-STScI-004800, SM-12
  """
 
+from collections import OrderedDict
 import datetime
+from functools import lru_cache
 import getpass
 import json
 import os
 import re
+import resource
 import shutil
 
+import numpy as np
+
 from jwql.utils import permissions
 from jwql.utils.constants import FILE_SUFFIX_TYPES, JWST_INSTRUMENT_NAMES_SHORTHAND
+from jwql.utils.constants import NIRCAM_LONGWAVE_DETECTORS, NIRCAM_SHORTWAVE_DETECTORS
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
+# Stage 1 and 2 filenames
+# e.g. "jw80500012009_01101_00012_nrcalong_uncal.fits"
+STAGE_1_AND_2 = \
+    r"jw" \
+    r"(?P<program_id>\d{5})"\
+    r"(?P<observation>\d{3})"\
+    r"(?P<visit>\d{3})"\
+    r"_(?P<visit_group>\d{2})"\
+    r"(?P<parallel_seq_id>\d{1})"\
+    r"(?P<activity>\w{2})"\
+    r"_(?P<exposure_id>\d+)"\
+    r"_(?P<detector>((?!_)[\w])+)"
+
+# Stage 2c outlier detection filenames
+# e.g. "jw94015002002_02108_00001_mirimage_o002_crf.fits"
+STAGE_2C = \
+    r"jw" \
+    r"(?P<program_id>\d{5})" \
+    r"(?P<observation>\d{3})" \
+    r"(?P<visit>\d{3})" \
+    r"_(?P<visit_group>\d{2})" \
+    r"(?P<parallel_seq_id>\d{1})" \
+    r"(?P<activity>\w{2})" \
+    r"_(?P<exposure_id>\d+)" \
+    r"_(?P<detector>((?!_)[\w])+)"\
+    r"_(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"
+
+# Stage 3 filenames with target ID
+# e.g. "jw80600-o009_t001_miri_f1130w_i2d.fits"
+STAGE_3_TARGET_ID = \
+    r"jw" \
+    r"(?P<program_id>\d{5})"\
+    r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
+    r"_(?P<target_id>(t)\d{3})"\
+    r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
+    r"_(?P<optical_elements>((?!_)[\w-])+)"
+
+# Stage 3 filenames with source ID
+# e.g. "jw80600-o009_s00001_miri_f1130w_i2d.fits"
+STAGE_3_SOURCE_ID = \
+    r"jw" \
+    r"(?P<program_id>\d{5})"\
+    r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
+    r"_(?P<source_id>(s)\d{5})"\
+    r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
+    r"_(?P<optical_elements>((?!_)[\w-])+)"
+
+# Stage 3 filenames with target ID and epoch
+# e.g. "jw80600-o009_t001-epoch1_miri_f1130w_i2d.fits"
+STAGE_3_TARGET_ID_EPOCH = \
+    r"jw" \
+    r"(?P<program_id>\d{5})"\
+    r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
+    r"_(?P<target_id>(t)\d{3})"\
+    r"-epoch(?P<epoch>\d{1})"\
+    r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
+    r"_(?P<optical_elements>((?!_)[\w-])+)"
+
+# Stage 3 filenames with source ID and epoch
+# e.g. "jw80600-o009_s00001-epoch1_miri_f1130w_i2d.fits"
+STAGE_3_SOURCE_ID_EPOCH = \
+    r"jw" \
+    r"(?P<program_id>\d{5})"\
+    r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
+    r"_(?P<source_id>(s)\d{5})"\
+    r"-epoch(?P<epoch>\d{1})"\
+    r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
+    r"_(?P<optical_elements>((?!_)[\w-])+)"
+
+# Time series filenames
+# e.g. "jw00733003001_02101_00002-seg001_nrs1_rate.fits"
+TIME_SERIES = \
+    r"jw" \
+    r"(?P<program_id>\d{5})"\
+    r"(?P<observation>\d{3})"\
+    r"(?P<visit>\d{3})"\
+    r"_(?P<visit_group>\d{2})"\
+    r"(?P<parallel_seq_id>\d{1})"\
+    r"(?P<activity>\w{2})"\
+    r"_(?P<exposure_id>\d+)"\
+    r"-seg(?P<segment>\d{3})"\
+    r"_(?P<detector>\w+)"
+
+# Guider filenames
+# e.g. "jw00729011001_gs-id_1_image_cal.fits" or
+# "jw00799003001_gs-acq1_2019154181705_stream.fits"
+GUIDER = \
+    r"jw" \
+    r"(?P<program_id>\d{5})" \
+    r"(?P<observation>\d{3})" \
+    r"(?P<visit>\d{3})" \
+    r"_gs-(?P<guider_mode>(id|acq1|acq2|track|fg))" \
+    r"_((?P<date_time>\d{13})|(?P<guide_star_attempt_id>\d{1}))"
+
+# Filename types, in the order in which they are tried
+FILENAME_TYPES = [
+    ('stage_1_and_2', STAGE_1_AND_2),
+    ('stage_2c', STAGE_2C),
+    ('stage_3_target_id', STAGE_3_TARGET_ID),
+    ('stage_3_source_id', STAGE_3_SOURCE_ID),
+    ('stage_3_target_id_epoch', STAGE_3_TARGET_ID_EPOCH),
+    ('stage_3_source_id_epoch', STAGE_3_SOURCE_ID_EPOCH),
+    ('time_series', TIME_SERIES),
+    ('guider', GUIDER)]
+
+# If full filename, try using suffix.  If not, make sure the provided
+# regex matches the entire filename root.
+SUFFIX_PATTERN = r"_(?P<suffix>{}).*".format('|'.join(FILE_SUFFIX_TYPES))
+FILENAME_PATTERNS = [(name, re.compile(pattern + SUFFIX_PATTERN))
+                     for name, pattern in FILENAME_TYPES]
+FILENAME_ROOT_PATTERNS = [(name, re.compile(pattern + r"$")) for name, pattern in FILENAME_TYPES]
+
+# All of the properties that ``filename_parser`` may return
+FILENAME_PARSER_PROPERTIES = ['program_id', 'observation', 'visit', 'visit_group',
+                              'parallel_seq_id', 'activity', 'exposure_id', 'segment', 'detector',
+                              'ac_id', 'target_id', 'source_id', 'epoch', 'optical_elements',
+                              'guider_mode', 'date_time', 'guide_star_attempt_id', 'suffix',
+                              'instrument', 'filename_type']
+
+# The properties shared by all of the files of an exposure
+EXPOSURE_PROPERTIES = ['program_id', 'observation', 'visit', 'visit_group', 'parallel_seq_id',
+                       'activity', 'exposure_id', 'suffix']
+
 
 def copy_files(files, out_dir):
     """Copy a given file to a given directory. Only try to copy the file
@@ -139,14 +268,16 @@ def ensure_dir_exists(fullpath):
         permissions.set_permissions(fullpath)
 
 
-def filename_parser(filename):
-    """Return a dictionary that contains the properties of a given
-    JWST file (e.g. program ID, visit number, detector, etc.).
+@lru_cache(maxsize=2**16)
+def _parse_basename(filename):
+    """Parse a JWST filename that has already been stripped of its
+    directory.  Results are memoized, so the returned dictionary must
+    not be modified; ``filename_parser`` returns a copy of it.
 
     Parameters
     ----------
     filename : str
-        Path or name of JWST file to parse
+        Name of JWST file to parse
 
     Returns
     -------
@@ -159,168 +290,109 @@ def filename_parser(filename):
         When the provided file does not follow naming conventions
     """
 
-    filename = os.path.basename(filename)
     file_root_name = (len(filename.split('.')) < 2)
 
-    # Stage 1 and 2 filenames
-    # e.g. "jw80500012009_01101_00012_nrcalong_uncal.fits"
-    stage_1_and_2 = \
-        r"jw" \
-        r"(?P<program_id>\d{5})"\
-        r"(?P<observation>\d{3})"\
-        r"(?P<visit>\d{3})"\
-        r"_(?P<visit_group>\d{2})"\
-        r"(?P<parallel_seq_id>\d{1})"\
-        r"(?P<activity>\w{2})"\
-        r"_(?P<exposure_id>\d+)"\
-        r"_(?P<detector>((?!_)[\w])+)"
-
-    # Stage 2c outlier detection filenames
-    # e.g. "jw94015002002_02108_00001_mirimage_o002_crf.fits"
-    stage_2c = \
-        r"jw" \
-        r"(?P<program_id>\d{5})" \
-        r"(?P<observation>\d{3})" \
-        r"(?P<visit>\d{3})" \
-        r"_(?P<visit_group>\d{2})" \
-        r"(?P<parallel_seq_id>\d{1})" \
-        r"(?P<activity>\w{2})" \
-        r"_(?P<exposure_id>\d+)" \
-        r"_(?P<detector>((?!_)[\w])+)"\
-        r"_(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"
-
-    # Stage 3 filenames with target ID
-    # e.g. "jw80600-o009_t001_miri_f1130w_i2d.fits"
-    stage_3_target_id = \
-        r"jw" \
-        r"(?P<program_id>\d{5})"\
-        r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
-        r"_(?P<target_id>(t)\d{3})"\
-        r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
-        r"_(?P<optical_elements>((?!_)[\w-])+)"
-
-    # Stage 3 filenames with source ID
-    # e.g. "jw80600-o009_s00001_miri_f1130w_i2d.fits"
-    stage_3_source_id = \
-        r"jw" \
-        r"(?P<program_id>\d{5})"\
-        r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
-        r"_(?P<source_id>(s)\d{5})"\
-        r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
-        r"_(?P<optical_elements>((?!_)[\w-])+)"
-
-    # Stage 3 filenames with target ID and epoch
-    # e.g. "jw80600-o009_t001-epoch1_miri_f1130w_i2d.fits"
-    stage_3_target_id_epoch = \
-        r"jw" \
-        r"(?P<program_id>\d{5})"\
-        r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
-        r"_(?P<target_id>(t)\d{3})"\
-        r"-epoch(?P<epoch>\d{1})"\
-        r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
-        r"_(?P<optical_elements>((?!_)[\w-])+)"
-
-    # Stage 3 filenames with source ID and epoch
-    # e.g. "jw80600-o009_s00001-epoch1_miri_f1130w_i2d.fits"
-    stage_3_source_id_epoch = \
-        r"jw" \
-        r"(?P<program_id>\d{5})"\
-        r"-(?P<ac_id>(o\d{3}|(c|a|r)\d{4}))"\
-        r"_(?P<source_id>(s)\d{5})"\
-        r"-epoch(?P<epoch>\d{1})"\
-        r"_(?P<instrument>(nircam|niriss|nirspec|miri|fgs))"\
-        r"_(?P<optical_elements>((?!_)[\w-])+)"
-
-    # Time series filenames
-    # e.g. "jw00733003001_02101_00002-seg001_nrs1_rate.fits"
-    time_series = \
-        r"jw" \
-        r"(?P<program_id>\d{5})"\
-        r"(?P<observation>\d{3})"\
-        r"(?P<visit>\d{3})"\
-        r"_(?P<visit_group>\d{2})"\
-        r"(?P<parallel_seq_id>\d{1})"\
-        r"(?P<activity>\w{2})"\
-        r"_(?P<exposure_id>\d+)"\
-        r"-seg(?P<segment>\d{3})"\
-        r"_(?P<detector>\w+)"
-
-    # Guider filenames
-    # e.g. "jw00729011001_gs-id_1_image_cal.fits" or
-    # "jw00799003001_gs-acq1_2019154181705_stream.fits"
-    guider = \
-        r"jw" \
-        r"(?P<program_id>\d{5})" \
-        r"(?P<observation>\d{3})" \
-        r"(?P<visit>\d{3})" \
-        r"_gs-(?P<guider_mode>(id|acq1|acq2|track|fg))" \
-        r"_((?P<date_time>\d{13})|(?P<guide_star_attempt_id>\d{1}))"
-
-    # Build list of filename types
-    filename_types = [
-        stage_1_and_2,
-        stage_2c,
-        stage_3_target_id,
-        stage_3_source_id,
-        stage_3_target_id_epoch,
-        stage_3_source_id_epoch,
-        time_series,
-        guider]
-
-    filename_type_names = [
-        'stage_1_and_2',
-        'stage_2c',
-        'stage_3_target_id',
-        'stage_3_source_id',
-        'stage_3_target_id_epoch',
-        'stage_3_source_id_epoch',
-        'time_series',
-        'guider'
-    ]
-
-    # Try to parse the filename
-    for filename_type, filename_type_name in zip(filename_types, filename_type_names):
-
-        # If full filename, try using suffix
-        if not file_root_name:
-            filename_type += r"_(?P<suffix>{}).*".format('|'.join(FILE_SUFFIX_TYPES))
-        # If not, make sure the provided regex matches the entire filename root
-        else:
-            filename_type += r"$"
-
-        elements = re.compile(filename_type)
-        jwst_file = elements.match(filename)
+    if file_root_name:
+        patterns = FILENAME_ROOT_PATTERNS
+    else:
+        patterns = FILENAME_PATTERNS
 
-        # Stop when you find a format that matches
+    # Stop when you find a format that matches.  The common stage 1
+    # and 2 format is tried first.
+    filename_dict = None
+    for filename_type_name, pattern in patterns:
+        jwst_file = pattern.match(filename)
         if jwst_file is not None:
-            name_match = filename_type_name
+            filename_dict = jwst_file.groupdict()
+            filename_dict['filename_type'] = filename_type_name
             break
 
-    try:
-        # Convert the regex match to a dictionary
-        filename_dict = jwst_file.groupdict()
-
-        # Add the filename type to that dict
-        filename_dict['filename_type'] = name_match
-
-        # Also, add the instrument if not already there
-        if 'instrument' not in filename_dict.keys():
-            if name_match == 'guider':
-                filename_dict['instrument'] = 'fgs'
-            elif 'detector' in filename_dict.keys():
-                filename_dict['instrument'] = JWST_INSTRUMENT_NAMES_SHORTHAND[
-                    filename_dict['detector'][:3]
-                ]
-
     # Raise error if unable to parse the filename
-    except AttributeError:
+    if filename_dict is None:
         jdox_url = 'https://jwst-docs.stsci.edu/display/JDAT/' \
                    'File+Naming+Conventions+and+Data+Products'
         raise ValueError('Provided file {} does not follow JWST naming conventions.  See {} for further information.'.format(filename, jdox_url))
 
+    # Also, add the instrument if not already there
+    if 'instrument' not in filename_dict.keys():
+        if filename_dict['filename_type'] == 'guider':
+            filename_dict['instrument'] = 'fgs'
+        elif 'detector' in filename_dict.keys():
+            filename_dict['instrument'] = JWST_INSTRUMENT_NAMES_SHORTHAND[
+                filename_dict['detector'][:3]
+            ]
+
     return filename_dict
 
 
+def filename_parser(filename):
+    """Return a dictionary that contains the properties of a given
+    JWST file (e.g. program ID, visit number, detector, etc.).
+
+    Parameters
+    ----------
+    filename : str
+        Path or name of JWST file to parse
+
+    Returns
+    -------
+    filename_dict : dict
+        Collection of file properties
+
+    Raises
+    ------
+    ValueError
+        When the provided file does not follow naming conventions
+    """
+
+    filename = os.path.basename(filename)
+
+    return dict(_parse_basename(filename))
+
+
+def filename_parser_batch(filenames):
+    """Parse many JWST filenames at once into a columnar result.
+
+    Parameters
+    ----------
+    filenames : iterable
+        Paths or names of JWST files to parse (e.g. a list or a
+        ``numpy`` array of strings)
+
+    Returns
+    -------
+    results : dict
+        Keys are the properties in ``FILENAME_PARSER_PROPERTIES`` plus
+        ``valid``.  Each value is a ``numpy`` array with one element
+        per filename.  Properties that do not apply to a file are
+        ``None``.  ``valid`` is a boolean array that is ``False`` for
+        files that do not follow naming conventions.
+    """
+
+    # Parse each distinct filename only once
+    indices = {}
+    codes = np.fromiter((indices.setdefault(os.path.basename(filename), len(indices))
+                         for filename in filenames), dtype=np.int64)
+    parsed = []
+    for filename in indices:
+        try:
+            parsed.append(_parse_basename(filename))
+        except (KeyError, ValueError):
+            parsed.append({})
+
+    # Build each column for the distinct filenames, then expand it to
+    # all of the filenames
+    results = {}
+    for prop in FILENAME_PARSER_PROPERTIES:
+        column = np.empty(len(parsed), dtype=object)
+        column[:] = [filename_dict.get(prop) for filename_dict in parsed]
+        results[prop] = column[codes]
+    valid = np.array([bool(filename_dict) for filename_dict in parsed], dtype=bool)
+    results['valid'] = valid[codes]
+
+    return results
+
+
 def filesystem_path(filename):
     """Return the full path to a given file in the filesystem
 
@@ -395,6 +467,89 @@ def get_config():
     return settings
 
 
+def group_exposures(filenames):
+    """Group together the files from the same exposure.  These files
+    share the same directory, ``program_id``, ``observation``,
+    ``visit``, ``visit_group``, ``parallel_seq_id``, ``activity``,
+    ``exposure_id``, and ``suffix``, and differ only in ``detector``.
+
+    The filenames are parsed together and placed in buckets keyed by
+    these properties in a single pass.  Only the detectors of one
+    NIRCam channel are combined: the shortwave (``NRC[AB][1-4]``) and
+    longwave (``NRC[AB]5``) detectors form separate groups, and the
+    files of other instruments each keep their own detector.  Stage 3
+    files, and files that do not follow the naming conventions, are
+    each placed in a group of their own.  Other types of files (e.g.
+    time series and guider files) are not grouped and are left out.
+
+    Parameters
+    ----------
+    filenames : list
+        Paths or names of the files
+
+    Returns
+    -------
+    grouped : list
+        Each element is a list of the files of one exposure.  Groups
+        are ordered by their first file, and the files within a group
+        are sorted.
+    """
+
+    filenames = sorted(filenames)
+    parsed = filename_parser_batch(filenames)
+    properties = EXPOSURE_PROPERTIES + ['detector', 'filename_type', 'valid']
+    parsed = {prop: parsed[prop].tolist() for prop in properties}
+
+    groups = OrderedDict()
+    for i, filename in enumerate(filenames):
+        filename_type = parsed['filename_type'][i]
+
+        # Stage 3 files and unrecognized files are treated individually
+        if not parsed['valid'][i] or 'stage_3' in filename_type:
+            key = filename
+
+        elif filename_type == 'stage_1_and_2':
+            detector = parsed['detector'][i].upper()
+            if detector in NIRCAM_SHORTWAVE_DETECTORS:
+                detector = 'NRC_SW'
+            elif detector in NIRCAM_LONGWAVE_DETECTORS:
+                detector = 'NRC_LW'
+            key = tuple([os.path.dirname(filename), detector] +
+                        [parsed[prop][i].lower() for prop in EXPOSURE_PROPERTIES])
+
+        else:
+            continue
+
+        groups.setdefault(key, []).append(filename)
+
+    return list(groups.values())
+
+
+def group_rootnames(filenames):
+    """Group files by their rootname (the filename without its suffix,
+    e.g. ``jw00327001001_02101_00002_nrca1``) in a single pass.
+
+    Parameters
+    ----------
+    filenames : list
+        Paths or names of the files
+
+    Returns
+    -------
+    grouped : collections.OrderedDict
+        Keys are rootnames, values are lists of the files with that
+        rootname, in the order in which they were given.  Rootnames
+        are ordered by their first file.
+    """
+
+    grouped = OrderedDict()
+    for filename in filenames:
+        rootname = '_'.join(os.path.basename(filename).split('_')[:-1])
+        grouped.setdefault(rootname, []).append(filename)
+
+    return grouped
+
+
 def initialize_instrument_monitor(module):
     """Configures a log file for the instrument monitor run and
     captures the start time of the monitor
@@ -420,6 +575,25 @@ def initialize_instrument_monitor(module):
     return start_time, log_file
 
 
+def limit_process_memory(max_memory):
+    """Limit the memory (address space) available to the current
+    process.  Intended as the initializer of ``multiprocessing`` pool
+    workers, so that a worker that exceeds the limit fails with a
+    ``MemoryError`` rather than exhausting the memory of the machine.
+
+    Parameters
+    ----------
+    max_memory : float
+        Maximum memory in GB.  If ``None``, the memory is not limited.
+    """
+
+    if max_memory is None:
+        return
+
+    limit = int(max_memory * 1024**3)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
 def update_monitor_table(module, start_time, log_file):
     """Update the ``monitor`` database table with information about
     the instrument monitor run
@@ -0,0 +1,458 @@
+#! /usr/bin/env python
+
+"""A task queue, kept in an SQLite database on a shared filesystem,
+that lets worker processes on several hosts divide up a batch of work
+without an external message broker.
+
+Each task has a unique key and a JSON-serializable payload.  A worker
+claims a task by taking a lease on it, which it must renew (with
+``heartbeat``) while the task is being processed.  Claims are made
+inside an exclusive (``BEGIN IMMEDIATE``) transaction, so no two
+workers can claim the same task.  If a worker dies, its lease expires
+and the task is claimed by another worker.  A task that fails, or
+whose lease expires, ``max_attempts`` times is marked as failed.
+Tasks with a higher priority are claimed first, so that urgent work
+(e.g. a preview image that a user is waiting for) need not wait for
+a large backlog.  Tasks can also be given members (e.g. the files that
+they process), through which they can be looked up and prioritized
+without knowing their keys.
+
+Authors
+-------
+
+    - agent
+
+Use
+---
+
+    This module can be imported as such:
+
+    ::
+
+        from jwql.utils.work_queue import WorkQueue
+        queue = WorkQueue('/path/to/queue.db')
+        queue.add({'task-1': {'files': ['a.fits', 'b.fits']}})
+
+        task = queue.claim(worker)
+        while task is not None:
+            task_id, key, payload = task
+            ...  # call queue.heartbeat(task_id, worker) periodically
+            queue.complete(task_id, worker, success=True)
+            task = queue.claim(worker)
+
+Notes
+-----
+
+    The database is used in SQLite's default rollback journal mode, as
+    write-ahead logging does not work on network filesystems.  Lease
+    expiration times are taken from the clocks of the worker hosts,
+    which are assumed to be synchronized to well within the lease
+    time.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+
+# Statuses that a task can have
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue():
+    """Class for a task queue kept in an SQLite database.
+
+    Attributes
+    ----------
+    lease_time : float
+        Number of seconds that a claim on a task lasts without a
+        heartbeat
+    max_attempts : int
+        Number of times a task is claimed before it is marked as failed
+    path : str
+        Path to the SQLite database
+
+    Methods
+    -------
+    add(tasks, priority, members)
+        Add tasks to the queue
+    claim(worker, min_priority)
+        Claim the next available task
+    complete(task_id, worker, success)
+        Release a claimed task, marking it as done or to be retried
+    counts()
+        Count the tasks with each status
+    heartbeat(task_id, worker)
+        Renew the lease on a claimed task
+    member_status(members)
+        Find the status of the tasks that members belong to
+    prioritize(members, priority)
+        Raise the priority of the unfinished tasks of members
+    status(keys)
+        Find the status of tasks
+    """
+
+    def __init__(self, path, lease_time=1800, max_attempts=3):
+        """Initialize the class, creating the database if necessary.
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite database
+        lease_time : float
+            Number of seconds that a claim on a task lasts without a
+            heartbeat
+        max_attempts : int
+            Number of times a task is claimed before it is marked as
+            failed
+        """
+
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.path = path
+
+        connection = self._connect()
+        connection.execute('''CREATE TABLE IF NOT EXISTS tasks (
+                              id INTEGER PRIMARY KEY,
+                              key TEXT UNIQUE NOT NULL,
+                              payload TEXT NOT NULL,
+                              status TEXT NOT NULL,
+                              worker TEXT,
+                              lease_expires REAL,
+                              attempts INTEGER NOT NULL DEFAULT 0,
+                              priority INTEGER NOT NULL DEFAULT 0)''')
+        connection.execute('CREATE INDEX IF NOT EXISTS tasks_status_idx ON tasks (status)')
+        connection.execute('''CREATE TABLE IF NOT EXISTS task_members (
+                              member TEXT NOT NULL,
+                              task_id INTEGER NOT NULL,
+                              PRIMARY KEY (member, task_id))''')
+        connection.close()
+
+    def _connect(self):
+        """Open a connection to the database in autocommit mode, so
+        that transactions are started explicitly.  A new connection is
+        used for every operation, so that a ``WorkQueue`` can be used
+        from several threads and from forked processes.
+
+        Returns
+        -------
+        connection : sqlite3.Connection
+            Connection to the database
+        """
+
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def add(self, tasks, priority=0, members=None):
+        """Add tasks to the queue.  Tasks that are already pending or
+        running are left as they are, other than being raised to
+        ``priority``.  Tasks that are done or have failed are reset to
+        pending with the new payload and priority.
+
+        Parameters
+        ----------
+        tasks : dict
+            Task payloads keyed by task key
+        priority : int
+            Priority of the tasks.  Tasks with higher priorities are
+            claimed first.
+        members : dict
+            Members of the tasks (e.g. the names of the files that they
+            process) as lists keyed by task key, through which the
+            tasks can be found with ``member_status`` and
+            ``prioritize``
+
+        Returns
+        -------
+        added : int
+            The number of tasks that were added or reset
+        """
+
+        connection = self._connect()
+        added = 0
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            for key, payload in tasks.items():
+                payload = json.dumps(payload)
+                cursor = connection.execute(
+                    '''UPDATE tasks SET payload = ?, status = ?, worker = NULL,
+                       lease_expires = NULL, attempts = 0, priority = ?
+                       WHERE key = ? AND status IN (?, ?)''',
+                    (payload, PENDING, priority, key, DONE, FAILED))
+                added += cursor.rowcount
+                connection.execute('''UPDATE tasks SET priority = ?
+                                      WHERE key = ? AND status IN (?, ?) AND priority < ?''',
+                                   (priority, key, PENDING, RUNNING, priority))
+                cursor = connection.execute('''INSERT OR IGNORE INTO tasks
+                                               (key, payload, status, priority)
+                                               VALUES (?, ?, ?, ?)''',
+                                            (key, payload, PENDING, priority))
+                added += cursor.rowcount
+                if members is not None and key in members:
+                    task_id = connection.execute('SELECT id FROM tasks WHERE key = ?',
+                                                 (key,)).fetchone()[0]
+                    connection.executemany('''INSERT OR IGNORE INTO task_members (member, task_id)
+                                              VALUES (?, ?)''',
+                                           [(member, task_id) for member in members[key]])
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+        return added
+
+    def claim(self, worker=None, min_priority=None):
+        """Claim the next available task, which is the oldest of the
+        highest priority tasks that are pending or whose leases have
+        expired.
+
+        Parameters
+        ----------
+        worker : str
+            Identifier of the worker claiming the task.  If ``None``,
+            the host name and process ID are used.
+        min_priority : int
+            If given, only tasks with at least this priority are
+            claimed
+
+        Returns
+        -------
+        task : tuple or None
+            The ID, key, and payload of the claimed task, or ``None``
+            if there are no tasks available
+        """
+
+        worker = worker or default_worker_name()
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            now = time.time()
+
+            # Tasks whose leases have run out of attempts have failed
+            connection.execute('''UPDATE tasks SET status = ? WHERE status = ? AND lease_expires < ?
+                                  AND attempts >= ?''', (FAILED, RUNNING, now, self.max_attempts))
+
+            query = '''SELECT id, key, payload FROM tasks
+                       WHERE (status = ? OR (status = ? AND lease_expires < ?))'''
+            parameters = [PENDING, RUNNING, now]
+            if min_priority is not None:
+                query += ' AND priority >= ?'
+                parameters.append(min_priority)
+            query += ' ORDER BY priority DESC, id LIMIT 1'
+            row = connection.execute(query, parameters).fetchone()
+            if row is not None:
+                connection.execute('''UPDATE tasks SET status = ?, worker = ?, lease_expires = ?,
+                                      attempts = attempts + 1 WHERE id = ?''',
+                                   (RUNNING, worker, now + self.lease_time, row[0]))
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+
+        return row[0], row[1], json.loads(row[2])
+
+    def complete(self, task_id, worker=None, success=True):
+        """Release a claimed task.  A successful task is marked as
+        done.  A failed task is returned to the queue, unless it has
+        run out of attempts, in which case it is marked as failed.
+
+        Parameters
+        ----------
+        task_id : int
+            ID of the task
+        worker : str
+            Identifier of the worker that claimed the task
+        success : bool
+            Whether the task was completed successfully
+
+        Returns
+        -------
+        released : bool
+            ``False`` if the worker no longer held the lease on the task
+            (e.g. because it expired and the task was claimed by
+            another worker)
+        """
+
+        worker = worker or default_worker_name()
+        connection = self._connect()
+        try:
+            if success:
+                cursor = connection.execute('''UPDATE tasks SET status = ?, lease_expires = NULL
+                                               WHERE id = ? AND worker = ? AND status = ?''',
+                                            (DONE, task_id, worker, RUNNING))
+            else:
+                cursor = connection.execute('''UPDATE tasks SET
+                                               status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                                               worker = NULL, lease_expires = NULL
+                                               WHERE id = ? AND worker = ? AND status = ?''',
+                                            (self.max_attempts, FAILED, PENDING, task_id, worker,
+                                             RUNNING))
+            released = cursor.rowcount == 1
+        finally:
+            connection.close()
+
+        return released
+
+    def counts(self):
+        """Count the tasks with each status.
+
+        Returns
+        -------
+        counts : dict
+            Number of tasks keyed by status
+        """
+
+        connection = self._connect()
+        try:
+            counts = {status: 0 for status in [PENDING, RUNNING, DONE, FAILED]}
+            rows = connection.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status')
+            counts.update(dict(rows.fetchall()))
+        finally:
+            connection.close()
+
+        return counts
+
+    def heartbeat(self, task_id, worker=None):
+        """Renew the lease on a claimed task.
+
+        Parameters
+        ----------
+        task_id : int
+            ID of the task
+        worker : str
+            Identifier of the worker that claimed the task
+
+        Returns
+        -------
+        held : bool
+            ``False`` if the worker no longer held the lease on the task
+        """
+
+        worker = worker or default_worker_name()
+        connection = self._connect()
+        try:
+            cursor = connection.execute('''UPDATE tasks SET lease_expires = ?
+                                           WHERE id = ? AND worker = ? AND status = ?''',
+                                        (time.time() + self.lease_time, task_id, worker, RUNNING))
+            held = cursor.rowcount == 1
+        finally:
+            connection.close()
+
+        return held
+
+    def member_status(self, members):
+        """Find the status of the tasks that members belong to.  A
+        member of several tasks takes the status of the most active of
+        them: running, then pending, then done, then failed.
+
+        Parameters
+        ----------
+        members : list
+            Members of the tasks (see ``add``)
+
+        Returns
+        -------
+        statuses : dict
+            Status of the tasks of each member that belongs to a task in
+            the queue, keyed by member
+        """
+
+        connection = self._connect()
+        try:
+            statuses = {}
+            for member in members:
+                found = {row[0] for row in connection.execute(
+                    '''SELECT tasks.status FROM task_members
+                       JOIN tasks ON tasks.id = task_members.task_id
+                       WHERE task_members.member = ?''', (member,))}
+                for status in [RUNNING, PENDING, DONE, FAILED]:
+                    if status in found:
+                        statuses[member] = status
+                        break
+        finally:
+            connection.close()
+
+        return statuses
+
+    def prioritize(self, members, priority):
+        """Raise the pending and running tasks that members belong to
+        to ``priority``.
+
+        Parameters
+        ----------
+        members : list
+            Members of the tasks (see ``add``)
+        priority : int
+            Priority to raise the tasks to
+
+        Returns
+        -------
+        raised : int
+            The number of tasks whose priority was raised
+        """
+
+        connection = self._connect()
+        try:
+            raised = 0
+            for member in members:
+                cursor = connection.execute(
+                    '''UPDATE tasks SET priority = ? WHERE status IN (?, ?) AND priority < ?
+                       AND id IN (SELECT task_id FROM task_members WHERE member = ?)''',
+                    (priority, PENDING, RUNNING, priority, member))
+                raised += cursor.rowcount
+        finally:
+            connection.close()
+
+        return raised
+
+    def status(self, keys):
+        """Find the status of tasks.
+
+        Parameters
+        ----------
+        keys : list
+            Keys of the tasks
+
+        Returns
+        -------
+        statuses : dict
+            Status of each task that is in the queue, keyed by task key
+        """
+
+        connection = self._connect()
+        try:
+            statuses = {}
+            for key in keys:
+                row = connection.execute('SELECT status FROM tasks WHERE key = ?',
+                                         (key,)).fetchone()
+                if row is not None:
+                    statuses[key] = row[0]
+        finally:
+            connection.close()
+
+        return statuses
+
+
+def default_worker_name():
+    """Return an identifier for the current process that is unique
+    across hosts.
+
+    Returns
+    -------
+    worker : str
+        The host name and process ID
+    """
+
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
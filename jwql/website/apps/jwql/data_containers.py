@@ -23,11 +23,11 @@ Use
 
 import copy
 import glob
+import multiprocessing
 import os
 import re
 import tempfile
 
-from astropy.io import fits
 from astropy.time import Time
 from astroquery.mast import Mast
 import numpy as np
@@ -37,9 +37,14 @@ from jwql.edb.engineering_database import get_mnemonic, get_mnemonic_info
 from jwql.instrument_monitors.miri_monitors.data_trending import dashboard as miri_dash
 from jwql.instrument_monitors.nirspec_monitors.data_trending import dashboard as nirspec_dash
 from jwql.jwql_monitors import monitor_cron_jobs
+from jwql.jwql_monitors.generate_preview_images import create_dummy_filename, enqueue_groups, \
+    render_requested_groups
+from jwql.jwql_monitors.generate_preview_images import LEASE_TIME, QUEUE_FILE, USER_PRIORITY
+from jwql.utils import file_catalog
+from jwql.utils import header_store
 from jwql.utils.constants import MONITORS
-from jwql.utils.preview_image import PreviewImage
-from jwql.utils.utils import get_config, filename_parser
+from jwql.utils.utils import get_config, filename_parser, group_exposures, group_rootnames
+from jwql.utils.work_queue import PENDING, RUNNING, WorkQueue
 from .forms import MnemonicSearchForm, MnemonicQueryForm, MnemonicExplorationForm
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -49,6 +54,11 @@ THUMBNAIL_FILESYSTEM = os.path.join(get_config()['jwql_dir'], 'thumbnails')
 PACKAGE_DIR = os.path.dirname(__location__.split('website')[0])
 REPO_DIR = os.path.split(PACKAGE_DIR)[0]
 
+# Local process that renders the preview images requested by users, and
+# the number of seconds it waits for further requests before stopping
+RENDER_PROCESS = None
+RENDER_PROCESS_LINGER = 60
+
 
 def data_trending():
     """Container for Miri datatrending dashboard and components
@@ -125,9 +135,7 @@ def get_all_proposals():
         filesystem
     """
 
-    proposals = glob.glob(os.path.join(FILESYSTEM_DIR, '*'))
-    proposals = [proposal.split('jw')[-1] for proposal in proposals]
-    proposals = [proposal for proposal in proposals if len(proposal) == 5]
+    proposals = file_catalog.get_all_proposals()
 
     return proposals
 
@@ -341,15 +349,10 @@ def get_filenames_by_instrument(instrument):
     # filepaths, filenames = DatabaseConnection('MAST', instrument=instrument).\
     #     get_files_for_instrument(instrument)
 
-    # Find all of the matching files in filesytem
+    # Find all of the matching files in the filesystem catalog
     # (TEMPORARY WHILE THE MAST STUFF IS BEING WORKED OUT)
-    instrument_match = {'FGS': 'guider',
-                        'MIRI': 'mir',
-                        'NIRCam': 'nrc',
-                        'NIRISS': 'nis',
-                        'NIRSpec': 'nrs'}
-    search_filepath = os.path.join(FILESYSTEM_DIR, '*', '*.fits')
-    filepaths = [f for f in glob.glob(search_filepath) if instrument_match[instrument] in f]
+    filepaths = [os.path.join(FILESYSTEM_DIR, filepath) for filepath in
+                 file_catalog.get_filenames_by_instrument(instrument)]
 
     return filepaths
 
@@ -369,9 +372,7 @@ def get_filenames_by_proposal(proposal):
         A list of filenames associated with the given ``proposal``.
     """
 
-    filenames = sorted(glob.glob(os.path.join(
-        FILESYSTEM_DIR, 'jw{}'.format(proposal), '*')))
-    filenames = [os.path.basename(filename) for filename in filenames]
+    filenames = file_catalog.get_filenames_by_proposal(proposal)
 
     return filenames
 
@@ -391,12 +392,7 @@ def get_filenames_by_rootname(rootname):
         A list of filenames associated with the given ``rootname``.
     """
 
-    proposal = rootname.split('_')[0].split('jw')[-1][0:5]
-    filenames = sorted(glob.glob(os.path.join(
-        FILESYSTEM_DIR,
-        'jw{}'.format(proposal),
-        '{}*'.format(rootname))))
-    filenames = [os.path.basename(filename) for filename in filenames]
+    filenames = file_catalog.get_filenames_by_rootname(rootname)
 
     return filenames
 
@@ -417,7 +413,7 @@ def get_header_info(file):
 
     dirname = file[:7]
     fits_filepath = os.path.join(FILESYSTEM_DIR, dirname, file)
-    header = fits.getheader(fits_filepath, ext=0).tostring(sep='\n')
+    header = header_store.get_header(fits_filepath).tostring(sep='\n')
 
     return header
 
@@ -426,6 +422,13 @@ def get_image_info(file_root, rewrite):
     """Build and return a dictionary containing information for a given
     ``file_root``.
 
+    Preview images that do not exist yet are not made here, but are
+    requested from the background renderer (see
+    ``start_render_process``), so that the page can be shown at once.
+    The files whose images are still being made are listed in
+    ``pending``, and their progress can be followed with
+    ``get_preview_status``.
+
     Parameters
     ----------
     file_root : str
@@ -446,13 +449,18 @@ def get_image_info(file_root, rewrite):
     image_info['all_jpegs'] = []
     image_info['suffixes'] = []
     image_info['num_ints'] = {}
+    image_info['tiled_images'] = {}
 
     preview_dir = os.path.join(get_config()['jwql_dir'], 'preview_images')
 
     # Find all of the matching files
     dirname = file_root[:7]
-    search_filepath = os.path.join(FILESYSTEM_DIR, dirname, file_root + '*.fits')
-    image_info['all_files'] = glob.glob(search_filepath)
+    image_info['all_files'] = [os.path.join(FILESYSTEM_DIR, dirname, filename) for filename in
+                               file_catalog.get_filenames_by_rootname(file_root)]
+
+    # Request the preview images that are missing (or are to be
+    # rewritten) from the background renderer
+    image_info['pending'] = request_preview_images(image_info['all_files'], rewrite)[0]
 
     for file in image_info['all_files']:
 
@@ -465,19 +473,6 @@ def get_image_info(file_root, rewrite):
         jpg_filename = os.path.basename(os.path.splitext(file)[0] + '_integ0.jpg')
         jpg_filepath = os.path.join(jpg_dir, jpg_filename)
 
-        # Check that a jpg does not already exist. If it does (and rewrite=False),
-        # just call the existing jpg file
-        if os.path.exists(jpg_filepath) and not rewrite:
-            pass
-
-        # If it doesn't, make it using the preview_image module
-        else:
-            if not os.path.exists(jpg_dir):
-                os.makedirs(jpg_dir)
-            im = PreviewImage(file, 'SCI')
-            im.output_directory = jpg_dir
-            im.make_image()
-
         # Record how many integrations there are per filetype
         search_jpgs = os.path.join(preview_dir, dirname, file_root + '_{}_integ*.jpg'.format(suffix))
         num_jpgs = len(glob.glob(search_jpgs))
@@ -485,6 +480,21 @@ def get_image_info(file_root, rewrite):
 
         image_info['all_jpegs'].append(jpg_filepath)
 
+    # Find the images that can be viewed through a tile pyramid: those
+    # of the mosaics that the files are part of, which are named after
+    # the exposure rather than the detector, and those of the files
+    # themselves (e.g. stage 3 products), which take precedence.  They
+    # are keyed by the suffix and integration that they show (e.g.
+    # ``cal_integ0``).
+    mosaic_roots = set([os.path.splitext(mosaic)[0].rsplit('_', 1)[0]
+                        for mosaic in get_mosaic_filenames(file_root)])
+    for tiled_root in sorted(mosaic_roots) + [file_root]:
+        search_dzis = os.path.join(preview_dir, dirname, tiled_root + '_*.dzi')
+        for dzi in sorted(glob.glob(search_dzis)):
+            dzi_filename = os.path.basename(dzi)
+            key = dzi_filename[len(tiled_root) + 1:-len('.dzi')]
+            image_info['tiled_images'][key] = dzi_filename
+
     return image_info
 
 
@@ -512,6 +522,41 @@ def get_instrument_proposals(instrument):
     return proposals
 
 
+def get_mosaic_filenames(file_root):
+    """Return the names given to the mosaics of the exposure groups
+    that the files of the given ``file_root`` are part of (see
+    ``generate_preview_images.create_dummy_filename``), e.g.
+    ``jw93065002001_02101_00001_NRC_SWB_MOSAIC_cal.fits`` for
+    ``jw93065002001_02101_00001_nrcb2``.
+
+    Parameters
+    ----------
+    file_root : str
+        The rootname of the file of interest.
+
+    Returns
+    -------
+    mosaic_filenames : list
+        The names of the mosaics, which is empty if the files are not
+        part of a mosaic.
+    """
+
+    exposure_root = '_'.join(file_root.split('_')[:-1])
+    if not exposure_root:
+        return []
+
+    # The files of every detector used in the exposure are grouped as
+    # they are when the preview images are made
+    exposure_files = file_catalog.get_filenames_by_rootname('{}_'.format(exposure_root))
+    mosaic_filenames = []
+    for group in group_exposures(exposure_files):
+        if len(group) > 1 and any(filename.startswith('{}_'.format(file_root))
+                                  for filename in group):
+            mosaic_filenames.append(create_dummy_filename(group))
+
+    return mosaic_filenames
+
+
 def get_preview_images_by_instrument(inst):
     """Return a list of preview images available in the filesystem for
     the given instrument.
@@ -600,6 +645,35 @@ def get_preview_images_by_rootname(rootname):
     return preview_images
 
 
+def get_preview_status(file_root):
+    """Find the files of the given ``file_root`` whose preview images
+    are still being made by the background renderer, and those for
+    which the renderer did not manage to make them.
+
+    Parameters
+    ----------
+    file_root : str
+        The rootname of the file of interest.
+
+    Returns
+    -------
+    status : dict
+        The files whose preview images are ``pending``, and those for
+        which making them has ``failed``
+    """
+
+    dirname = file_root[:7]
+    files = [os.path.join(FILESYSTEM_DIR, dirname, filename) for filename in
+             file_catalog.get_filenames_by_rootname(file_root)]
+    pending, failed = request_preview_images(files, retry=False)
+
+    status = {}
+    status['pending'] = sorted(pending)
+    status['failed'] = sorted(failed)
+
+    return status
+
+
 def get_proposal_info(filepaths):
     """Builds and returns a dictionary containing various information
     about the proposal(s) that correspond to the given ``filepaths``.
@@ -621,6 +695,7 @@ def get_proposal_info(filepaths):
     """
 
     proposals = list(set([f.split('/')[-1][2:7] for f in filepaths]))
+    file_counts = file_catalog.get_file_counts_by_proposal(proposals)
     thumbnail_dir = os.path.join(get_config()['jwql_dir'], 'thumbnails')
     thumbnail_paths = []
     num_files = []
@@ -631,9 +706,7 @@ def get_proposal_info(filepaths):
             thumbnail = thumbnail[0]
             thumbnail = '/'.join(thumbnail.split('/')[-2:])
         thumbnail_paths.append(thumbnail)
-
-        fits_search_filepath = os.path.join(FILESYSTEM_DIR, 'jw{}'.format(proposal), 'jw{}*.fits'.format(proposal))
-        num_files.append(len(glob.glob(fits_search_filepath)))
+        num_files.append(file_counts[proposal])
 
     # Put the various information into a dictionary of results
     proposal_info = {}
@@ -732,6 +805,92 @@ def get_thumbnails_by_rootname(rootname):
     return thumbnails
 
 
+def request_preview_images(files, rewrite=False, retry=True):
+    """Request the preview images of the given ``files`` that do not
+    exist yet from the background renderer, ahead of the bulk backlog.
+
+    Files that are already part of a task in the queue, including the
+    exposure groups queued in bulk (see
+    ``generate_preview_images.enqueue_groups``), are not requested
+    again, but their tasks are raised to the priority of user requests.
+    As the tasks of exposure groups only make the preview images of
+    their mosaics, the files of an exposure group that has been
+    processed are then requested on their own.
+
+    Parameters
+    ----------
+    files : list
+        The full paths of the files of interest.
+    rewrite : bool
+        ``True`` if existing preview images are to be rewritten.
+    retry : bool
+        ``True`` if the files whose own tasks are done or have failed
+        without making a preview image are requested again, ``False``
+        if they are reported as ``failed``.
+
+    Returns
+    -------
+    pending : list
+        The names of the files whose preview images are being made
+    failed : list
+        The names of the files whose preview images could not be made
+    """
+
+    preview_dir = os.path.join(get_config()['jwql_dir'], 'preview_images')
+    queue = WorkQueue(QUEUE_FILE, lease_time=LEASE_TIME)
+    filenames = [os.path.basename(file) for file in files]
+    member_statuses = queue.member_status(filenames)
+    statuses = queue.status(filenames)
+
+    pending = []
+    failed = []
+    requests = []
+    for file, filename in zip(files, filenames):
+        jpg_filename = '{}_integ0.jpg'.format(os.path.splitext(filename)[0])
+        if os.path.exists(os.path.join(preview_dir, filename[:7], jpg_filename)) and not rewrite:
+            continue
+
+        # Wait for files that are already on the way, otherwise request
+        # them, unless they have been tried already
+        if member_statuses.get(filename, statuses.get(filename)) in [PENDING, RUNNING]:
+            pending.append(filename)
+        elif filename in statuses and not retry and not rewrite:
+            failed.append(filename)
+        else:
+            requests.append(file)
+            pending.append(filename)
+
+    if requests:
+        file_mtimes = {file: os.path.getmtime(file) for file in requests}
+        enqueue_groups(queue, [([file], rewrite) for file in requests], file_mtimes,
+                       priority=USER_PRIORITY)
+    if pending:
+        queue.prioritize(pending, USER_PRIORITY)
+        start_render_process()
+
+    return pending, failed
+
+
+def start_render_process():
+    """Start the local process that renders the preview images
+    requested by users, unless it is already running.  The process
+    stops once no requests have come in for ``RENDER_PROCESS_LINGER``
+    seconds.
+
+    The process is started afresh rather than forked, so that it
+    does not share the database connections of the web app.
+    """
+
+    global RENDER_PROCESS
+
+    if RENDER_PROCESS is None or not RENDER_PROCESS.is_alive():
+        context = multiprocessing.get_context('spawn')
+        RENDER_PROCESS = context.Process(target=render_requested_groups,
+                                         args=(RENDER_PROCESS_LINGER,),
+                                         name='render_requested_groups')
+        RENDER_PROCESS.start()
+
+
 def thumbnails(inst, proposal=None):
     """Generate a page showing thumbnail images corresponding to
     activities, from a given ``proposal``
@@ -759,29 +918,30 @@ def thumbnails(inst, proposal=None):
         page_type = 'unlooked'
     filepaths = split_files(filepaths, page_type)
 
-    # Determine file ID (everything except suffix)
+    # Group the files by file ID (everything except suffix)
     # e.g. jw00327001001_02101_00002_nrca1
-    full_ids = set(['_'.join(f.split('/')[-1].split('_')[:-1]) for f in filepaths])
+    grouped_files = group_rootnames(filepaths)
 
     # If the proposal is specified (i.e. if the page being loaded is
     # an archive page), only collect data for given proposal
+    full_ids = list(grouped_files)
     if proposal is not None:
         full_ids = [f for f in full_ids if f[2:7] == proposal]
 
     detectors = []
     proposals = []
-    for i, file_id in enumerate(full_ids):
-        for file in filepaths:
-            if '_'.join(file.split('/')[-1].split('_')[:-1]) == file_id:
-
-                # Parse filename to get program_id
-                try:
-                    program_id = filename_parser(file)['program_id']
-                    detector = filename_parser(file)['detector']
-                except ValueError:
-                    # Temporary workaround for noncompliant files in filesystem
-                    program_id = nfile_id[2:7]
-                    detector = file_id[26:]
+    for file_id in full_ids:
+
+        # Parse filename to get program_id
+        file = grouped_files[file_id][-1]
+        try:
+            filename_dict = filename_parser(file)
+            program_id = filename_dict['program_id']
+            detector = filename_dict['detector']
+        except ValueError:
+            # Temporary workaround for noncompliant files in filesystem
+            program_id = file_id[2:7]
+            detector = file_id[26:]
 
         # Add parameters to sort by
         if detector not in detectors and not detector.startswith('f'):
@@ -826,8 +986,9 @@ def thumbnails_ajax(inst, proposal=None):
     # Get the available files for the instrument
     filepaths = get_filenames_by_instrument(inst)
 
-    # Get set of unique rootnames
-    rootnames = set(['_'.join(f.split('/')[-1].split('_')[:-1]) for f in filepaths])
+    # Group the files by rootname
+    grouped_files = group_rootnames(filepaths)
+    rootnames = list(grouped_files)
 
     # If the proposal is specified (i.e. if the page being loaded is
     # an archive page), only collect data for given proposal
@@ -857,7 +1018,8 @@ def thumbnails_ajax(inst, proposal=None):
                              'visit_group': file_id[14:16]}
 
         # Get list of available filenames
-        available_files = get_filenames_by_rootname(rootname)
+        available_files = sorted([os.path.basename(filename)
+                                  for filename in grouped_files[rootname]])
 
         # Add data to dictionary
         data_dict['file_data'][rootname] = {}
@@ -40,7 +40,6 @@ Dependencies
     placed in the ``jwql/utils/`` directory.
 
 """
-import glob
 import os
 
 from astropy.time import Time, TimeDelta
@@ -48,6 +47,7 @@ from django import forms
 from django.shortcuts import redirect
 
 from jwql.edb.edb_interface import is_valid_mnemonic
+from jwql.utils import file_catalog
 from jwql.utils.constants import JWST_INSTRUMENT_NAMES_SHORTHAND
 from jwql.utils.utils import get_config, filename_parser
 
@@ -94,15 +94,9 @@ class FileSearchForm(forms.Form):
         if self.search_type == 'proposal':
             # See if there are any matching proposals and, if so, what
             # instrument they are for
-            search_string = os.path.join(FILESYSTEM_DIR, 'jw{}'.format(search),
-                                         '*{}*.fits'.format(search))
-            all_files = glob.glob(search_string)
-            if len(all_files) > 0:
-                all_instruments = []
-                for file in all_files:
-                    instrument = filename_parser(file)['instrument']
-                    all_instruments.append(instrument)
-                if len(set(all_instruments)) > 1:
+            all_instruments = file_catalog.get_instruments_by_proposal(search)
+            if len(all_instruments) > 0:
+                if len(all_instruments) > 1:
                     raise forms.ValidationError('Cannot return result for proposal with multiple '
                                                 'instruments.')
 
@@ -114,8 +108,7 @@ class FileSearchForm(forms.Form):
         elif self.search_type == 'fileroot':
             # See if there are any matching fileroots and, if so, what
             # instrument they are for
-            search_string = os.path.join(FILESYSTEM_DIR, search[:7], '{}*.fits'.format(search))
-            all_files = glob.glob(search_string)
+            all_files = file_catalog.get_filenames_by_rootname(search)
 
             if len(all_files) == 0:
                 raise forms.ValidationError('Fileroot {} not in the filesystem.'.format(search))
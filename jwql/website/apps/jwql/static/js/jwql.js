@@ -33,10 +33,8 @@ function change_filetype(type, file_root, num_ints, inst) {
     document.getElementById("detector").innerHTML = file_root.split('_')[3];
 
     // Show the appropriate image
-    var img = document.getElementById("image_viewer")
     var jpg_filepath = '/static/preview_images/' + file_root.slice(0,7) + '/' + file_root + '_' + type + '_integ0.jpg';
-    img.src = jpg_filepath;
-    img.alt = jpg_filepath;
+    show_preview(jpg_filepath);
 
     // Update the number of integrations
     var int_counter = document.getElementById("int_count");
@@ -107,9 +105,7 @@ function change_int(direction, file_root, num_ints) {
     document.getElementById("jpg_filename").innerHTML = jpg_filename;
 
     // Show the appropriate image
-    var img = document.getElementById("image_viewer")
-    img.src = jpg_filepath;
-    img.alt = jpg_filepath;
+    show_preview(jpg_filepath);
 
     // Update the number of integrations
     var int_counter = document.getElementById("int_count");
@@ -266,6 +262,46 @@ function show_only(filter_type, value, dropdown_keys, num_fileids) {
 };
 
 
+/**
+ * Show a preview image, using the zoomable viewer if the image, or the
+ * mosaic that it is part of, has a tile pyramid, so that only the visible
+ * tiles are fetched
+ * @param {String} jpg_filepath - The path to the JPEG preview image
+ */
+function show_preview(jpg_filepath) {
+
+    var img = document.getElementById("image_viewer");
+    var tile_viewer = document.getElementById("tile_viewer");
+
+    // The tile pyramids are keyed by the suffix and integration that they
+    // show (e.g. "cal_integ0"), and kept in the directory of the JPEGs
+    var key = jpg_filepath.match(/_([^_\/]+_integ\d+)\.jpg$/);
+    var dzi_filepath = null;
+    if (key !== null && typeof tiled_images !== 'undefined' && key[1] in tiled_images) {
+        dzi_filepath = jpg_filepath.slice(0, jpg_filepath.lastIndexOf('/') + 1) + tiled_images[key[1]];
+    }
+
+    if (typeof OpenSeadragon !== 'undefined' && dzi_filepath !== null) {
+        img.style.display = 'none';
+        tile_viewer.style.display = 'block';
+        if (typeof tile_viewer.viewer === 'undefined') {
+            tile_viewer.viewer = OpenSeadragon({
+                id: 'tile_viewer',
+                prefixUrl: 'https://cdnjs.cloudflare.com/ajax/libs/openseadragon/2.4.2/images/',
+                tileSources: dzi_filepath
+            });
+        } else {
+            tile_viewer.viewer.open(dzi_filepath);
+        }
+    } else {
+        tile_viewer.style.display = 'none';
+        img.style.display = 'inline';
+        img.src = jpg_filepath;
+        img.alt = jpg_filepath;
+    }
+};
+
+
 /**
  * Sort thumbnail display by proposal number
  * @param {String} sort_type - The sort type (e.g. "asc", "desc")
@@ -482,3 +518,26 @@ function version_url(version_string) {
     a_line += '">JWQL v' + version_string + '</a>';
     return a_line;
 };
+
+/**
+ * Wait for the preview images that are being made for the displayed file,
+ * and reload the page once they are ready, or report the files whose
+ * preview images could not be made
+ * @param {String} inst - The instrument for the given file
+ * @param {String} file_root - The rootname of the file
+ * @param {String} base_url - The base URL for gathering data from the AJAX view.
+ */
+function wait_for_previews(inst, file_root, base_url) {
+    $.ajax({
+        url: base_url + '/ajax/' + inst + '/' + file_root + '/preview_status/',
+        success: function(data){
+            if (data.pending.length > 0) {
+                setTimeout(function() {wait_for_previews(inst, file_root, base_url);}, 2000);
+            } else if (data.failed.length > 0) {
+                document.getElementById('render_status').innerHTML = 'Preview images could not be made for ' +
+                    data.failed.join(', ') + '. Reload the page to try again.';
+            } else {
+                location.reload();
+            }
+        }});
+};
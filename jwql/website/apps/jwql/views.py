@@ -45,6 +45,7 @@ from .data_containers import get_dashboard_components
 from .data_containers import get_filenames_by_instrument
 from .data_containers import get_header_info
 from .data_containers import get_image_info
+from .data_containers import get_preview_status
 from .data_containers import get_proposal_info
 from .data_containers import thumbnails
 from .data_containers import thumbnails_ajax
@@ -376,6 +377,31 @@ def instrument(request, inst):
     return render(request, template, context)
 
 
+@auth_required
+def preview_status_ajax(request, user, inst, file_root):
+    """Report which of the preview images of a given ``file_root`` are
+    still being made, so that the image view page can wait for them
+
+    Parameters
+    ----------
+    request : HttpRequest object
+        Incoming request from the webpage
+    inst : str
+        Name of JWST instrument
+    file_root : str
+        The rootname of the file of interest
+
+    Returns
+    -------
+    JsonResponse object
+        Outgoing response sent to the webpage
+    """
+
+    data = get_preview_status(file_root)
+
+    return JsonResponse(data, json_dumps_params={'indent': 2})
+
+
 def unlooked_images(request, inst):
     """Generate the page listing all unlooked images in the database
 
@@ -457,6 +483,9 @@ def view_image(request, user, inst, file_root, rewrite=False):
                'jpg_files': image_info['all_jpegs'],
                'fits_files': image_info['all_files'],
                'suffixes': image_info['suffixes'],
-               'num_ints': image_info['num_ints']}
+               'num_ints': image_info['num_ints'],
+               'tiled_images': image_info['tiled_images'],
+               'pending': image_info['pending'],
+               'base_url': get_base_url()}
 
     return render(request, template, context)
@@ -19,6 +19,7 @@ REQUIRES = [
     'numpy',
     'numpydoc',
     'pandas',
+    'pillow',
     'psycopg2',
     'pysiaf',
     'pytest',